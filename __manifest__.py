@@ -1,6 +1,6 @@
 {
     'name': 'POS Caisse - Sumni v2',
-    'version': '15.0.1.1.0',
+    'version': '15.0.1.3.0',
     'summary': 'Gestion de caisse, commandes, sessions, mouvements de caisse avec API REST pour application mobile',
     'description': '''
         Module de gestion de caisse pour POS Sumni v2:
@@ -22,6 +22,7 @@
         'security/pos_caisse_security.xml',
         'security/ir.model.access.csv',
         'data/pos_caisse_data.xml',
+        'data/pos_caisse_cron.xml',
         'views/pos_caisse_views.xml',
         'views/pos_caisse_menu.xml',
         'reports/rapport_vente_template.xml',  # Template de rapport
@@ -1,13 +1,293 @@
+import base64
+import csv
+import functools
+import gzip
+import hashlib
+import io
+import json
 import logging
-from odoo import http
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+from odoo import fields, http
 from odoo.http import request, Response
+from odoo.tools import date_utils
+from odoo.addons.pos_caisse.models.pos_caisse_metrique import BORNES_DUREE, BORNES_LOT, collecteur
+
+# Nombre maximal de commandes acceptées par appel à /api/pos_caisse/commandes/batch
+MAX_COMMANDES_BATCH = 500
+# Nombre maximal de clés comparées par appel à /api/pos_caisse/sync/reconcile
+MAX_COMMANDES_RAPPROCHEMENT = 20000
+
+
+# Nombre de lignes lues par FETCH lors des exports en flux
+TAILLE_PAQUET_EXPORT = 2000
+
+
+# Colonnes renvoyées par défaut par /api/pos_caisse/commandes/list
+# (colonnes disponibles: pos.caisse.commande._COLONNES_LISTE)
+CHAMPS_LISTE_DEFAUT = (
+    'id', 'name', 'date', 'client_card', 'client_name', 'client_nom', 'type_paiement', 'total',
+    'state', 'is_vc', 'session_id', 'session_name', 'user_id', 'user_name',
+)
+
+# Colonnes des sessions renvoyées par /api/pos_caisse/sessions
+COLONNES_SESSION = (
+    'id', 'name', 'date', 'date_cloture', 'state', 'total_commandes', 'total_montant',
+    'total_mouvements', 'montant_en_caisse', 'montant_sortie', 'total_bp',
+)
+
+# Format en colonnes ("format": "colonnes"): codes courts des valeurs de sélection, par liste
+CODES_COLONNES = {
+    'sessions': {
+        'state': {'ouvert': 'O', 'ferme': 'F'},
+    },
+    'commandes': {
+        'state': {'draft': 'D', 'confirme': 'C', 'en_attente_livraison': 'A', 'livre': 'L', 'annule': 'X'},
+        'type_paiement': {'cash': 'C', 'bp': 'B'},
+        'paiement_state': {'non_payee': 'N', 'payee': 'P'},
+    },
+}
+
+# Taille minimale (octets) d'une réponse compacte pour la compresser
+TAILLE_MIN_COMPRESSION = 1024
+
+
+def _encode_cursor(date, record_id):
+    return base64.urlsafe_b64encode(f"{date.isoformat()}|{record_id}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    date, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return fields.Datetime.to_string(datetime.fromisoformat(date)), int(record_id)
+
+
+def _en_colonnes(colonnes, lignes, codes=None):
+    """Format compact: en-tête de colonnes unique, lignes en tableaux, sélections codées.
+
+    Retour: {colonnes, lignes, codes} où `codes` donne, par colonne codée, {valeur: code}.
+    """
+    codes = {c: codes[c] for c in colonnes if codes and c in codes}
+    positions = [(i, codes[c]) for i, c in enumerate(colonnes) if c in codes]
+    lignes = [list(ligne) for ligne in lignes]
+    for ligne in lignes:
+        for i, table in positions:
+            ligne[i] = table.get(ligne[i], ligne[i])
+    return {'colonnes': list(colonnes), 'lignes': lignes, 'codes': codes}
+
+
+def _reponse_compressee(donnees, status=200, headers=None):
+    """Réponse JSON sans espaces, compressée en gzip ou deflate selon Accept-Encoding"""
+    corps = json.dumps(donnees, separators=(',', ':'), default=date_utils.json_default).encode()
+    headers = [('Content-Type', 'application/json; charset=utf-8'), ('Vary', 'Accept-Encoding')] + list(headers or [])
+    if len(corps) >= TAILLE_MIN_COMPRESSION:
+        acceptes = request.httprequest.accept_encodings
+        if acceptes.quality('gzip') > 0:
+            corps = gzip.compress(corps, compresslevel=6)
+            headers.append(('Content-Encoding', 'gzip'))
+        elif acceptes.quality('deflate') > 0:
+            corps = zlib.compress(corps, 6)
+            headers.append(('Content-Encoding', 'deflate'))
+    return Response(corps, status=status, headers=headers)
+
+
+def _etag_correspond(if_none_match, etag):
+    """Comparaison faible d'If-None-Match (RFC 7232): liste d'etags séparés par des virgules,
+    préfixe W/ et guillemets ignorés, « * » correspond à tout"""
+    if not if_none_match:
+        return False
+    valeur = etag[2:] if etag.startswith('W/') else etag
+    for candidat in if_none_match.split(','):
+        candidat = candidat.strip()
+        if candidat == '*':
+            return True
+        if candidat.startswith('W/'):
+            candidat = candidat[2:]
+        if candidat.strip('"') == valeur.strip('"'):
+            return True
+    return False
+
+
+def _get_idempotency_key(params):
+    return params.get('idempotency_key') or request.httprequest.headers.get('Idempotency-Key')
+
+
+def _get_appareil_identifiant(params):
+    return params.get('appareil') or request.httprequest.headers.get('X-Device-Id')
+
+
+def _classe_erreur(message):
+    """Regrouper les messages d'erreur en classes (nombres et valeurs après ':' retirés)"""
+    return re.sub(r'\d+', 'N', str(message or '').split(':')[0]).strip()[:60] or 'inconnue'
+
+
+def instrumente(route):
+    """Mesurer une route de l'API: durée, nombre et temps des requêtes SQL, erreurs.
+
+    Les mesures sont exposées par /api/pos_caisse/metrics.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, **kwargs):
+            thread = threading.current_thread()
+            requetes, temps_sql = getattr(thread, 'query_count', 0), getattr(thread, 'query_time', 0.0)
+            debut = time.perf_counter()
+            db = request.db
+            try:
+                result = method(self, **kwargs)
+            except Exception as e:
+                collecteur.incrementer(db, 'pos_caisse_api_errors_total', route=route, classe=type(e).__name__)
+                raise
+            finally:
+                collecteur.observer(db, 'pos_caisse_api_request_duration_seconds', time.perf_counter() - debut, BORNES_DUREE, route=route)
+                collecteur.incrementer(db, 'pos_caisse_api_sql_queries_total', getattr(thread, 'query_count', 0) - requetes, route=route)
+                collecteur.incrementer(db, 'pos_caisse_api_sql_seconds_total', getattr(thread, 'query_time', 0.0) - temps_sql, route=route)
+            if isinstance(result, dict) and result.get('status') == 'error':
+                collecteur.incrementer(db, 'pos_caisse_api_errors_total', route=route, classe=_classe_erreur(result.get('message')))
+            collecteur.envoyer(db)
+            return result
+        return wrapper
+    return decorator
+
+
+def idempotent(endpoint, condition=None):
+    """Rejouer la réponse enregistrée quand une route d'écriture reçoit une clé déjà traitée.
+
+    La clé est lue dans `idempotency_key` (corps JSON) ou l'en-tête `Idempotency-Key`.
+    Seules les réponses en succès sont conservées; une erreur libère la clé pour un nouvel essai.
+    `condition(params)` permet de limiter la protection à certaines actions de la route.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, **kwargs):
+            params = request.jsonrequest or kwargs or {}
+            cle = _get_idempotency_key(params)
+            if not cle or (condition and not condition(params)):
+                return method(self, **kwargs)
+            Store = request.env['pos.caisse.idempotence'].sudo()
+            connues = Store._reserver(endpoint, [cle])
+            if cle in connues:
+                if connues[cle] is not None:
+                    logging.info("Rejeu de la réponse %s pour la clé d'idempotence %s", endpoint, cle)
+                    return connues[cle]
+                return {'status': 'error', 'message': "Requête déjà en cours de traitement pour cette clé."}
+            result = method(self, **kwargs)
+            try:
+                if isinstance(result, dict) and result.get('status') == 'success':
+                    Store._enregistrer(endpoint, {cle: result})
+                else:
+                    Store._liberer(endpoint, [cle])
+            except Exception:
+                # Transaction déjà en échec: la réservation sera annulée avec elle
+                logging.warning("Impossible de mettre à jour la clé d'idempotence %s", cle, exc_info=True)
+            return result
+        return wrapper
+    return decorator
+
 
 class PosCaisseApi(http.Controller):
     def _is_admin(self):
         user = request.env.user
         # Consider system admin or caisse manager as admin for this API
         return user.has_group('base.group_system') or user.has_group('pos_caisse.group_pos_caisse_manager') or user.id == 1
+
+    def _resoudre_session(self, env, session_id, uid):
+        """Retourne (session, message_erreur) pour l'id fourni ou la session ouverte de l'utilisateur."""
+        Session = env['pos.caisse.session'].sudo()
+        if session_id:
+            session = Session.browse(int(session_id))
+            if not session or not session.exists():
+                return None, "Session introuvable."
+            return session, None
+        session = Session.search([
+            ('user_id', '=', uid), ('state', '=', 'ouvert')
+        ], order='date desc', limit=1)
+        if not session:
+            return None, "Aucune session ouverte pour l'utilisateur."
+        return session, None
+
+    def _valider_noms(self, env, params, noms):
+        """Vérifier les numéros pré-attribués `noms` contre les blocs de l'appareil appelant.
+
+        Retour: ({nom: message_erreur}, message_erreur_global)
+        """
+        if not noms:
+            return {}, None
+        identifiant = _get_appareil_identifiant(params)
+        if not identifiant:
+            return {}, "Numéro pré-attribué sans identifiant d'appareil (appareil ou en-tête X-Device-Id)."
+        appareil = env['pos.caisse.appareil'].sudo().search([('identifiant', '=', identifiant)], limit=1)
+        if not appareil or appareil.user_id.id != request.uid:
+            return {}, "Appareil inconnu pour cet utilisateur."
+        return appareil._valider_noms(noms), None
+
+    def _preparer_commande(self, params, session, vendeurs):
+        """Valide une commande reçue de l'API et construit ses valeurs de création.
+
+        `vendeurs` est un dict {carte_numero: (id, nom)} déjà résolu par l'appelant.
+        Retour: (vals, message_erreur)
+        """
+        lignes = params.get('lignes') or []
+        type_paiement = params.get('type_paiement') or 'cash'
+        is_vc = bool(params.get('vc') or params.get('is_vc'))
+
+        if not lignes:
+            return None, "Aucune ligne fournie."
+        if type_paiement not in ('cash', 'bp'):
+            return None, "type_paiement invalide (cash|bp)."
+
+        # Vendeur/Client
+        client_card = params.get('client_card') or False
+        client_name = params.get('client_name') or False
+        vendeur_id = False
+        vendeur = vendeurs.get(client_card) if client_card else None
+        if vendeur:
+            vendeur_id = vendeur[0]
+            # si nom non fourni, reprendre celui du vendeur
+            client_name = client_name or vendeur[1]
+
+        # Lignes préparées
+        line_vals = []
+        for l in lignes:
+            tp = l.get('type_pain_id')
+            qte = l.get('quantite')
+            if not tp or not qte or int(qte) <= 0:
+                return None, "Chaque ligne doit avoir type_pain_id et quantite>0."
+            line_vals.append((0, 0, {
+                'type_pain_id': int(tp),
+                'quantite': int(qte),
+            }))
+
+        vals = {
+            'session_id': session.id,
+            'vendeur_id': vendeur_id or False,
+            'client_card': client_card,
+            'client_name': client_name,
+            'type_paiement': type_paiement,
+            'is_vc': is_vc,
+            'line_ids': line_vals,
+            'idempotency_key': params.get('idempotency_key'),
+        }
+        if params.get('name'):
+            # Numéro pré-attribué par l'appareil (validé par l'appelant)
+            vals['name'] = params['name']
+        return vals, None
+
+    def _commande_data(self, commande):
+        return {
+            'id': commande.id,
+            'name': commande.name,
+            'state': commande.state,
+            'total': commande.total,
+            'is_vc': commande.is_vc,
+            'mouvement_id': commande.mouvement_id.id or None,
+        }
+
     @http.route('/api/pos_caisse/commandes', type='json', auth='user', methods=['GET', 'POST'], csrf=False)
+    @instrumente('/api/pos_caisse/commandes')
+    @idempotent('commande')
     def create_commande(self, **kwargs):
         """Créer une commande POS avec ses lignes.
         Attendu (JSON):
@@ -18,52 +298,25 @@ class PosCaisseApi(http.Controller):
                     "vc": Optional[bool],
           "type_paiement": "cash"|"bp",
           "lignes": [{"type_pain_id": int, "quantite": int}],
-          "confirm": Optional[bool]
+          "confirm": Optional[bool],
+          "name": Optional[str],      // numéro pré-attribué pris dans un bloc de l'appareil
+          "appareil": Optional[str]   // identifiant de l'appareil (ou en-tête X-Device-Id)
         }
                 Retour: { status, commande: {id, name, state, total, is_vc, mouvement_id?} }
         """
         try:
             params = request.jsonrequest or kwargs or {}
-            lignes = params.get('lignes') or []
-            type_paiement = params.get('type_paiement') or 'cash'
             confirm = bool(params.get('confirm'))
-            is_vc = bool(params.get('vc') or params.get('is_vc'))
-
-            if not lignes:
-                return {"status": "error", "message": "Aucune ligne fournie."}
-            if type_paiement not in ('cash', 'bp'):
-                return {"status": "error", "message": "type_paiement invalide (cash|bp)."}
-
             env = request.env
-            uid = request.uid
 
-            # Session
-            session_id = params.get('session_id')
-            session = None
-            if session_id:
-                session = env['pos.caisse.session'].sudo().browse(int(session_id))
-                if not session or not session.exists():
-                    return {"status": "error", "message": "Session introuvable."}
-            else:
-                session = env['pos.caisse.session'].sudo().search([
-                    ('user_id', '=', uid), ('state', '=', 'ouvert')
-                ], order='date desc', limit=1)
-                if not session:
-                    return {"status": "error", "message": "Aucune session ouverte pour l'utilisateur."}
-
-            # Vendeur/Client
-            logging.info(f" ======== Création de la commande POS pour les paramettres: {params}")
-            client_card = params.get('client_card') or False
-            client_name = params.get('client_name') or False
-            vendeur_id = False
-            if client_card:
-                vendeur = env['pos.caisse.vendeur'].sudo().search([('carte_numero', '=', client_card)], limit=1)
-                if vendeur:
-                    vendeur_id = vendeur.id
-                    # si nom non fourni, reprendre celui du vendeur
-                    client_name = client_name or vendeur.name
+            session, error = self._resoudre_session(env, params.get('session_id'), request.uid)
+            if error:
+                return {"status": "error", "message": error}
 
-            # recuperation de "idempotency_key" et verifier qu'il n'existe pas d'enregistrement avec cette clé sinon retourner l'enregistrement retrouvé
+            logging.debug("Création d'une commande POS (session %s, %s ligne(s))", params.get('session_id'), len(params.get('lignes') or []))
+
+            # Les rejeus sont servis par le store d'idempotence (@idempotent); cette recherche ne couvre
+            # plus que les commandes créées avant son introduction
             idempotency_key = params.get('idempotency_key')
             if idempotency_key:
                 existing_commande = env['pos.caisse.commande'].sudo().search([('idempotency_key', '=', idempotency_key)], limit=1)
@@ -71,89 +324,245 @@ class PosCaisseApi(http.Controller):
                     logging.info(f"Commande POS existante trouvée avec idempotency_key {idempotency_key}: {existing_commande.id}")
                     return {"status": "success", "commande": existing_commande.read(['id','name','state','total','mouvement_id'])[0]}
 
-            # Lignes préparées
-            line_vals = []
-            for l in lignes:
-                tp = l.get('type_pain_id')
-                qte = l.get('quantite')
-                if not tp or not qte or int(qte) <= 0:
-                    return {"status": "error", "message": "Chaque ligne doit avoir type_pain_id et quantite>0."}
-                line_vals.append((0, 0, {
-                    'type_pain_id': int(tp),
-                    'quantite': int(qte),
-                }))
-
-            commande_vals = {
-                'session_id': session.id,
-                'vendeur_id': vendeur_id or False,
-                'client_card': client_card,
-                'client_name': client_name,
-                'type_paiement': type_paiement,
-                'is_vc': is_vc,
-                'line_ids': line_vals,
-                'idempotency_key': idempotency_key,
-            }
+            vendeurs = {}
+            client_card = params.get('client_card')
+            if client_card:
+                vendeur = env['pos.caisse.vendeur']._resoudre_carte(client_card)
+                if vendeur:
+                    vendeurs[client_card] = vendeur
+
+            erreurs_noms, error = self._valider_noms(env, params, [params['name']] if params.get('name') else [])
+            if error or erreurs_noms:
+                return {"status": "error", "message": error or erreurs_noms[params['name']]}
+
+            commande_vals, error = self._preparer_commande(params, session, vendeurs)
+            if error:
+                return {"status": "error", "message": error}
 
             commande = env['pos.caisse.commande'].sudo().create(commande_vals)
 
             if confirm:
                 commande.sudo().action_confirmer()
 
-            data = {
-                'id': commande.id,
-                'name': commande.name,
-                'state': commande.state,
-                'total': commande.total,
-                'is_vc': commande.is_vc,
-                'mouvement_id': commande.mouvement_id.id or None,
-            }
-            return {"status": "success", "commande": data}
+            return {"status": "success", "commande": self._commande_data(commande)}
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
+    @http.route('/api/pos_caisse/commandes/batch', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/commandes/batch')
+    @idempotent('commandes_batch')
+    def create_commandes_batch(self, **kwargs):
+        """Créer un lot de commandes en un seul appel (rejeu de la file hors-ligne).
+        Attendu (JSON):
+        {
+          "session_id": Optional[int],   // session par défaut des commandes du lot
+          "appareil": Optional[str],     // identifiant de l'appareil si des numéros sont pré-attribués
+          "commandes": [ { ...même format que /api/pos_caisse/commandes... } ]
+        }
+        Retour: { status, resultats: [{index, idempotency_key, status: created|duplicate|error,
+                                        id?, name?, state?, total?, mouvement_id?, message?}],
+                  created, duplicates, errors }
+
+        Les sessions, vendeurs et clés d'idempotence sont résolus en une requête pour tout le lot.
+        Les clés des commandes partagent le store d'idempotence de /api/pos_caisse/commandes.
+        Le lot est créé d'un bloc; si cela échoue, chaque commande est rejouée dans son propre
+        savepoint afin qu'une commande invalide n'annule pas les autres.
+        """
+        try:
+            params = request.jsonrequest or kwargs or {}
+            items = params.get('commandes') or []
+            if not isinstance(items, list) or not items:
+                return {'status': 'error', 'message': 'Aucune commande fournie.'}
+            if len(items) > MAX_COMMANDES_BATCH:
+                return {'status': 'error', 'message': f'Lot trop volumineux (max {MAX_COMMANDES_BATCH} commandes).'}
+            collecteur.observer(request.db, 'pos_caisse_api_batch_size', len(items), BORNES_LOT, route='/api/pos_caisse/commandes/batch')
+
+            env = request.env
+            uid = request.uid
+            Commande = env['pos.caisse.commande'].sudo()
+            resultats = [None] * len(items)
+
+            # Résolution groupée: sessions, doublons d'idempotence, vendeurs
+            sessions = {}
+            default_session_id = params.get('session_id')
+            keys = {it.get('idempotency_key') for it in items if isinstance(it, dict) and it.get('idempotency_key')}
+            Store = env['pos.caisse.idempotence'].sudo()
+            rejeus = Store._reserver('commande', keys)
+            existing = {}
+            legacy = keys - set(rejeus)
+            if legacy:
+                # Commandes créées avant le store d'idempotence
+                for cmd in Commande.search([('idempotency_key', 'in', list(legacy))]):
+                    existing.setdefault(cmd.idempotency_key, cmd)
+            cards = {it.get('client_card') for it in items if isinstance(it, dict) and it.get('client_card')}
+            Vendeur = env['pos.caisse.vendeur']
+            vendeurs = Vendeur._resoudre_cartes(cards)
+            noms = [it['name'] for it in items if isinstance(it, dict) and it.get('name')]
+            erreurs_noms, erreur_appareil = self._valider_noms(env, params, noms)
+            noms_vus = set()
+
+            # Préparation: (index, vals, confirm) des commandes à créer
+            a_creer = []
+            vus = {}
+            for index, item in enumerate(items):
+                if not isinstance(item, dict):
+                    resultats[index] = {'index': index, 'status': 'error', 'message': 'Commande invalide.'}
+                    continue
+                key = item.get('idempotency_key')
+                if key and key in rejeus:
+                    commande = (rejeus[key] or {}).get('commande')
+                    if commande:
+                        resultats[index] = dict(commande, index=index, idempotency_key=key, status='duplicate')
+                    elif rejeus[key] and rejeus[key].get('code') == 409:
+                        resultats[index] = {'index': index, 'idempotency_key': key, 'status': 'error', 'message': rejeus[key]['message']}
+                    else:
+                        resultats[index] = {'index': index, 'idempotency_key': key, 'status': 'error', 'message': "Requête déjà en cours de traitement pour cette clé."}
+                    continue
+                if key and key in existing:
+                    resultats[index] = dict(self._commande_data(existing[key]), index=index, idempotency_key=key, status='duplicate')
+                    continue
+                if key and key in vus:
+                    # Même clé répétée dans le lot: rattachée à la première occurrence
+                    resultats[index] = {'index': index, 'idempotency_key': key, 'status': 'duplicate', 'doublon_de': vus[key]}
+                    continue
+                nom = item.get('name')
+                if nom:
+                    if erreur_appareil or nom in erreurs_noms or nom in noms_vus:
+                        message = erreur_appareil or erreurs_noms.get(nom) or f"Numéro {nom} répété dans le lot."
+                        resultats[index] = {'index': index, 'idempotency_key': key, 'status': 'error', 'message': message}
+                        continue
+                sid = item.get('session_id') or default_session_id
+                if sid not in sessions:
+                    sessions[sid] = self._resoudre_session(env, sid, uid)
+                session, error = sessions[sid]
+                if not error:
+                    vals, error = self._preparer_commande(item, session, vendeurs)
+                if error:
+                    resultats[index] = {'index': index, 'idempotency_key': key, 'status': 'error', 'message': error}
+                    continue
+                if key:
+                    vus[key] = index
+                if nom:
+                    noms_vus.add(nom)
+                a_creer.append((index, vals, bool(item.get('confirm'))))
+
+            crees = {}
+            if a_creer:
+                try:
+                    with env.cr.savepoint():
+                        # Copies: create() complète les vals (vendeur_id) et le rejeu doit repartir des originales
+                        commandes = Commande.create([dict(vals) for _i, vals, _c in a_creer])
+                        a_confirmer = Commande.browse([cmd.id for cmd, (_i, _v, confirm) in zip(commandes, a_creer) if confirm])
+                        if a_confirmer:
+                            a_confirmer.action_confirmer()
+                    for cmd, (index, _v, _c) in zip(commandes, a_creer):
+                        crees[index] = cmd
+                except Exception:
+                    logging.warning("Création groupée du lot impossible, rejeu commande par commande", exc_info=True)
+                    for index, vals, confirm in a_creer:
+                        try:
+                            with env.cr.savepoint():
+                                cmd = Commande.create(vals)
+                                if confirm:
+                                    cmd.action_confirmer()
+                            crees[index] = cmd
+                        except Exception as e:
+                            resultats[index] = {'index': index, 'idempotency_key': vals.get('idempotency_key'), 'status': 'error', 'message': str(e)}
+
+            for index, cmd in crees.items():
+                resultats[index] = dict(self._commande_data(cmd), index=index, idempotency_key=cmd.idempotency_key, status='created')
+            for index, res in enumerate(resultats):
+                if res.get('doublon_de') is not None:
+                    origine = resultats[res.pop('doublon_de')]
+                    if origine.get('id'):
+                        res.update({k: origine[k] for k in ('id', 'name', 'state', 'total', 'is_vc', 'mouvement_id')})
+                    else:
+                        res.update(status='error', message=origine.get('message') or 'Commande d\'origine en erreur.')
+
+            # Mise à jour du store: réponses des commandes créées ou retrouvées, libération des erreurs
+            reponses, liberees = {}, []
+            for res in resultats:
+                key = res.get('idempotency_key')
+                if not key or key in rejeus:
+                    continue
+                if res.get('id'):
+                    reponses[key] = {'status': 'success', 'commande': {k: res[k] for k in ('id', 'name', 'state', 'total', 'is_vc', 'mouvement_id')}}
+                else:
+                    liberees.append(key)
+            Store._enregistrer('commande', reponses)
+            Store._liberer('commande', liberees)
+
+            return {
+                'status': 'success',
+                'resultats': resultats,
+                'created': sum(1 for r in resultats if r['status'] == 'created'),
+                'duplicates': sum(1 for r in resultats if r['status'] == 'duplicate'),
+                'errors': sum(1 for r in resultats if r['status'] == 'error'),
+            }
+        except Exception as e:
+            logging.exception("Erreur dans create_commandes_batch")
+            return {'status': 'error', 'message': str(e)}
+
+    @http.route('/api/pos_caisse/commandes/confirm', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/commandes/confirm')
+    @idempotent('commandes_confirm')
+    def confirm_commandes(self, **kwargs):
+        """Confirmer en un appel des commandes brouillon (file de confirmation des appareils).
+        Attendu (JSON): { "confirm_ids": [int, ...] }
+        Retour: { status, confirmees: [ids], ignorees: [{id, raison}], commandes: [{id, name, state, total, is_vc, mouvement_id}] }
+
+        Les commandes déjà confirmées sont ignorées (rejeu sans effet); la confirmation de
+        l'ensemble est atomique: une session fermée fait échouer tout l'appel.
+        """
+        try:
+            params = request.jsonrequest or kwargs or {}
+            ids = params.get('confirm_ids') or []
+            if not isinstance(ids, list) or not ids:
+                return {'status': 'error', 'message': 'confirm_ids requis'}
+            if len(ids) > MAX_COMMANDES_BATCH:
+                return {'status': 'error', 'message': f'Lot trop volumineux (max {MAX_COMMANDES_BATCH} commandes).'}
+            collecteur.observer(request.db, 'pos_caisse_api_batch_size', len(ids), BORNES_LOT, route='/api/pos_caisse/commandes/confirm')
+            Commande = request.env['pos.caisse.commande'].sudo()
+            ids = [int(i) for i in ids]
+            if not self._is_admin():
+                autres = Commande.browse(ids).exists().filtered(lambda c: c.session_id.user_id.id != request.uid)
+                if autres:
+                    return {'status': 'error', 'message': "Droits insuffisants"}
+            result = Commande.confirmer_ids(ids)
+            commandes = Commande.browse(result['confirmees'])
+            return dict(result, status='success', commandes=[self._commande_data(c) for c in commandes])
+        except Exception as e:
+            logging.exception("Erreur dans confirm_commandes")
+            return {'status': 'error', 'message': str(e)}
+
     @http.route('/api/pos_caisse/sessions', type='json', auth='user', methods=['GET', 'POST'], csrf=False)
+    @instrumente('/api/pos_caisse/sessions')
+    @idempotent('sessions', condition=lambda params: params.get('state') in ('open', 'close'))
     def get_or_manage_sessions(self, **kwargs):
         """Lister, ouvrir ou fermer des sessions.
         Entrée JSON:
-          - list: { state?: 'ouvert'|'ferme', page?: int, limit?: int }
+          - list: { state?: 'ouvert'|'ferme', page?: int, limit?: int, format?: 'colonnes' }
           - open: { state: 'open' }
           - close: { state: 'close', session_id?: int }
         Retour (JSON-RPC result): { status, sessions?, page?, limit?, total? }
+        Avec format 'colonnes': { colonnes, lignes, codes } au lieu de sessions (voir _en_colonnes).
         """
         try:
             params = request.jsonrequest or kwargs or {}
             action = params.get('state')  # may be 'open', 'close', or a filter value
-            page = int(params.get('page') or 1)
-            limit = int(params.get('limit') or 50)
-            offset = max(0, (page - 1) * limit)
             env = request.env
             Session = env['pos.caisse.session'].sudo()
             uid = request.uid
             is_admin = self._is_admin()
 
-            def _map(s):
-                return {
-                    'id': s.id,
-                    'name': s.name,
-                    'date': s.date,
-                    'date_cloture': s.date_cloture,
-                    'state': s.state,
-                    'total_commandes': s.total_commandes,
-                    'total_montant': s.total_montant,
-                    'total_mouvements': s.total_mouvements,
-                    'montant_en_caisse': s.montant_en_caisse,
-                    'montant_sortie': s.montant_sortie,
-                    'total_bp': s.total_bp,
-                }
-
             # Open session
             if action == 'open':
                 # Reuse existing open session if any for this user
                 existing = Session.search([('user_id', '=', uid), ('state', '=', 'ouvert')], limit=1)
                 if existing:
-                    return {'status': 'success', 'sessions': [_map(existing)]}
+                    return {'status': 'success', 'sessions': [self._session_data(existing)]}
                 new_sess = Session.create({'user_id': uid, 'state': 'ouvert'})
-                return {'status': 'success', 'sessions': [_map(new_sess)]}
+                return {'status': 'success', 'sessions': [self._session_data(new_sess)]}
 
             # Close session
             if action == 'close':
@@ -173,52 +582,100 @@ class PosCaisseApi(http.Controller):
                 return {'status': 'success'}
 
             # List sessions (default)
-            domain = []
-            if action in ('ouvert', 'ferme'):
-                domain.append(('state', '=', action))
-            if not is_admin:
-                domain.append(('user_id', '=', uid))
-            total = Session.search_count(domain)
-            sessions = Session.search(domain, order='date desc', offset=offset, limit=limit)
-            return {
-                'status': 'success',
-                'sessions': [_map(s) for s in sessions],
-                'page': page,
-                'limit': limit,
-                'total': total,
-            }
+            return self._lister_sessions(params)
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
 
+    def _session_data(self, session):
+        return {c: session[c] for c in COLONNES_SESSION}
+
+    def _lister_sessions(self, params):
+        """Page de sessions (liste de /api/pos_caisse/sessions et /api/pos_caisse/compact/sessions)"""
+        action = params.get('state')
+        page = int(params.get('page') or 1)
+        limit = int(params.get('limit') or 50)
+        offset = max(0, (page - 1) * limit)
+        Session = request.env['pos.caisse.session'].sudo()
+        domain = []
+        if action in ('ouvert', 'ferme'):
+            domain.append(('state', '=', action))
+        if not self._is_admin():
+            domain.append(('user_id', '=', request.uid))
+        total = Session.search_count(domain)
+        sessions = Session.search(domain, order='date desc', offset=offset, limit=limit)
+        result = {'status': 'success', 'page': page, 'limit': limit, 'total': total}
+        if params.get('format') == 'colonnes':
+            # Totaux calculés en lot par read() (une requête par agrégat pour toute la page)
+            lignes = [[d[c] for c in COLONNES_SESSION] for d in sessions.read(list(COLONNES_SESSION), load=None)]
+            result.update(_en_colonnes(COLONNES_SESSION, lignes, CODES_COLONNES['sessions']))
+        else:
+            result['sessions'] = [self._session_data(s) for s in sessions]
+        return result
+
+    @http.route('/api/pos_caisse/vendeurs/lookup', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/vendeurs/lookup')
+    def lookup_vendeurs(self, **kwargs):
+        """Recherche de vendeur pendant la saisie ou au scan de carte.
+        Paramètres: { "q": str, "limit": Optional[int] (défaut 10, max 50) }
+        Retour: { status, vendeurs: [{id, carte_numero, name, pourcentage_commission, rang, solde_bp, nb_bp}] }
+
+        Classement: carte exacte (rang 0), début de carte, début de nom, contenu, nom approchant.
+        solde_bp / nb_bp: montant et nombre des commandes BP non encore payées.
+        """
+        try:
+            params = request.jsonrequest or kwargs or {}
+            terme = (params.get('q') or '').strip()
+            if not terme:
+                return {'status': 'success', 'vendeurs': []}
+            limit = min(max(int(params.get('limit') or 10), 1), 50)
+            vendeurs = request.env['pos.caisse.vendeur']._rechercher(terme, limit=limit, avec_solde_bp=True)
+            return {'status': 'success', 'vendeurs': vendeurs}
+        except Exception as e:
+            logging.exception("Erreur dans lookup_vendeurs")
+            return {'status': 'error', 'message': str(e)}
+
     @http.route('/api/pos_caisse/types_pain', type='json', auth='user', methods=['GET','POST'], csrf=False)
+    @instrumente('/api/pos_caisse/types_pain')
     def types_pain(self, **kwargs):
+        """Catalogue des types de pain.
+        Paramètres:
+        {
+          "search": Optional[str],
+          "limit": Optional[int],
+          "actifs_seulement": Optional[bool],
+          "if_none_match": Optional[str], // etag reçu précédemment (ou en-tête If-None-Match)
+          "format": Optional[str]         // "colonnes": { colonnes, lignes, codes } au lieu de data
+        }
+        Retour: { status: "success", data, etag } ou { status: "not_modified", etag } si le
+        catalogue n'a pas changé depuis cet etag.
+        """
         try:
             params = request.jsonrequest or kwargs or {}
-            search = (params.get('search') or '').strip()
-            limit = int(params.get('limit') or 200)
-            actifs_only = bool(params.get('actifs_seulement') or params.get('active_only'))
-            domain = []
-            if actifs_only:
-                domain.append(('active', '=', True))
-            if search:
-                domain = ['|', ('name', 'ilike', search), ('prix', '=', search)] + domain
-            recs = request.env['pos.caisse.type.pain'].sudo().search(domain, order='active desc, name asc', limit=limit)
-            data = [
-                {
-                    'id': r.id,
-                    'name': r.name,
-                    'prix': r.prix,
-                    'poids': r.poids,
-                    'description': r.description,
-                    'active': r.active,
-                }
-                for r in recs
-            ]
-            return {'status': 'success', 'data': data}
+            return self._lister_types_pain(params)
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
 
+    def _lister_types_pain(self, params):
+        search = (params.get('search') or '').strip()
+        limit = int(params.get('limit') or 200)
+        actifs_only = bool(params.get('actifs_seulement') or params.get('active_only'))
+        Pain = request.env['pos.caisse.type.pain'].sudo()
+        version = Pain._get_catalogue_version()
+        # Un etag par version et par requête normalisée: une autre recherche n'est jamais « inchangée »
+        requete = json.dumps([search, limit, actifs_only, params.get('format') == 'colonnes'])
+        etag = f'"catalogue-{version}-{hashlib.sha1(requete.encode()).hexdigest()[:12]}"'
+        if_none_match = params.get('if_none_match') or request.httprequest.headers.get('If-None-Match')
+        if _etag_correspond(if_none_match, etag):
+            return {'status': 'not_modified', 'etag': etag}
+        data = Pain._lire_catalogue(version, actifs_only, search, limit)
+        if params.get('format') == 'colonnes':
+            colonnes = tuple(Pain._CHAMPS_CATALOGUE)
+            return dict(_en_colonnes(colonnes, [[d[c] for c in colonnes] for d in data]), status='success', etag=etag)
+        return {'status': 'success', 'data': list(data), 'etag': etag}
+
     @http.route('/api/pos_caisse/entree_caisse', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/entree_caisse')
+    @idempotent('entree_caisse')
     def entree_caisse(self, **kwargs):
         try:
             params = request.jsonrequest or kwargs or {}
@@ -247,6 +704,8 @@ class PosCaisseApi(http.Controller):
             return {'status': 'error', 'message': str(e)}
 
     @http.route('/api/pos_caisse/sortie_caisse', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/sortie_caisse')
+    @idempotent('sortie_caisse')
     def sortie_caisse(self, **kwargs):
         try:
             params = request.jsonrequest or kwargs or {}
@@ -273,7 +732,70 @@ class PosCaisseApi(http.Controller):
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
 
+    @http.route('/api/pos_caisse/caisse/solde', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/caisse/solde')
+    def solde_caisse(self, **kwargs):
+        """Montant en caisse d'une session à un instant ou entre deux instants (journal de caisse).
+        Paramètres:
+        {
+          "session_id": int,
+          "a": Optional[str],       // "YYYY-MM-DD HH:MM:SS" (UTC): solde à cet instant
+          "debut": Optional[str],   // avec "fin": soldes, entrées et sorties de la période
+          "fin": Optional[str]
+        }
+        Sans date, renvoie le solde courant.
+        """
+        try:
+            params = request.jsonrequest or kwargs or {}
+            session_id = params.get('session_id')
+            if not session_id:
+                return {'status': 'error', 'message': 'session_id requis'}
+            sess = request.env['pos.caisse.session'].sudo().browse(int(session_id))
+            if not sess or not sess.exists():
+                return {'status': 'error', 'message': 'Session introuvable'}
+            if not self._is_admin() and sess.user_id.id != request.uid:
+                return {'status': 'error', 'message': "Droits insuffisants"}
+            if params.get('debut') and params.get('fin'):
+                data = sess.get_solde_entre(
+                    fields.Datetime.to_datetime(params['debut']),
+                    fields.Datetime.to_datetime(params['fin']),
+                )
+            else:
+                moment = fields.Datetime.to_datetime(params['a']) if params.get('a') else fields.Datetime.now()
+                data = sess.get_solde_a(moment)
+            return {'status': 'success', 'data': data}
+        except Exception as e:
+            return {'status': 'error', 'message': str(e)}
+
+    def _commandes_domain(self, params):
+        """Domaine de filtrage des commandes (session, dates, recherche, droits d'accès)"""
+        domain = []
+
+        # Session filter
+        session_id = params.get('session_id')
+        if session_id:
+            domain.append(('session_id', '=', int(session_id)))
+
+        # Date filters
+        date_from = params.get('date_from')
+        date_to = params.get('date_to')
+        if date_from:
+            domain.append(('date', '>=', date_from + ' 00:00:00'))
+        if date_to:
+            domain.append(('date', '<=', date_to + ' 23:59:59'))
+
+        # Search filter (index trigramme sur client_card et client_name)
+        search = params.get('search')
+        if search:
+            domain += ['|', ('client_card', 'ilike', search), ('client_name', 'ilike', search)]
+
+        # Access control: users can only see their own session's commands unless admin
+        if not self._is_admin():
+            domain.append(('session_id.user_id', '=', request.uid))
+        return domain
+
     @http.route('/api/pos_caisse/commandes/list', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/commandes/list')
     def list_commandes(self, **kwargs):
         """Lister les commandes de caisse avec filtres.
         Paramètres:
@@ -281,80 +803,405 @@ class PosCaisseApi(http.Controller):
           "session_id": Optional[int],
           "date_from": Optional[str], // format YYYY-MM-DD
           "date_to": Optional[str],   // format YYYY-MM-DD  
-          "search": Optional[str],    // recherche sur client_card, client_nom
+          "search": Optional[str],    // recherche sur client_card, client_name
           "limit": Optional[int],
-          "offset": Optional[int]
+          "cursor": Optional[str],    // curseur opaque "next_cursor" de la page précédente
+          "offset": Optional[int],    // pagination historique, ignorée si cursor est fourni
+          "fields": Optional[list],   // colonnes renvoyées (défaut: CHAMPS_LISTE_DEFAUT)
+          "with_count": Optional[bool], // nombre total de commandes (défaut: oui sans curseur, non avec)
+          "format": Optional[str]      // "colonnes": { colonnes, lignes, codes } au lieu de data
         }
+        Retour: { status, data, returned, next_cursor, total? }
+        Les commandes sont triées par (date, id) décroissants; la page suivante reprend
+        strictement après le dernier (date, id) renvoyé, quelle que soit sa profondeur.
         """
         try:
             params = request.jsonrequest or kwargs or {}
-            env = request.env
-            uid = request.uid
-            
-            # Build domain
+            return self._lister_commandes(params)
+        except Exception as e:
+            logging.exception("Erreur dans list_commandes")
+            return {'status': 'error', 'message': str(e)}
+
+    def _lister_commandes(self, params):
+        domain = self._commandes_domain(params)
+        Commande = request.env['pos.caisse.commande'].sudo()
+
+        # Projection
+        champs = params.get('fields') or CHAMPS_LISTE_DEFAUT
+        inconnus = [f for f in champs if f not in Commande._COLONNES_LISTE]
+        if inconnus:
+            return {'status': 'error', 'message': f"Champs inconnus: {', '.join(inconnus)}"}
+
+        # Pagination par curseur (date, id)
+        limit = min(int(params.get('limit') or 100), 1000)
+        offset = 0
+        cursor = params.get('cursor')
+        if cursor:
+            cursor_date, cursor_id = _decode_cursor(cursor)
+            domain += ['|', ('date', '<', cursor_date), '&', ('date', '=', cursor_date), ('id', '<', cursor_id)]
+        else:
+            offset = int(params.get('offset') or 0)
+
+        ids = Commande.search(domain, offset=offset, limit=limit, order='date desc, id desc').ids
+        rows = Commande._lire_liste(ids, champs)
+
+        result = {
+            'status': 'success',
+            'returned': len(rows),
+            'next_cursor': _encode_cursor(rows[-1][0], rows[-1][1]) if len(rows) == limit else None,
+        }
+        if params.get('format') == 'colonnes':
+            # Lignes tirées directement des tuples de _lire_liste
+            position_date = champs.index('date') if 'date' in champs else None
+            lignes = [list(row[2:]) for row in rows]
+            if position_date is not None:
+                for ligne in lignes:
+                    if ligne[position_date]:
+                        ligne[position_date] = ligne[position_date].isoformat()
+            result.update(_en_colonnes(champs, lignes, CODES_COLONNES['commandes']))
+        else:
+            data = [dict(zip(champs, row[2:])) for row in rows]
+            for item in data:
+                if item.get('date'):
+                    item['date'] = item['date'].isoformat()
+            result['data'] = data
+        if not cursor:
+            result['offset'] = offset
+        # Compte conservé par défaut en pagination par offset (clients existants)
+        if params.get('with_count', not cursor):
+            result['total'] = Commande.search_count(self._commandes_domain(params))
+        return result
+
+    @http.route('/api/pos_caisse/compact/<string:liste>', type='http', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/compact')
+    def compact(self, liste, **kwargs):
+        """Listes au format en colonnes, compressées (gzip/deflate selon Accept-Encoding).
+        `liste`: sessions | types_pain | commandes. Corps JSON: mêmes paramètres que
+        /api/pos_caisse/sessions (liste), /api/pos_caisse/types_pain, /api/pos_caisse/commandes/list.
+        Retour: { status, colonnes, lignes, codes, ... } (corps JSON direct, sans enveloppe JSON-RPC);
+        types_pain répond 304 si l'etag (If-None-Match) est inchangé.
+        """
+        listes = {
+            'sessions': self._lister_sessions,
+            'types_pain': self._lister_types_pain,
+            'commandes': self._lister_commandes,
+        }
+        if liste not in listes:
+            return _reponse_compressee({'status': 'error', 'message': f"Liste inconnue: {liste}"}, status=404)
+        try:
+            params = json.loads(request.httprequest.get_data() or b'{}')
+            if not isinstance(params, dict):
+                raise ValueError("Corps JSON attendu: objet")
+            params = params.get('params', params)  # tolère l'enveloppe JSON-RPC
+            result = listes[liste](dict(params, format='colonnes'))
+        except Exception as e:
+            logging.exception("Erreur dans compact")
+            return _reponse_compressee({'status': 'error', 'message': str(e)}, status=400)
+        if result.get('status') == 'not_modified':
+            return Response(status=304, headers=[('ETag', result['etag'])])
+        headers = [('ETag', result['etag'])] if result.get('etag') else []
+        return _reponse_compressee(result, headers=headers)
+
+    @http.route('/api/pos_caisse/commandes/export', type='http', auth='user', methods=['GET'], csrf=False)
+    @instrumente('/api/pos_caisse/commandes/export')
+    def export_commandes(self, date_from=None, date_to=None, session_id=None, format='csv', **kwargs):
+        """Exporter les commandes et leurs lignes d'une période, en flux (réponse chunked).
+        Paramètres (query string):
+          date_from, date_to: YYYY-MM-DD (obligatoires)
+          session_id: Optional[int]
+          format: "csv" (défaut) | "ndjson"
+        Une ligne par ligne de commande; les colonnes de la commande sont répétées.
+        Les lignes sont lues par paquets via un curseur serveur: la mémoire reste constante
+        quelle que soit la période.
+        """
+        if not date_from or not date_to or format not in ('csv', 'ndjson'):
+            return Response("date_from, date_to et format (csv|ndjson) requis", status=400)
+        # Paramètres validés avant d'ouvrir le flux: une erreur dans le générateur couperait
+        # la réponse après l'envoi du statut 200
+        try:
+            date_from = fields.Date.to_string(datetime.strptime(date_from, '%Y-%m-%d'))
+            date_to = fields.Date.to_string(datetime.strptime(date_to, '%Y-%m-%d'))
+            session_id = int(session_id) if session_id else None
+        except ValueError:
+            return Response("date_from, date_to (YYYY-MM-DD) ou session_id (entier) invalide", status=400)
+        if date_from > date_to:
+            return Response("date_from doit précéder date_to", status=400)
+        Commande = request.env['pos.caisse.commande']
+        query, params = Commande._requete_export(
+            date_from + ' 00:00:00',
+            date_to + ' 23:59:59',
+            session_id=session_id,
+            user_id=None if self._is_admin() else request.uid,
+        )
+        colonnes = list(Commande._CHAMPS_EXPORT) + list(Commande._COLONNES_EXPORT_LIGNES)
+        registry = request.env.registry
+
+        def _valeur(v):
+            return v.isoformat() if isinstance(v, datetime) else v
+
+        def _generer():
+            # Le curseur de la requête est fermé avant l'envoi du corps: l'export utilise le sien
+            with registry.cursor() as cr:
+                cr.execute("SET TRANSACTION READ ONLY")
+                cr.execute("DECLARE export_commandes NO SCROLL CURSOR FOR " + query, params)
+                if format == 'csv':
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    writer.writerow(colonnes)
+                    yield buffer.getvalue().encode()
+                while True:
+                    cr.execute("FETCH %s FROM export_commandes", (TAILLE_PAQUET_EXPORT,))
+                    rows = cr.fetchall()
+                    if not rows:
+                        break
+                    if format == 'csv':
+                        buffer = io.StringIO()
+                        writer = csv.writer(buffer)
+                        writer.writerows([_valeur(v) for v in row] for row in rows)
+                        yield buffer.getvalue().encode()
+                    else:
+                        yield ''.join(
+                            json.dumps(dict(zip(colonnes, map(_valeur, row))), ensure_ascii=False) + '\n'
+                            for row in rows
+                        ).encode()
+
+        extension, mimetype = ('csv', 'text/csv') if format == 'csv' else ('ndjson', 'application/x-ndjson')
+        return Response(_generer(), headers=[
+            ('Content-Type', f'{mimetype}; charset=utf-8'),
+            ('Content-Disposition', f'attachment; filename="commandes_{date_from}_{date_to}.{extension}"'),
+        ], direct_passthrough=True)
+
+    @http.route('/api/pos_caisse/ventes/jour', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/ventes/jour')
+    def ventes_jour(self, **kwargs):
+        """Ventes agrégées depuis le cube journalier (réservé aux gestionnaires).
+        Paramètres:
+        {
+          "date_from": Optional[str], // YYYY-MM-DD
+          "date_to": Optional[str],   // YYYY-MM-DD
+          "groupby": Optional[list],  // parmi date, type_pain_id, vendeur_id, type_paiement, is_vc (défaut: ["date"])
+          "vendeur_id": Optional[int],
+          "type_pain_id": Optional[int]
+        }
+        Retour: { status, data: [{<groupby>..., quantite, poids, montant}] }
+        """
+        try:
+            if not self._is_admin():
+                return {'status': 'error', 'message': "Droits insuffisants"}
+            params = request.jsonrequest or kwargs or {}
+            dimensions = ('date', 'type_pain_id', 'vendeur_id', 'type_paiement', 'is_vc')
+            groupby = params.get('groupby') or ['date']
+            inconnus = [g for g in groupby if g not in dimensions]
+            if inconnus:
+                return {'status': 'error', 'message': f"Regroupements inconnus: {', '.join(inconnus)}"}
             domain = []
-            
-            # Session filter
-            session_id = params.get('session_id')
-            if session_id:
-                domain.append(('session_id', '=', int(session_id)))
-            
-            # Date filters
-            date_from = params.get('date_from')
-            date_to = params.get('date_to')
-            if date_from:
-                domain.append(('date', '>=', date_from + ' 00:00:00'))
-            if date_to:
-                domain.append(('date', '<=', date_to + ' 23:59:59'))
-            
-            # Search filter
-            search = params.get('search')
-            if search:
-                domain += ['|', ('client_card', 'ilike', search), ('client_nom', 'ilike', search)]
-            
-            # Pagination
-            offset = int(params.get('offset', 0))
-            limit = int(params.get('limit', 100))
-            
-            # Access control: users can only see their own session's commands unless admin
+            if params.get('date_from'):
+                domain.append(('date', '>=', params['date_from']))
+            if params.get('date_to'):
+                domain.append(('date', '<=', params['date_to']))
+            for champ in ('vendeur_id', 'type_pain_id'):
+                if params.get(champ):
+                    domain.append((champ, '=', int(params[champ])))
+            groupes = request.env['pos.caisse.vente.jour'].sudo().read_group(
+                domain, ['quantite', 'poids', 'montant'],
+                [g + ':day' if g == 'date' else g for g in groupby], lazy=False, orderby=', '.join(groupby),
+            )
+            data = []
+            for groupe in groupes:
+                ligne = {g: groupe[g + ':day' if g == 'date' else g] for g in groupby}
+                ligne.update({k: groupe[k] for k in ('quantite', 'poids', 'montant')})
+                data.append(ligne)
+            return {'status': 'success', 'data': data}
+        except Exception as e:
+            logging.exception("Erreur dans ventes_jour")
+            return {'status': 'error', 'message': str(e)}
+
+    @http.route('/api/pos_caisse/rapprochement', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/rapprochement')
+    def rapprochement(self, **kwargs):
+        """Rapprochement farine / pains vendus.
+        Paramètres:
+        {
+          "session_ids": Optional[list[int]],  // ou "session_id"
+          "date_from": Optional[str],          // YYYY-MM-DD, avec date_to: cumul des sessions de la période
+          "date_to": Optional[str]
+        }
+        Retour: { status, sessions: {session_id: indicateurs}, total?: indicateurs }
+        Indicateurs: pains_vendus, poids_total, montant_ventes, montant_attendu, sacs_theoriques,
+        sacs_utilises, pains_attendus, ecart_pains, cout_farine, marge_brute.
+        """
+        try:
+            params = request.jsonrequest or kwargs or {}
+            Rapprochement = request.env['pos.caisse.rapprochement'].sudo()
+            user_id = None if self._is_admin() else request.uid
+            if params.get('date_from') and params.get('date_to'):
+                result = Rapprochement.rapprocher_periode(params['date_from'], params['date_to'], user_id=user_id)
+                return dict(result, status='success')
+            session_ids = params.get('session_ids') or ([params['session_id']] if params.get('session_id') else [])
+            if not session_ids:
+                return {'status': 'error', 'message': 'session_ids ou date_from/date_to requis'}
+            sessions = request.env['pos.caisse.session'].sudo().browse([int(sid) for sid in session_ids]).exists()
+            if user_id and sessions.filtered(lambda s: s.user_id.id != user_id):
+                return {'status': 'error', 'message': "Droits insuffisants"}
+            return {'status': 'success', 'sessions': Rapprochement.rapprocher_sessions(sessions.ids)}
+        except Exception as e:
+            logging.exception("Erreur dans rapprochement")
+            return {'status': 'error', 'message': str(e)}
+
+    @http.route('/api/pos_caisse/appareils/blocs', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/appareils/blocs')
+    @idempotent('appareil_blocs')
+    def reserver_bloc(self, **kwargs):
+        """Réserver un bloc de numéros de commande pour un appareil (attribution hors-ligne).
+        Paramètres:
+        {
+          "appareil": str,          // identifiant de l'appareil (ou en-tête X-Device-Id), enregistré au premier appel
+          "taille": Optional[int]   // nombre de numéros (défaut 100, max 1000)
+        }
+        Retour: { status, blocs: [{debut, fin, pas, prefixe, suffixe, padding, premier, dernier}] }
+        Les numéros d'un bloc peuvent être attribués localement puis envoyés dans "name"
+        à /api/pos_caisse/commandes ou /api/pos_caisse/commandes/batch.
+        """
+        try:
+            params = request.jsonrequest or kwargs or {}
+            identifiant = _get_appareil_identifiant(params)
+            if not identifiant:
+                return {'status': 'error', 'message': 'appareil requis'}
+            appareil = request.env['pos.caisse.appareil'].sudo()._get_ou_creer(identifiant, request.env.user)
+            blocs = appareil.reserver_bloc(params.get('taille') or 100)
+            return {'status': 'success', 'blocs': blocs._get_data()}
+        except Exception as e:
+            return {'status': 'error', 'message': str(e)}
+
+    @http.route('/api/pos_caisse/sync/changes', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/sync/changes')
+    def sync_changes(self, **kwargs):
+        """Flux de changements pour les appareils (synchronisation incrémentale).
+        Paramètres:
+        {
+          "repere": Optional[str],  // repère opaque renvoyé par l'appel précédent (absent: synchronisation complète)
+          "limit": Optional[int]    // enregistrements max par entité (défaut 500, max 2000)
+        }
+        Retour: { status, changes: {vendeurs, types_pain, sessions, commandes, mouvements},
+                  suppressions: {entite: [ids]}, repere, has_more, reset }
+        Rappeler avec le nouveau repère tant que has_more est vrai. Si reset est vrai, le repère
+        est trop ancien: effacer les données locales et resynchroniser sans repère.
+        """
+        try:
+            params = request.jsonrequest or kwargs or {}
+            limit = min(int(params.get('limit') or 500), 2000)
+            domaines = {}
             if not self._is_admin():
-                user_sessions = env['pos.caisse.session'].search([('user_id', '=', uid)])
-                if user_sessions:
-                    domain.append(('session_id', 'in', user_sessions.ids))
+                # Un caissier ne reçoit que ses sessions et leurs commandes/mouvements
+                domaines = {
+                    'sessions': [('user_id', '=', request.uid)],
+                    'commandes': [('session_id.user_id', '=', request.uid)],
+                    'mouvements': [('session_id.user_id', '=', request.uid)],
+                }
+            result = request.env['pos.caisse.sync']._changements(params.get('repere'), limit=limit, domaines=domaines)
+            return dict(result, status='success')
+        except Exception as e:
+            logging.exception("Erreur dans sync_changes")
+            return {'status': 'error', 'message': str(e)}
+
+    @http.route('/api/pos_caisse/sync/reconcile', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/sync/reconcile')
+    def sync_reconcile(self, **kwargs):
+        """Rapprocher la base locale d'un appareil avec le serveur en un appel (après incident).
+        Paramètres:
+        {
+          "commandes": [ { "idempotency_key": str, "local_id"?: any, "total"?: float, "quantite"?: int } ]
+        }
+        Retour: { status, trouvees: [...], manquantes: [{idempotency_key, local_id}], divergentes: [...] }
+        Les trouvées portent id, name, state, session_id, total et quantite du serveur; les
+        divergentes y ajoutent total_local / quantite_local. Les manquantes sont à renvoyer
+        (via /api/pos_caisse/commandes/batch, avec la même clé).
+        """
+        try:
+            params = request.jsonrequest or kwargs or {}
+            items = params.get('commandes') or []
+            if not isinstance(items, list) or not items:
+                return {'status': 'error', 'message': 'Aucune commande fournie.'}
+            if len(items) > MAX_COMMANDES_RAPPROCHEMENT:
+                return {'status': 'error', 'message': f'Trop de commandes (max {MAX_COMMANDES_RAPPROCHEMENT}).'}
+            collecteur.observer(request.db, 'pos_caisse_api_batch_size', len(items), BORNES_LOT, route='/api/pos_caisse/sync/reconcile')
+            user_id = None if self._is_admin() else request.uid
+            result = request.env['pos.caisse.sync'].sudo()._comparer(items, user_id=user_id)
+            return dict(result, status='success')
+        except Exception as e:
+            logging.exception("Erreur dans sync_reconcile")
+            return {'status': 'error', 'message': str(e)}
+
+    @http.route('/api/pos_caisse/jobs', type='json', auth='user', methods=['POST'], csrf=False)
+    @instrumente('/api/pos_caisse/jobs')
+    def enfiler_job(self, **kwargs):
+        """Lancer un traitement lourd en tâche de fond; la réponse est immédiate.
+        Paramètres:
+        {
+          "type": "rapport_vente" | "stats_vendeurs" | "ventes_mois",
+          "session_ids": Optional[list[int]],  // rapport_vente
+          "mois": Optional[str]                // ventes_mois, "AAAA-MM"
+        }
+        Retour: { status, job: {id, name, state, progression, ...} } (suivi: /api/pos_caisse/jobs/<id>)
+        Une demande identique encore en attente ou en cours renvoie la même tâche.
+        """
+        try:
+            params = request.jsonrequest or kwargs or {}
+            Job = request.env['pos.caisse.job']
+            type_job = params.get('type')
+            if type_job == 'rapport_vente':
+                session_ids = [int(sid) for sid in params.get('session_ids') or []]
+                sessions = request.env['pos.caisse.session'].sudo().browse(session_ids).exists()
+                if not sessions:
+                    return {'status': 'error', 'message': 'session_ids requis'}
+                if not self._is_admin() and sessions.filtered(lambda s: s.user_id.id != request.uid):
+                    return {'status': 'error', 'message': "Droits insuffisants"}
+                job = sessions.with_user(request.uid).action_generer_rapport_vente()
+            elif type_job in ('stats_vendeurs', 'ventes_mois'):
+                if not self._is_admin():
+                    return {'status': 'error', 'message': "Droits insuffisants"}
+                if type_job == 'stats_vendeurs':
+                    job = Job._enfiler('pos.caisse.vendeur.stat', '_reconstruire',
+                                       name="Reconstruction des statistiques vendeur", cle='stats_vendeurs')
                 else:
-                    # No sessions = no commands visible
-                    domain.append(('id', '=', False))
-            
-            Commande = env['pos.caisse.commande'].sudo()
-            commandes = Commande.search(domain, offset=offset, limit=limit, order='date desc')
-            total_count = Commande.search_count(domain)
-            
-            data = []
-            for cmd in commandes:
-                data.append({
-                    'id': cmd.id,
-                    'name': cmd.name,
-                    'date': cmd.date.isoformat() if cmd.date else None,
-                    'client_card': cmd.client_card,
-                    'client_nom': cmd.client_nom,
-                    'type_paiement': cmd.type_paiement,
-                    'total': cmd.total,
-                    'state': cmd.state,
-                    'is_vc': getattr(cmd, 'is_vc', False),
-                    'session_id': cmd.session_id.id if cmd.session_id else None,
-                    'session_name': cmd.session_id.name if cmd.session_id else None,
-                    'user_id': cmd.session_id.user_id.id if cmd.session_id and cmd.session_id.user_id else None,
-                    'user_name': cmd.session_id.user_id.name if cmd.session_id and cmd.session_id.user_id else None,
-                })
-            
-            return {
-                'status': 'success',
-                'data': data,
-                'total': total_count,
-                'offset': offset,
-                'returned': len(data)
-            }
-            
+                    mois = params.get('mois') or ''
+                    if not re.match(r'^\d{4}-\d{2}$', mois):
+                        return {'status': 'error', 'message': 'mois requis (AAAA-MM)'}
+                    job = Job._enfiler('pos.caisse.vente.jour', '_recalculer_mois', arguments={'mois': mois},
+                                       name=f"Ventes du mois {mois}", cle=f'ventes_mois:{mois}')
+            else:
+                return {'status': 'error', 'message': 'type invalide (rapport_vente|stats_vendeurs|ventes_mois)'}
+            return {'status': 'success', 'job': job.sudo()._get_data()}
         except Exception as e:
-            logging.exception("Erreur dans list_commandes")
-            return {'status': 'error', 'message': str(e)}
\ No newline at end of file
+            logging.exception("Erreur dans enfiler_job")
+            return {'status': 'error', 'message': str(e)}
+
+    @http.route('/api/pos_caisse/jobs/<int:job_id>', type='json', auth='user', methods=['GET', 'POST'], csrf=False)
+    @instrumente('/api/pos_caisse/jobs/<id>')
+    def statut_job(self, job_id, **kwargs):
+        """État et progression d'une tâche de fond.
+        Retour: { status, job: {id, name, state: en_attente|en_cours|termine|echec, progression,
+                                tentatives, date_prevue, date_debut, date_fin, message, resultat} }
+        """
+        try:
+            job = request.env['pos.caisse.job'].sudo().browse(job_id).exists()
+            if not job or (not self._is_admin() and job.user_id.id != request.uid):
+                return {'status': 'error', 'message': 'Tâche introuvable'}
+            return {'status': 'success', 'job': job._get_data()}
+        except Exception as e:
+            logging.exception("Erreur dans statut_job")
+            return {'status': 'error', 'message': str(e)}
+
+    @http.route('/api/pos_caisse/metrics', type='http', auth='none', methods=['GET'], csrf=False)
+    def metrics(self, **kwargs):
+        """Métriques de l'API au format texte Prometheus, cumulées sur tous les workers.
+
+        Protégé par le jeton du paramètre pos_caisse.metrics_token
+        (en-tête "Authorization: Bearer <jeton>"); sans jeton configuré, la route est fermée.
+        """
+        jeton = request.env['ir.config_parameter'].sudo().get_param('pos_caisse.metrics_token')
+        if not jeton or request.httprequest.headers.get('Authorization') != f'Bearer {jeton}':
+            return Response("Accès refusé", status=403)
+        collecteur.envoyer(request.db, force=True)
+        corps = request.env['pos.caisse.metrique'].sudo()._exposition()
+        return Response(corps, headers=[('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')])
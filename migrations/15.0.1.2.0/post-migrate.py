@@ -0,0 +1,11 @@
+# Odoo 15.0 migration: initialize the consolidated session totals
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    # Les totaux de session ne sont plus stockés: les colonnes *_consolide (0 à leur
+    # création) sont recalculées une fois depuis les commandes, archives comprises
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['pos.caisse.session.delta']._reconstruire()
+    # Nombre de commandes retiré du cube des ventes (non additif entre types de pain)
+    cr.execute("ALTER TABLE pos_caisse_vente_jour DROP COLUMN IF EXISTS nb_commandes")
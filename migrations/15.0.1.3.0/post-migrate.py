@@ -0,0 +1,11 @@
+# Odoo 15.0 migration: bucket the sales statistics on the local business day
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    # Les statistiques vendeur étaient réparties par jour UTC: une vente du soir (heure
+    # locale) tombait le lendemain, voire le mois suivant. Recalcul par jour local.
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['pos.caisse.vendeur.stat']._reconstruire()
+    # Même découpage pour le cube des ventes journalières
+    env['pos.caisse.vente.jour']._reconstruire()
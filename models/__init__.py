@@ -1 +1,11 @@
+from . import pos_caisse_sync
 from . import pos_caisse
+from . import pos_caisse_archive
+from . import pos_caisse_idempotence
+from . import pos_caisse_stats
+from . import pos_caisse_appareil
+from . import pos_caisse_rapport
+from . import pos_caisse_rapprochement
+from . import pos_caisse_paie
+from . import pos_caisse_metrique
+from . import pos_caisse_job
@@ -1,8 +1,47 @@
-from odoo import models, fields, api
+import odoo
+from odoo import models, fields, api, tools, SUPERUSER_ID
+from odoo.exceptions import UserError
+from odoo.tools.sql import create_index, index_exists
 from datetime import datetime
+import base64
+import json
+import logging
+
+import psycopg2
+
+from .pos_caisse_metrique import chronometrer, collecteur
+from .pos_caisse_stats import ETATS_VENTE
+
+_logger = logging.getLogger(__name__)
+
+# Espace des verrous consultatifs du journal de caisse (clé: session)
+VERROU_JOURNAL = 0x706f7331
+
+
+def create_trigram_index(cr, indexname, tablename, column):
+    """Créer un index GIN pg_trgm pour les recherches `ilike`.
+
+    Ignoré (avec un message) si l'extension pg_trgm ne peut pas être activée sur la base.
+    """
+    if index_exists(cr, indexname):
+        return True
+    try:
+        with cr.savepoint(flush=False):
+            cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cr.execute('CREATE INDEX "%s" ON "%s" USING gin ("%s" gin_trgm_ops)' % (indexname, tablename, column))
+        return True
+    except Exception:
+        _logger.info("Extension pg_trgm indisponible: index %s non créé", indexname)
+        return False
+
+
+def echapper_like(terme):
+    """Échapper les jokers LIKE (%, _ et \\) d'un terme saisi"""
+    return terme.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
 
 class PosVendeur(models.Model):
     _name = 'pos.caisse.vendeur'
+    _inherit = ['pos.caisse.sync.mixin']
     _description = 'Vendeur/Client'
     _order = 'name'
 
@@ -14,25 +53,159 @@ class PosVendeur(models.Model):
     pourcentage_commission = fields.Float('Commission (%)', default=25.0, help="Pourcentage de commission sur les ventes")
     # commandes
     commande_ids = fields.One2many('pos.caisse.commande', 'vendeur_id', string="Commandes")
-    # Statistiques calculées
-    total_commandes = fields.Integer('Nombre de commandes', compute='_compute_stats', store=True)
-    total_ventes = fields.Float('Total des ventes', compute='_compute_stats', store=True)
-    commission_totale = fields.Float('Commission totale', compute='_compute_stats', store=True)
+    # Statistiques calculées (agrégées depuis pos.caisse.vendeur.stat, période optionnelle
+    # via les clés de contexte stats_date_from / stats_date_to)
+    total_commandes = fields.Integer('Nombre de commandes', compute='_compute_stats')
+    total_ventes = fields.Float('Total des ventes', compute='_compute_stats')
+    commission_totale = fields.Float('Commission totale', compute='_compute_stats')
 
     _sql_constraints = [
         ('carte_numero_unique', 'unique(carte_numero)', 'Le numéro de carte doit être unique !'),
         ('pourcentage_valid', 'check(pourcentage_commission >= 0 AND pourcentage_commission <= 100)', 'Le pourcentage doit être entre 0 et 100 !'),
     ]
 
-    @api.depends('carte_numero')
+    def init(self):
+        super().init()
+        # Recherche par carte (préfixe: btree text_pattern_ops) et par nom/carte (ilike, similarité)
+        create_index(self.env.cr, 'pos_caisse_vendeur_carte_prefixe_idx', self._table, ['carte_numero text_pattern_ops'])
+        create_trigram_index(self.env.cr, 'pos_caisse_vendeur_name_trgm_idx', self._table, 'name')
+        create_trigram_index(self.env.cr, 'pos_caisse_vendeur_carte_trgm_idx', self._table, 'carte_numero')
+
+    @api.depends('pourcentage_commission')
+    @api.depends_context('stats_date_from', 'stats_date_to')
+    @chronometrer
     def _compute_stats(self):
-        """Calculer les statistiques de vente pour chaque vendeur"""
+        """Calculer les statistiques de vente pour chaque vendeur (commandes confirmées)"""
+        ctx = self.env.context
+        totaux = self.env['pos.caisse.vendeur.stat']._get_totaux(
+            [vid for vid in self.ids if isinstance(vid, int)],
+            ctx.get('stats_date_from'), ctx.get('stats_date_to'),
+        )
+        for vendeur in self:
+            nb, montant = totaux.get(vendeur.id, (0, 0.0))
+            vendeur.total_commandes = nb
+            vendeur.total_ventes = montant
+            vendeur.commission_totale = montant * (vendeur.pourcentage_commission / 100)
+
+    def _get_statistiques(self, date_from=None, date_to=None):
+        """Statistiques de vente {vendeur_id: {...}} sur une période quelconque"""
+        totaux = self.env['pos.caisse.vendeur.stat']._get_totaux(self.ids, date_from, date_to)
+        result = {}
         for vendeur in self:
-            # Chercher les commandes liées à ce vendeur
-            commandes = self.env['pos.caisse.commande'].search(['|', ('client_card', '=', vendeur.carte_numero), ('vendeur_id', '=', vendeur.id)])
-            vendeur.total_commandes = len(commandes)
-            vendeur.total_ventes = sum(commandes.mapped('total'))
-            vendeur.commission_totale = vendeur.total_ventes * (vendeur.pourcentage_commission / 100)
+            nb, montant = totaux.get(vendeur.id, (0, 0.0))
+            result[vendeur.id] = {
+                'total_commandes': nb,
+                'total_ventes': montant,
+                'commission_totale': montant * (vendeur.pourcentage_commission / 100),
+            }
+        return result
+
+    # Champs dont dépend la résolution carte -> vendeur (invalident le cache)
+    _CHAMPS_RESOLUTION_CARTE = ('carte_numero', 'name', 'active')
+
+    @api.model
+    @tools.ormcache('carte')
+    def _resoudre_carte_cache(self, carte):
+        """(id, nom) du vendeur actif portant cette carte, ou None.
+
+        Mis en cache LRU par processus (cache ormcache du registre) et invalidé sur
+        tous les workers via clear_caches() quand la carte, le nom ou l'état d'un vendeur
+        change, ou à sa suppression. Un None en cache n'est pas fiable (vendeur créé
+        depuis): `_resoudre_carte` relit alors la base.
+        """
+        collecteur.incrementer(self.env.cr.dbname, 'pos_caisse_cache_cartes_misses_total')
+        self.env.cr.execute(
+            "SELECT id, name FROM pos_caisse_vendeur WHERE carte_numero = %s AND active",
+            (carte,),
+        )
+        row = self.env.cr.fetchone()
+        return tuple(row) if row else None
+
+    @api.model
+    def _resoudre_carte(self, carte):
+        """Retourne (id, nom) du vendeur actif de la carte, ou None si inconnue"""
+        if not carte:
+            return None
+        collecteur.incrementer(self.env.cr.dbname, 'pos_caisse_cache_cartes_requests_total')
+        res = self._resoudre_carte_cache(carte)
+        if res is None:
+            # Carte inconnue à la mise en cache: la création ne vide pas le cache
+            res = self._resoudre_cartes([carte]).get(carte)
+        return res
+
+    @api.model
+    def _resoudre_ou_creer_carte(self, carte, nom=None):
+        """Retourne (id, nom) du vendeur de la carte, en le créant s'il n'existe pas"""
+        res = self._resoudre_carte(carte)
+        if res:
+            return res
+        try:
+            with self.env.cr.savepoint():
+                v = self.sudo().create({
+                    'name': nom or f"Carte {carte}",
+                    'carte_numero': carte,
+                    'active': True,
+                })
+            return (v.id, v.name)
+        except Exception:
+            # Création concurrente (ou carte archivée): relire
+            return self._resoudre_carte(carte)
+
+    @api.model
+    def _resoudre_cartes(self, cartes):
+        """{carte: (id, nom)} des vendeurs actifs de `cartes` en une requête (cartes inconnues absentes)"""
+        cartes = list({c for c in cartes if c})
+        if not cartes:
+            return {}
+        self.flush(list(self._CHAMPS_RESOLUTION_CARTE))
+        self.env.cr.execute(
+            "SELECT carte_numero, id, name FROM pos_caisse_vendeur WHERE carte_numero = ANY(%s) AND active",
+            (cartes,),
+        )
+        return {row[0]: (row[1], row[2]) for row in self.env.cr.fetchall()}
+
+    @api.model
+    def _resoudre_ou_creer_cartes(self, noms):
+        """{carte: (id, nom)} pour les cartes de `noms` ({carte: nom proposé}).
+
+        Les cartes sont résolues en une requête et les vendeurs manquants créés en un seul
+        appel. Si ce dernier échoue (création concurrente ou carte archivée), repli carte
+        par carte avec relecture.
+        """
+        resolus = self._resoudre_cartes(noms)
+        manquantes = [c for c in noms if c and c not in resolus]
+        if not manquantes:
+            return resolus
+        try:
+            with self.env.cr.savepoint():
+                vendeurs = self.sudo().create([{
+                    'name': noms[carte] or f"Carte {carte}",
+                    'carte_numero': carte,
+                    'active': True,
+                } for carte in manquantes])
+            resolus.update({v.carte_numero: (v.id, v.name) for v in vendeurs})
+        except Exception:
+            for carte in manquantes:
+                res = self._resoudre_ou_creer_carte(carte, noms[carte])
+                if res:
+                    resolus[carte] = res
+        return resolus
+
+    def write(self, vals):
+        champs = [f for f in self._CHAMPS_RESOLUTION_CARTE if f in vals]
+        avant = self.read(champs) if champs else []
+        result = super().write(vals)
+        # Invalider seulement si une valeur mise en cache change réellement
+        if champs and avant != self.read(champs):
+            self.clear_caches()
+        return result
+
+    def unlink(self):
+        en_cache = any(v.active and v.carte_numero for v in self)
+        result = super().unlink()
+        if en_cache:
+            self.clear_caches()
+        return result
 
     def name_get(self):
         """Affichage personnalisé dans les listes déroulantes"""
@@ -42,12 +215,92 @@ class PosVendeur(models.Model):
             result.append((vendeur.id, name))
         return result
 
+    @api.model
+    @tools.ormcache()
+    def _trigramme_disponible(self):
+        self.env.cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def _rechercher(self, terme, limit=10, avec_solde_bp=False):
+        """Vendeurs actifs correspondant à `terme`, classés en une requête indexée.
+
+        Rang: 0 carte exacte, 1 début de carte, 2 début de nom, 3 carte ou nom contenant
+        le terme, 4 nom approchant (similarité pg_trgm, si l'extension est disponible).
+        Avec `avec_solde_bp`, ajoute le solde des commandes BP non payées de chaque vendeur.
+        Retour: liste de dicts {id, carte_numero, name, pourcentage_commission, rang[, solde_bp, nb_bp]}.
+        """
+        terme = (terme or '').strip()
+        if not terme:
+            return []
+        self.check_access_rights('read')
+        self.flush(['carte_numero', 'name', 'active', 'pourcentage_commission'])
+        trigramme = self._trigramme_disponible()
+        params = {
+            'terme': terme,
+            'prefixe': echapper_like(terme) + '%',
+            'contient': '%' + echapper_like(terme) + '%',
+            'limit': limit,
+        }
+        recherche = f"""
+            SELECT v.id, v.carte_numero, v.name, v.pourcentage_commission,
+                   CASE WHEN v.carte_numero = %(terme)s THEN 0
+                        WHEN v.carte_numero LIKE %(prefixe)s THEN 1
+                        WHEN v.name ILIKE %(prefixe)s THEN 2
+                        WHEN v.carte_numero ILIKE %(contient)s OR v.name ILIKE %(contient)s THEN 3
+                        ELSE 4 END AS rang,
+                   {'similarity(v.name, %(terme)s)' if trigramme else '0'} AS score
+              FROM pos_caisse_vendeur v
+             WHERE v.active
+               AND (v.carte_numero = %(terme)s OR v.carte_numero LIKE %(prefixe)s
+                    OR v.carte_numero ILIKE %(contient)s OR v.name ILIKE %(contient)s
+                    {'OR v.name %% %(terme)s' if trigramme else ''})
+             ORDER BY rang, score DESC, v.name, v.id
+             LIMIT %(limit)s
+        """
+        if avec_solde_bp:
+            self.env['pos.caisse.commande'].flush(['vendeur_id', 'type_paiement', 'paiement_state', 'state', 'total'])
+            params['etats'] = list(ETATS_VENTE)
+            requete = f"""
+                WITH v AS ({recherche})
+                SELECT v.id, v.carte_numero, v.name, v.pourcentage_commission, v.rang,
+                       COALESCE(bp.solde, 0), COALESCE(bp.nb, 0)
+                  FROM v
+                  LEFT JOIN LATERAL (
+                        SELECT SUM(c.total) AS solde, COUNT(*) AS nb
+                          FROM pos_caisse_commande c
+                         WHERE c.vendeur_id = v.id AND c.type_paiement = 'bp'
+                           AND c.paiement_state = 'non_payee' AND c.state = ANY(%(etats)s)
+                       ) bp ON TRUE
+                 ORDER BY v.rang, v.score DESC, v.name, v.id
+            """
+        else:
+            requete = recherche
+        self.env.cr.execute(requete, params)
+        resultats = []
+        for row in self.env.cr.fetchall():
+            vendeur = {
+                'id': row[0],
+                'carte_numero': row[1],
+                'name': row[2],
+                'pourcentage_commission': row[3],
+                'rang': row[4],
+            }
+            if avec_solde_bp:
+                vendeur.update(solde_bp=row[5], nb_bp=row[6])
+            resultats.append(vendeur)
+        return resultats
+
     @api.model
     def name_search(self, name='', args=None, operator='ilike', limit=100):
-        """Recherche par numéro de carte ou nom"""
+        """Recherche par numéro de carte ou nom, classée (voir _rechercher)"""
         if args is None:
             args = []
-        
+
+        if name and operator == 'ilike' and not args and self._context.get('active_test', True):
+            # Cas de l'autocomplétion: recherche classée en une requête
+            ids = [v['id'] for v in self._rechercher(name, limit=limit)]
+            return self.browse(ids).name_get()
         if name:
             # Rechercher par numéro de carte ou nom
             domain = ['|', ('carte_numero', 'ilike', name), ('name', 'ilike', name)]
@@ -58,6 +311,7 @@ class PosVendeur(models.Model):
 
 class TypePain(models.Model):
     _name = 'pos.caisse.type.pain'
+    _inherit = ['pos.caisse.sync.mixin']
     _description = 'Type de pain'
     _order = 'name'
 
@@ -81,6 +335,73 @@ class TypePain(models.Model):
             result.append((pain.id, name))
         return result
 
+    # Colonnes du catalogue servi par /api/pos_caisse/types_pain
+    _CHAMPS_CATALOGUE = ['id', 'name', 'prix', 'poids', 'description', 'active']
+
+    def init(self):
+        super().init()
+        # Version du catalogue: une ligne transactionnelle, lue avec les types de pain dans le
+        # même instantané (un paramètre système viderait les caches du registre à chaque
+        # modification). Reprend après l'ancien paramètre pos_caisse.catalogue_version.
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS pos_caisse_catalogue_version (
+                id integer PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                version integer NOT NULL
+            )
+        """)
+        self.env.cr.execute("""
+            INSERT INTO pos_caisse_catalogue_version (id, version)
+            SELECT 1, COALESCE((SELECT value::integer + 1 FROM ir_config_parameter
+                                 WHERE key = 'pos_caisse.catalogue_version'), 0)
+            ON CONFLICT (id) DO NOTHING
+        """)
+
+    @api.model
+    def _get_catalogue_version(self):
+        """Version du catalogue, incrémentée à chaque création/modification/suppression"""
+        self.env.cr.execute("SELECT version FROM pos_caisse_catalogue_version WHERE id = 1")
+        row = self.env.cr.fetchone()
+        return row[0] if row else 0
+
+    @api.model
+    def _incrementer_catalogue_version(self):
+        # Validée avec la modification: les autres workers ne voient la nouvelle version
+        # qu'avec les nouvelles données, sans vider leurs caches
+        self.env.cr.execute("UPDATE pos_caisse_catalogue_version SET version = version + 1 WHERE id = 1")
+
+    @api.model
+    @tools.ormcache('version', 'actifs_only', 'search', 'limit')
+    def _lire_catalogue(self, version, actifs_only=False, search='', limit=200):
+        """Catalogue sérialisé, mis en cache par version (à ne pas modifier par l'appelant)"""
+        domain = []
+        if actifs_only:
+            domain.append(('active', '=', True))
+        if search:
+            domain = ['|', ('name', 'ilike', search), ('prix', '=', search)] + domain
+        pains = self.sudo().search(domain, order='active desc, name asc', limit=limit)
+        return tuple(pains.read(self._CHAMPS_CATALOGUE))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        pains = super().create(vals_list)
+        self._incrementer_catalogue_version()
+        return pains
+
+    def write(self, vals):
+        result = super().write(vals)
+        self._incrementer_catalogue_version()
+        if 'prix' in vals:
+            # Le prix est répercuté sur les lignes existantes (champ related stocké): les
+            # totaux historiques changent, les agrégats sont reconstruits en une passe
+            self.env['pos.caisse.commande.line'].flush(['prix_unitaire', 'sous_total'])
+            self.env['pos.caisse.commande'].flush(['total'])
+            # Totaux de session, statistiques vendeur et cube en tâche de fond
+            Job = self.env['pos.caisse.job']
+            Job._enfiler('pos.caisse.session.delta', '_reconstruire', name="Reconstruction des totaux de session", cle='totaux_sessions')
+            Job._enfiler('pos.caisse.vendeur.stat', '_reconstruire', name="Reconstruction des statistiques vendeur", cle='stats_vendeurs')
+            Job._enfiler('pos.caisse.vente.jour', '_reconstruire', name="Reconstruction du cube des ventes", cle='ventes_jour')
+        return result
+
     def unlink(self):
         """Archive (active=False) au lieu de supprimer si référencé par des lignes de commande.
 
@@ -96,11 +417,14 @@ class TypePain(models.Model):
             else:
                 to_delete |= rec
         if to_delete:
-            return super(TypePain, to_delete).unlink()
+            result = super(TypePain, to_delete).unlink()
+            self._incrementer_catalogue_version()
+            return result
         return True
 
 class PosSession(models.Model):
     _name = 'pos.caisse.session'
+    _inherit = ['pos.caisse.sync.mixin']
     _description = 'Session de caisse'
     _order = 'date desc'
 
@@ -115,63 +439,157 @@ class PosSession(models.Model):
     commande_ids = fields.One2many('pos.caisse.commande', 'session_id', string='Commandes')
     mouvement_ids = fields.One2many('pos.caisse.mouvement', 'session_id', string='Mouvements de caisse')
     
-    # Champs calculés pour le dashboard
-    total_commandes = fields.Integer('Nombre de commandes', compute='_compute_dashboard_data', store=True)
-    total_montant = fields.Float('Montant total des commandes', compute='_compute_dashboard_data', store=True)
-    total_mouvements = fields.Integer('Nombre de mouvements', compute='_compute_dashboard_data', store=True)
-    montant_en_caisse = fields.Float('Montant en caisse', compute='_compute_montant_caisse', store=True)
-    montant_sortie = fields.Float('Montant des sorties', compute='_compute_montant_caisse', store=True)
-    total_bp = fields.Float('Total des commandes BP', compute='_compute_dashboard_data', store=True)
+    # Champs calculés pour le dashboard (commandes non annulées)
+    total_commandes = fields.Integer('Nombre de commandes', compute='_compute_dashboard_data')
+    total_montant = fields.Float('Montant total des commandes', compute='_compute_dashboard_data')
+    total_mouvements = fields.Integer('Nombre de mouvements', compute='_compute_montant_caisse')
+    montant_en_caisse = fields.Float('Montant en caisse', compute='_compute_montant_caisse')
+    montant_sortie = fields.Float('Montant des sorties', compute='_compute_montant_caisse')
+    total_bp = fields.Float('Total des commandes BP', compute='_compute_dashboard_data')
+    # Totaux consolidés: les commandes ajoutent des lignes pos.caisse.session.delta, repliées
+    # ici par une tâche planifiée (aucune écriture concurrente sur la ligne de session)
+    total_commandes_consolide = fields.Integer('Commandes (consolidé)', readonly=True, copy=False, default=0)
+    total_montant_consolide = fields.Float('Montant (consolidé)', readonly=True, copy=False, default=0.0)
+    total_bp_consolide = fields.Float('Montant BP (consolidé)', readonly=True, copy=False, default=0.0)
+    # Photographie figée à la clôture (JSON): totaux, ventilations et comptage de caisse,
+    # servie à la place des calculs tant que la session reste clôturée
+    snapshot = fields.Text('Photographie de clôture', readonly=True, copy=False)
+    # Commandes et mouvements déplacés dans les tables d'archive (pos.caisse.archive)
+    archivee = fields.Boolean('Archivée', readonly=True, copy=False, index=True)
+    # Rapprochement farine / ventes (pos.caisse.rapprochement)
+    sacs_utilises = fields.Float('Sacs de farine utilisés', help="Sacs réellement consommés pour la production de la session")
     
     def _get_default_session_name(self):
         """Génère automatiquement le nom de session"""
         today = datetime.now().strftime('%Y-%m-%d')
         return f"Session-{today}"
 
-    @api.depends('commande_ids', 'commande_ids.total', 'commande_ids.type_paiement')
+    @chronometrer
     def _compute_dashboard_data(self):
+        photos = {session.id: session._get_snapshot() for session in self}
+        totaux = self.env['pos.caisse.session.delta']._get_totaux(
+            [sid for sid in self.ids if isinstance(sid, int) and not photos[sid]]
+        )
         for session in self:
-            session.total_commandes = len(session.commande_ids)
-            session.total_montant = sum(session.commande_ids.mapped('total'))
+            photo = photos[session.id]
+            if photo and 'totaux_session' in photo:
+                nb, montant, bp = photo['totaux_session']
+            elif photo:
+                # Photographie version 1: totaux du rapport (sans les commandes annulées)
+                nb, montant, bp = photo['nb_commandes'], photo['total_cash'] + photo['total_bp'], photo['total_bp']
+            else:
+                nb, montant, bp = totaux.get(session.id, (0, 0.0, 0.0))
+            session.total_commandes = nb
+            session.total_montant = montant
             # Total des commandes BP (payées à la fin du mois)
-            session.total_bp = sum(session.commande_ids.filtered(lambda c: c.type_paiement == 'bp').mapped('total'))
+            session.total_bp = bp
 
-    @api.depends('mouvement_ids', 'mouvement_ids.montant', 'mouvement_ids.type')
+    @chronometrer
     def _compute_montant_caisse(self):
+        """Lire le dernier mouvement du journal de chaque session (solde courant)"""
+        photos = {session.id: session._get_snapshot() for session in self}
+        soldes = self.env['pos.caisse.mouvement']._get_derniers_soldes(
+            [sid for sid in self.ids if isinstance(sid, int) and not photos[sid]]
+        )
         for session in self:
-            entrees = sum(session.mouvement_ids.filtered(lambda m: m.type == 'entree').mapped('montant'))
-            sorties = sum(session.mouvement_ids.filtered(lambda m: m.type == 'sortie').mapped('montant'))
-            session.montant_en_caisse = entrees - sorties
-            session.montant_sortie = sorties
-            session.total_mouvements = len(session.mouvement_ids)
+            solde = photos[session.id]['caisse'] if photos[session.id] else soldes.get(session.id, {})
+            session.montant_en_caisse = solde.get('solde', 0.0)
+            session.montant_sortie = solde.get('cumul_sorties', 0.0)
+            session.total_mouvements = solde.get('sequence', 0)
+
+    def _get_snapshot(self):
+        """Photographie de clôture décodée, ou None si la session n'est pas figée"""
+        self.ensure_one()
+        if self.state != 'ferme' or not self.snapshot:
+            return None
+        return json.loads(self.snapshot)
+
+    def _figer(self):
+        """Écrire la photographie de clôture: données du rapport de vente (totaux, ventilation
+        par type de pain, par type de paiement et par vendeur, sorties) et comptage de caisse"""
+        rapports = self.env['report.pos_caisse.rapport_vente_session_template']._get_donnees(self.ids)
+        soldes = self.env['pos.caisse.mouvement']._get_derniers_soldes(self.ids)
+        totaux = self.env['pos.caisse.session.delta']._get_totaux(self.ids)
+        for session in self:
+            photo = dict(rapports[session.id], version=2, caisse=soldes.get(session.id, {}),
+                         totaux_session=totaux.get(session.id, (0, 0.0, 0.0)))
+            photo['date_snapshot'] = fields.Datetime.now()
+            session.snapshot = json.dumps(photo, default=fields.Datetime.to_string)
+
+    def get_solde_a(self, moment):
+        """Montant en caisse à un instant donné"""
+        self.ensure_one()
+        return self.env['pos.caisse.mouvement']._solde_a(self.id, moment)
+
+    def get_solde_entre(self, debut, fin):
+        """Soldes, entrées et sorties de caisse entre deux instants"""
+        self.ensure_one()
+        return self.env['pos.caisse.mouvement']._solde_entre(self.id, debut, fin)
+
+    def _marquer_modifiee(self):
+        """Avancer write_date des sessions clôturées dont les données changent après coup
+        (commande tardive, réouverture, archivage): c'est la clé des rapprochements mis en
+        cache (pos.caisse.rapprochement). Horloge réelle: deux modifications d'une même
+        transaction donnent deux clés différentes."""
+        fermees = self.filtered(lambda s: s.state == 'ferme')
+        if not fermees:
+            return
+        fermees.flush()
+        self.env.cr.execute(
+            "UPDATE pos_caisse_session SET write_date = clock_timestamp() AT TIME ZONE 'UTC' WHERE id = ANY(%s)",
+            (fermees.ids,),
+        )
+        fermees.invalidate_cache(['write_date'])
 
     def action_open_session(self):
-        """Ouvrir une session fermée"""
+        """Ouvrir une session fermée (la photographie de clôture est invalidée)"""
         self.ensure_one()
+        if self.archivee:
+            raise UserError("Une session archivée ne peut pas être rouverte.")
+        self._marquer_modifiee()
         self.state = 'ouvert'
         self.date_cloture = False
+        self.snapshot = False
         return True
 
     def action_close_session(self):
-        """Fermer une session ouverte"""
+        """Fermer une session ouverte et figer ses totaux"""
         self.ensure_one()
         self.state = 'ferme'
         self.date_cloture = fields.Datetime.now()
+        self._figer()
         return True
 
     def action_print_rapport_vente(self):
         """Imprimer le rapport de vente de fin de session"""
         self.ensure_one()
-        return {
-            'type': 'ir.actions.report',
-            'report_name': 'pos_caisse.rapport_vente_session',
-            'report_type': 'qweb-pdf',
-            'data': {'session_id': self.id},
-            'context': self.env.context,
-        }
+        return self.env.ref('pos_caisse.action_rapport_vente_session').report_action(self)
+
+    def action_generer_rapport_vente(self):
+        """Générer le rapport de vente en tâche de fond. Retour: la tâche (pos.caisse.job)"""
+        return self.env['pos.caisse.job']._enfiler(
+            self._name, '_job_rapport_vente', res_ids=self.ids,
+            name=f"Rapport de vente {', '.join(self.mapped('name'))}",
+            cle=f"rapport_vente:{','.join(map(str, sorted(self.ids)))}", priorite=5,
+        )
+
+    def _job_rapport_vente(self):
+        """Rendre le PDF du rapport de vente et l'attacher à la (première) session"""
+        pdf, _format = self.env.ref('pos_caisse.action_rapport_vente_session')._render_qweb_pdf(self.ids)
+        self.env['pos.caisse.job']._progression(90.0)
+        attachment = self.env['ir.attachment'].create({
+            'name': f"Rapport de vente {', '.join(self.mapped('name'))}.pdf",
+            'type': 'binary',
+            'datas': base64.b64encode(pdf),
+            'mimetype': 'application/pdf',
+            'res_model': self._name,
+            'res_id': self[:1].id,
+        })
+        return {'attachment_id': attachment.id, 'url': f'/web/content/{attachment.id}?download=true'}
 
 class PosCommande(models.Model):
     _name = 'pos.caisse.commande'
+    _inherit = ['pos.caisse.sync.mixin']
     _description = 'Commande de caisse'
     _order = 'date desc'
 
@@ -186,7 +604,7 @@ class PosCommande(models.Model):
         help="Sélectionner le vendeur",
         ondelete='set null',  # Don't block deletion of vendeur; keep historical orders with card/name
     )
-    client_card = fields.Char('Numéro de carte client', help="Identifiant principal du client/vendeur")
+    client_card = fields.Char('Numéro de carte client', index=True, help="Identifiant principal du client/vendeur")
     client_name = fields.Char('Nom du client', help="Nom complet du client/vendeur")
     
     type_paiement = fields.Selection([
@@ -210,12 +628,144 @@ class PosCommande(models.Model):
     ], default='non_payee', string='État du paiement')
 
     mouvement_id = fields.Many2one('pos.caisse.mouvement', string='Mouvement de caisse associé')
-    idempotency_key = fields.Char('Clé d\'idempotence', help="Clé unique pour éviter les doublons de commande")
+    idempotency_key = fields.Char('Clé d\'idempotence', index=True, help="Clé unique pour éviter les doublons de commande")
+
+    # Expressions SQL des colonnes lisibles par _lire_liste (liste des commandes de l'API mobile)
+    _COLONNES_LISTE = {
+        'id': 'c.id',
+        'name': 'c.name',
+        'date': 'c.date',
+        'client_card': 'c.client_card',
+        'client_name': 'c.client_name',
+        'client_nom': 'c.client_name',  # alias historique de client_name
+        'vendeur_id': 'c.vendeur_id',
+        'type_paiement': 'c.type_paiement',
+        'total': 'c.total',
+        'state': 'c.state',
+        'paiement_state': 'c.paiement_state',
+        'is_vc': 'COALESCE(c.is_vc, false)',
+        'mouvement_id': 'c.mouvement_id',
+        'idempotency_key': 'c.idempotency_key',
+        'session_id': 'c.session_id',
+        'session_name': 's.name',
+        'user_id': 's.user_id',
+        'user_name': 'p.name',
+    }
+
+    # Champs dont la modification change les agrégats incrémentaux (statistiques vendeur, totaux de session, cube des ventes)
+    _CHAMPS_STATISTIQUES = ('vendeur_id', 'client_card', 'date', 'state', 'line_ids', 'session_id', 'type_paiement', 'is_vc')
+
+    def init(self):
+        super().init()
+        # Pagination par curseur (date, id) et recherche ilike sur le client
+        create_index(self.env.cr, 'pos_caisse_commande_date_id_idx', self._table, ['date DESC', 'id DESC'])
+        create_trigram_index(self.env.cr, 'pos_caisse_commande_client_name_trgm_idx', self._table, 'client_name')
+        create_trigram_index(self.env.cr, 'pos_caisse_commande_client_card_trgm_idx', self._table, 'client_card')
+        # Numéros uniques (numéros pré-attribués par les appareils); ignoré tant que des doublons existent
+        if not index_exists(self.env.cr, 'pos_caisse_commande_name_uniq'):
+            try:
+                with self.env.cr.savepoint():
+                    self.env.cr.execute("""
+                        CREATE UNIQUE INDEX pos_caisse_commande_name_uniq ON pos_caisse_commande (name)
+                         WHERE name IS NOT NULL AND name != '/'
+                    """)
+            except psycopg2.IntegrityError:
+                _logger.warning("Numéros de commande en double: index unique pos_caisse_commande_name_uniq non créé")
+        # Solde BP ouvert par vendeur (recherche de vendeur de l'API)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS pos_caisse_commande_bp_ouvert_idx ON pos_caisse_commande (vendeur_id)
+             WHERE type_paiement = 'bp' AND paiement_state = 'non_payee'
+        """)
+
+    def _lire_liste(self, ids, champs):
+        """Lire les colonnes `champs` des commandes `ids` en une requête jointe (session, caissier).
+
+        Retour: liste de tuples (date, id, *champs) triés par (date, id) décroissants.
+        """
+        if not ids:
+            return []
+        self.flush()
+        colonnes = ', '.join(self._COLONNES_LISTE[f] for f in champs)
+        self.env.cr.execute("""
+            SELECT c.date, c.id, """ + colonnes + """
+              FROM pos_caisse_commande c
+              LEFT JOIN pos_caisse_session s ON s.id = c.session_id
+              LEFT JOIN res_users u ON u.id = s.user_id
+              LEFT JOIN res_partner p ON p.id = u.partner_id
+             WHERE c.id = ANY(%s)
+             ORDER BY c.date DESC, c.id DESC
+        """, (list(ids),))
+        return self.env.cr.fetchall()
+
+    # Colonnes de l'export commandes + lignes (/api/pos_caisse/commandes/export)
+    _CHAMPS_EXPORT = (
+        'id', 'name', 'date', 'session_name', 'user_name', 'client_card', 'client_name',
+        'type_paiement', 'is_vc', 'state', 'total',
+    )
+    _COLONNES_EXPORT_LIGNES = {
+        'ligne_id': 'l.id',
+        'type_pain': 'tp.name',
+        'quantite': 'l.quantite',
+        'prix_unitaire': 'l.prix_unitaire',
+        'poids_total': 'l.poids_total',
+        'sous_total': 'l.sous_total',
+    }
+
+    @api.model
+    def _requete_export(self, date_from, date_to, session_id=None, user_id=None):
+        """Requête (sql, params) de l'export: une ligne par ligne de commande (commandes sans
+        ligne incluses), triée par (date, id). Colonnes: _CHAMPS_EXPORT + _COLONNES_EXPORT_LIGNES.
+        """
+        colonnes = [self._COLONNES_LISTE[f] for f in self._CHAMPS_EXPORT] + list(self._COLONNES_EXPORT_LIGNES.values())
+        where, params = ["c.date >= %s", "c.date <= %s"], [date_from, date_to]
+        if session_id:
+            where.append("c.session_id = %s")
+            params.append(session_id)
+        if user_id:
+            where.append("s.user_id = %s")
+            params.append(user_id)
+        query = """
+            SELECT """ + ', '.join(colonnes) + """
+              FROM pos_caisse_commande_historique c
+              LEFT JOIN pos_caisse_session s ON s.id = c.session_id
+              LEFT JOIN res_users u ON u.id = s.user_id
+              LEFT JOIN res_partner p ON p.id = u.partner_id
+              LEFT JOIN pos_caisse_commande_line_historique l ON l.commande_id = c.id
+              LEFT JOIN pos_caisse_type_pain tp ON tp.id = l.type_pain_id
+             WHERE """ + ' AND '.join(where) + """
+             ORDER BY c.date, c.id, l.id
+        """
+        return query, params
 
     def _get_sequence(self):
         """Génère le numéro de séquence pour la commande"""
         return self.env['ir.sequence'].next_by_code('pos.caisse.commande') or '/'
 
+    def _etat_statistiques(self):
+        """Photographie des champs qui alimentent les agrégats incrémentaux"""
+        return {
+            c.id: {
+                'vendeur_id': c.vendeur_id.id,
+                'session_id': c.session_id.id,
+                'date': c.date,
+                'state': c.state,
+                'type_paiement': c.type_paiement,
+                'total': c.total,
+            }
+            for c in self
+        }
+
+    def _appliquer_deltas_statistiques(self, avant, apres=None):
+        """Reporter dans les agrégats la différence entre `avant` et l'état courant (ou `apres`)"""
+        if apres is None:
+            apres = self.exists()._etat_statistiques()
+        self.env['pos.caisse.vendeur.stat'].sudo()._appliquer_deltas(avant, apres)
+        self.env['pos.caisse.session.delta'].sudo()._appliquer_deltas(avant, apres)
+        self.env['pos.caisse.vente.jour'].sudo()._marquer(avant, apres)
+        # Modification tardive d'une session clôturée (même à totaux inchangés: type de pain)
+        session_ids = {etat['session_id'] for photo in (avant, apres) for etat in photo.values() if etat['session_id']}
+        self.env['pos.caisse.session'].sudo().browse(session_ids)._marquer_modifiee()
+
     @api.depends('line_ids.sous_total')
     def _compute_total(self):
         for commande in self:
@@ -234,67 +784,60 @@ class PosCommande(models.Model):
         """Autocomplétion du nom quand on saisit le numéro de carte"""
         if self.client_card:
             # Chercher le vendeur correspondant
-            vendeur = self.env['pos.caisse.vendeur'].search([
-                ('carte_numero', '=', self.client_card)
-            ], limit=1)
+            vendeur = self.env['pos.caisse.vendeur']._resoudre_carte(self.client_card)
             
             if vendeur:
-                self.client_name = vendeur.name
-                self.vendeur_id = vendeur.id
+                self.client_name = vendeur[1]
+                self.vendeur_id = vendeur[0]
             else:
                 # Si le vendeur n'existe pas, vider le nom et proposer de créer
                 self.client_name = ''
                 self.vendeur_id = False
 
     @api.model
-    def create(self, vals):
-        """Enforce vendor linkage and auto-create vendor by card if missing.
+    def _lier_vendeurs(self, vals_list):
+        """Compléter vendeur_id (et client_name) des vals portant une carte sans vendeur.
 
-        - If a client card is provided and no vendeur_id, try to link to existing vendor.
-        - If not found, create a new pos.caisse.vendeur with the provided card and name, then link it.
+        Les cartes distinctes sont résolues en une requête et les vendeurs manquants créés
+        en un seul appel (pos.caisse.vendeur._resoudre_ou_creer_cartes).
         """
-        card = vals.get('client_card')
-        if card and not vals.get('vendeur_id'):
-            Vendeur = self.env['pos.caisse.vendeur'].sudo()
-            v = Vendeur.search([('carte_numero', '=', card)], limit=1)
-            if not v:
-                # Create vendor automatically if it doesn't exist
-                name = vals.get('client_name') or f"Carte {card}"
-                try:
-                    v = Vendeur.create({
-                        'name': name,
-                        'carte_numero': card,
-                        'active': True,
-                    })
-                except Exception:
-                    # Handle rare race: if created concurrently, fetch it
-                    v = Vendeur.search([('carte_numero', '=', card)], limit=1)
+        noms = {}
+        for vals in vals_list:
+            card = vals.get('client_card')
+            if card and not vals.get('vendeur_id') and not noms.get(card):
+                noms[card] = vals.get('client_name')
+        if not noms:
+            return
+        vendeurs = self.env['pos.caisse.vendeur']._resoudre_ou_creer_cartes(noms)
+        for vals in vals_list:
+            v = vendeurs.get(vals.get('client_card')) if not vals.get('vendeur_id') else None
             if v:
-                vals['vendeur_id'] = v.id
+                vals['vendeur_id'] = v[0]
                 if not vals.get('client_name'):
-                    vals['client_name'] = v.name
-        return super().create(vals)
+                    vals['client_name'] = v[1]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Link each order to the vendor of its card, creating the vendor if missing"""
+        self._lier_vendeurs(vals_list)
+        # Les lignes créées avec les commandes ne reportent pas leurs propres deltas
+        commandes = super(PosCommande, self.with_context(pos_caisse_deltas_differes=True)).create(vals_list)
+        commandes = self.browse(commandes.ids)
+        commandes._appliquer_deltas_statistiques({})
+        return commandes
 
     def write(self, vals):
         """Auto-link vendor on client_card change and update mouvement on total change"""
         # If the client card is updated and no vendeur_id provided, link/create vendor
         if vals.get('client_card') and not vals.get('vendeur_id'):
-            card = vals.get('client_card')
-            if card:
-                Vendeur = self.env['pos.caisse.vendeur'].sudo()
-                v = Vendeur.search([('carte_numero', '=', card)], limit=1)
-                if not v:
-                    name = vals.get('client_name') or f"Carte {card}"
-                    try:
-                        v = Vendeur.create({'name': name, 'carte_numero': card, 'active': True})
-                    except Exception:
-                        v = Vendeur.search([('carte_numero', '=', card)], limit=1)
-                if v:
-                    vals['vendeur_id'] = v.id
-                    if not vals.get('client_name'):
-                        vals['client_name'] = v.name
+            vals = dict(vals)
+            self._lier_vendeurs([vals])
 
-        result = super().write(vals)
+        suivi = any(f in vals for f in self._CHAMPS_STATISTIQUES)
+        avant = self._etat_statistiques() if suivi else None
+        result = super(PosCommande, self.with_context(pos_caisse_deltas_differes=True)).write(vals)
+        if suivi:
+            self._appliquer_deltas_statistiques(avant)
         for commande in self:
             if commande.mouvement_id and 'total' in vals:
                 # Mettre à jour le montant du mouvement existant
@@ -303,27 +846,54 @@ class PosCommande(models.Model):
         return result
 
     def action_confirmer(self):
-        """Confirmer la commande et créer le mouvement de caisse"""
-        for commande in self:
-            if commande.state == 'draft':
-                commande.state = 'confirme'
-                
-                # Créer le mouvement de caisse pour les commandes Cash
-                if commande.type_paiement == 'cash' and not commande.mouvement_id:
-                    mouvement = self.env['pos.caisse.mouvement'].create({
-                        'session_id': commande.session_id.id,
-                        'type': 'entree',
-                        'montant': commande.total,
-                        'motif': f'Commande {commande.name} - Client: {commande.client_name}',
-                        'commande_id': commande.id,
-                    })
-                    commande.mouvement_id = mouvement.id
-                
-                # Passer automatiquement en attente de livraison
-                commande.state = 'en_attente_livraison'
-        
+        """Confirmer les commandes brouillon et créer les mouvements de caisse des commandes Cash.
+
+        Traitement groupé: une écriture d'état pour toutes les commandes, les mouvements créés
+        en un appel (journal et totaux recalculés une fois par session), puis les liens
+        commande -> mouvement posés en une requête.
+        """
+        commandes = self.filtered(lambda c: c.state == 'draft')
+        if not commandes:
+            return True
+        # Passage direct en attente de livraison (l'état confirmé n'était qu'intermédiaire)
+        commandes.write({'state': 'en_attente_livraison'})
+
+        cash = commandes.filtered(lambda c: c.type_paiement == 'cash' and not c.mouvement_id)
+        if cash:
+            mouvements = self.env['pos.caisse.mouvement'].create([{
+                'session_id': commande.session_id.id,
+                'type': 'entree',
+                'montant': commande.total,
+                'motif': f'Commande {commande.name} - Client: {commande.client_name}',
+                'commande_id': commande.id,
+            } for commande in cash])
+            self.env.cr.execute("""
+                UPDATE pos_caisse_commande AS c
+                   SET mouvement_id = m.mouvement_id, write_uid = %s, write_date = %s
+                  FROM unnest(%s::int[], %s::int[]) AS m(commande_id, mouvement_id)
+                 WHERE c.id = m.commande_id
+            """, (self.env.uid, fields.Datetime.now(), cash.ids, mouvements.ids))
+            cash.invalidate_cache(['mouvement_id', 'write_uid', 'write_date'])
         return True
 
+    @api.model
+    def confirmer_ids(self, ids):
+        """Confirmer les commandes `ids` en un traitement groupé.
+
+        Retour: {confirmees: [ids], ignorees: [{id, raison}]} (commande introuvable ou déjà confirmée)
+        """
+        ids = list(dict.fromkeys(ids))
+        commandes = self.browse(ids).exists()
+        introuvables = set(ids) - set(commandes.ids)
+        deja = commandes.filtered(lambda c: c.state != 'draft')
+        a_confirmer = commandes - deja
+        a_confirmer.action_confirmer()
+        return {
+            'confirmees': a_confirmer.ids,
+            'ignorees': [{'id': i, 'raison': 'introuvable'} for i in ids if i in introuvables]
+                        + [{'id': c.id, 'raison': f'etat {c.state}'} for c in deja],
+        }
+
     def action_annuler(self):
         """Annuler la commande et supprimer le mouvement de caisse associé"""
         for commande in self:
@@ -332,6 +902,12 @@ class PosCommande(models.Model):
             commande.state = 'annule'
         return True
 
+    def unlink(self):
+        avant = self._etat_statistiques()
+        result = super(PosCommande, self.with_context(pos_caisse_deltas_differes=True)).unlink()
+        self._appliquer_deltas_statistiques(avant, apres={})
+        return result
+
 class PosCommandeLine(models.Model):
     _name = 'pos.caisse.commande.line'
     _description = 'Ligne de commande'
@@ -344,6 +920,42 @@ class PosCommandeLine(models.Model):
     poids_total = fields.Float('Poids total (g)', compute='_compute_poids_total', store=True)
     sous_total = fields.Float('Sous-total', compute='_compute_sous_total', store=True)  
 
+    # Champs qui modifient le total de la commande parente
+    _CHAMPS_TOTAL = ('commande_id', 'type_pain_id', 'quantite', 'prix_unitaire')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Reporter le nouveau total des commandes parentes dans les agrégats"""
+        if self.env.context.get('pos_caisse_deltas_differes'):
+            return super().create(vals_list)
+        commandes = self.env['pos.caisse.commande'].browse(
+            {vals['commande_id'] for vals in vals_list if vals.get('commande_id')}
+        )
+        avant = commandes._etat_statistiques()
+        lines = super().create(vals_list)
+        commandes._appliquer_deltas_statistiques(avant)
+        return lines
+
+    def write(self, vals):
+        if self.env.context.get('pos_caisse_deltas_differes') or not any(f in vals for f in self._CHAMPS_TOTAL):
+            return super().write(vals)
+        commandes = self.commande_id
+        if vals.get('commande_id'):
+            commandes |= commandes.browse(vals['commande_id'])
+        avant = commandes._etat_statistiques()
+        result = super().write(vals)
+        commandes._appliquer_deltas_statistiques(avant)
+        return result
+
+    def unlink(self):
+        if self.env.context.get('pos_caisse_deltas_differes'):
+            return super().unlink()
+        commandes = self.commande_id
+        avant = commandes._etat_statistiques()
+        result = super().unlink()
+        commandes._appliquer_deltas_statistiques(avant)
+        return result
+
 
     @api.depends('quantite', 'poids_unitaire')
     def _compute_poids_total(self):
@@ -374,6 +986,7 @@ class PosCommandeLine(models.Model):
 
 class PosMouvement(models.Model):
     _name = 'pos.caisse.mouvement'
+    _inherit = ['pos.caisse.sync.mixin']
     _description = 'Mouvement de caisse'
     _order = 'date desc'
 
@@ -392,6 +1005,189 @@ class PosMouvement(models.Model):
     paie_vendeur_id = fields.Many2one('pos.paie.vendeur', string='Paie Vendeur liée')
     paie_wizard_id = fields.Many2one('pos.paie.wizard', string='Paie Wizard liée')
 
+    # Journal de caisse: position et cumuls dans l'ordre (date, id) de la session,
+    # tenus à jour en SQL à chaque écriture
+    sequence = fields.Integer('Position', readonly=True, copy=False)
+    cumul_entrees = fields.Float('Cumul des entrées', readonly=True, copy=False)
+    cumul_sorties = fields.Float('Cumul des sorties', readonly=True, copy=False)
+    solde = fields.Float('Solde après mouvement', readonly=True, copy=False)
+
+    # Champs qui déplacent le mouvement dans le journal ou en changent le montant signé
+    _CHAMPS_JOURNAL = ('session_id', 'date', 'type', 'montant')
+
+    def init(self):
+        super().init()
+        create_index(self.env.cr, 'pos_caisse_mouvement_journal_idx', self._table, ['session_id', 'date', 'id'])
+        # Mouvements antérieurs au journal: numérotation complète de leurs sessions
+        self.env.cr.execute("SELECT DISTINCT session_id FROM pos_caisse_mouvement WHERE sequence IS NULL")
+        session_ids = [row[0] for row in self.env.cr.fetchall()]
+        if session_ids:
+            self._journal_synchroniser({sid: (datetime.min, 0) for sid in session_ids}, verrouiller=False)
+
+    @api.model
+    def _journal_synchroniser(self, points, verrouiller=True):
+        """Recalculer position, cumuls et solde à partir d'un point du journal.
+
+        `points` est un dict {session_id: (date, id)}: seuls les mouvements situés à ce point
+        ou après sont renumérotés, en repartant des cumuls du mouvement précédent. Un ajout en
+        fin de journal ne touche donc que les nouvelles lignes (recherche indexée du précédent).
+
+        Les écritures d'une même session sont sérialisées sans toucher la ligne de session:
+        verrou consultatif par session, puis réécriture du mouvement précédent, qui fait échouer
+        (et rejouer par Odoo) une transaction dont l'instantané ne le voyait pas à jour.
+        """
+        if not points:
+            return
+        self.flush()
+        session_ids = sorted(points)
+        if verrouiller:
+            self._journal_verrouiller(session_ids, points)
+        self.env.cr.execute("""
+            WITH pts AS (
+                SELECT * FROM unnest(%(sessions)s::int[], %(dates)s::timestamp[], %(ids)s::int[])
+                         AS p(session_id, date, id)
+            ), prev AS (
+                SELECT p.session_id, m.sequence, m.cumul_entrees, m.cumul_sorties
+                  FROM pts p
+                  LEFT JOIN LATERAL (
+                        SELECT sequence, cumul_entrees, cumul_sorties
+                          FROM pos_caisse_mouvement m
+                         WHERE m.session_id = p.session_id AND (m.date, m.id) < (p.date, p.id)
+                         ORDER BY m.date DESC, m.id DESC
+                         LIMIT 1
+                       ) m ON TRUE
+            ), tail AS (
+                SELECT m.id, m.session_id,
+                       ROW_NUMBER() OVER w AS rn,
+                       SUM(CASE WHEN m.type = 'entree' THEN m.montant ELSE 0 END) OVER w AS e,
+                       SUM(CASE WHEN m.type = 'sortie' THEN m.montant ELSE 0 END) OVER w AS s
+                  FROM pos_caisse_mouvement m
+                  JOIN pts p ON p.session_id = m.session_id AND (m.date, m.id) >= (p.date, p.id)
+                WINDOW w AS (PARTITION BY m.session_id ORDER BY m.date, m.id)
+            )
+            UPDATE pos_caisse_mouvement m
+               SET sequence = COALESCE(prev.sequence, 0) + tail.rn,
+                   cumul_entrees = COALESCE(prev.cumul_entrees, 0) + tail.e,
+                   cumul_sorties = COALESCE(prev.cumul_sorties, 0) + tail.s,
+                   solde = COALESCE(prev.cumul_entrees, 0) + tail.e - COALESCE(prev.cumul_sorties, 0) - tail.s
+              FROM tail
+              JOIN prev ON prev.session_id = tail.session_id
+             WHERE m.id = tail.id
+        """, {
+            'sessions': session_ids,
+            'dates': [points[sid][0] for sid in session_ids],
+            'ids': [points[sid][1] for sid in session_ids],
+        })
+        self.invalidate_cache(['sequence', 'cumul_entrees', 'cumul_sorties', 'solde'])
+        self.env['pos.caisse.session'].invalidate_cache(
+            ['montant_en_caisse', 'montant_sortie', 'total_mouvements'], session_ids
+        )
+
+    @api.model
+    def _journal_verrouiller(self, session_ids, points):
+        self.env.cr.execute("""
+            SELECT pg_advisory_xact_lock(%s, s.id) FROM (SELECT unnest(%s::int[]) AS id ORDER BY 1) s
+        """, (VERROU_JOURNAL, session_ids))
+        self.env.cr.execute("""
+            UPDATE pos_caisse_mouvement m
+               SET sequence = m.sequence
+              FROM unnest(%s::int[], %s::timestamp[], %s::int[]) AS p(session_id, date, id)
+             WHERE m.id = (SELECT id FROM pos_caisse_mouvement
+                            WHERE session_id = p.session_id AND (date, id) < (p.date, p.id)
+                            ORDER BY date DESC, id DESC
+                            LIMIT 1)
+            RETURNING m.session_id
+        """, (session_ids, [points[sid][0] for sid in session_ids], [points[sid][1] for sid in session_ids]))
+        sans_precedent = set(session_ids) - {row[0] for row in self.env.cr.fetchall()}
+        if sans_precedent:
+            # Aucun mouvement précédent à réécrire (début de journal): un premier mouvement
+            # validé en parallèle reste invisible ici, le journal est vérifié après validation
+            dbname = self.env.cr.dbname
+            self.env.cr.postcommit.add(lambda: self._journal_verifier(dbname, sorted(sans_precedent)))
+
+    @api.model
+    def _journal_verifier(self, dbname, session_ids):
+        """Renuméroter les sessions dont le journal validé est incohérent (positions en double
+        ou manquantes après deux débuts de journal concurrents)"""
+        with odoo.registry(dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            cr.execute("""
+                SELECT pg_advisory_xact_lock(%s, s.id) FROM (SELECT unnest(%s::int[]) AS id ORDER BY 1) s
+            """, (VERROU_JOURNAL, session_ids))
+            cr.execute("""
+                SELECT session_id FROM pos_caisse_mouvement
+                 WHERE session_id = ANY(%s)
+                 GROUP BY session_id
+                HAVING COUNT(*) <> COUNT(DISTINCT sequence) OR MAX(sequence) <> COUNT(*)
+            """, (session_ids,))
+            incoherentes = [row[0] for row in cr.fetchall()]
+            if incoherentes:
+                _logger.info("Journal de caisse renuméroté pour les sessions %s", incoherentes)
+                env['pos.caisse.mouvement']._journal_synchroniser(
+                    {sid: (datetime.min, 0) for sid in incoherentes}, verrouiller=False,
+                )
+
+    def _journal_points(self):
+        """{session_id: (date, id)} du premier mouvement de `self` dans chaque session"""
+        points = {}
+        for mouvement in self:
+            point = (mouvement.date, mouvement.id)
+            sid = mouvement.session_id.id
+            if sid and (sid not in points or point < points[sid]):
+                points[sid] = point
+        return points
+
+    @api.model
+    def _get_derniers_soldes(self, session_ids):
+        """{session_id: {sequence, solde, cumul_entrees, cumul_sorties}} du dernier mouvement"""
+        if not session_ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (session_id) session_id, sequence, solde, cumul_entrees, cumul_sorties
+              FROM pos_caisse_mouvement
+             WHERE session_id = ANY(%s)
+             ORDER BY session_id, date DESC, id DESC
+        """, (list(session_ids),))
+        return {
+            row[0]: {'sequence': row[1] or 0, 'solde': row[2] or 0.0, 'cumul_entrees': row[3] or 0.0, 'cumul_sorties': row[4] or 0.0}
+            for row in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _solde_a(self, session_id, moment, inclus=True):
+        """État du journal à `moment` (recherche indexée du dernier mouvement antérieur)"""
+        self.flush(['session_id', 'date'])
+        self.env.cr.execute("""
+            SELECT sequence, solde, cumul_entrees, cumul_sorties
+              FROM pos_caisse_mouvement
+             WHERE session_id = %s AND date """ + ('<=' if inclus else '<') + """ %s
+             ORDER BY date DESC, id DESC
+             LIMIT 1
+        """, (session_id, moment))
+        row = self.env.cr.fetchone() or (0, 0.0, 0.0, 0.0)
+        return {
+            'date': moment,
+            'nb_mouvements': row[0] or 0,
+            'solde': row[1] or 0.0,
+            'cumul_entrees': row[2] or 0.0,
+            'cumul_sorties': row[3] or 0.0,
+        }
+
+    @api.model
+    def _solde_entre(self, session_id, debut, fin):
+        """Soldes de début/fin et mouvements de la période [debut, fin] par différence de cumuls"""
+        avant = self._solde_a(session_id, debut, inclus=False)
+        apres = self._solde_a(session_id, fin)
+        return {
+            'debut': debut,
+            'fin': fin,
+            'solde_debut': avant['solde'],
+            'solde_fin': apres['solde'],
+            'entrees': apres['cumul_entrees'] - avant['cumul_entrees'],
+            'sorties': apres['cumul_sorties'] - avant['cumul_sorties'],
+            'nb_mouvements': apres['nb_mouvements'] - avant['nb_mouvements'],
+        }
+
     @api.constrains('montant')
     def _check_montant_positif(self):
         """Vérifier que le montant est positif"""
@@ -406,39 +1202,61 @@ class PosMouvement(models.Model):
             if mouvement.session_id.state == 'ferme':
                 raise ValueError("Impossible de créer un mouvement sur une session fermée.")
 
-    @api.model
-    def create(self, vals):
-        """Validation lors de la création et confirmation automatique des paies"""
-        # Valider que le motif est renseigné pour les sorties
-        if vals.get('type') == 'sortie' and not vals.get('motif'):
-            raise ValueError("Le motif est obligatoire pour les sorties de caisse.")
-        
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Validation lors de la création, tenue du journal et confirmation automatique des paies"""
         # Récupérer les IDs de paie depuis le contexte si présents
         ctx = self.env.context or {}
         paie_vendeur_id = ctx.get('default_paie_vendeur_id')
         paie_wizard_id = ctx.get('default_paie_wizard_id')
-        
-        if paie_vendeur_id:
-            vals['paie_vendeur_id'] = paie_vendeur_id
-        if paie_wizard_id:
-            vals['paie_wizard_id'] = paie_wizard_id
-        
-        mouvement = super().create(vals)
-        
-        # Confirmer automatiquement les paies associées après création du mouvement
-        if mouvement.type == 'sortie':
-            if mouvement.paie_vendeur_id:
+
+        for vals in vals_list:
+            # Valider que le motif est renseigné pour les sorties
+            if vals.get('type') == 'sortie' and not vals.get('motif'):
+                raise ValueError("Le motif est obligatoire pour les sorties de caisse.")
+            if paie_vendeur_id:
+                vals['paie_vendeur_id'] = paie_vendeur_id
+            if paie_wizard_id:
+                vals['paie_wizard_id'] = paie_wizard_id
+
+        mouvements = super().create(vals_list)
+        self._journal_synchroniser(mouvements._journal_points())
+
+        for mouvement in mouvements:
+            mouvement._confirmer_paies()
+        return mouvements
+
+    def write(self, vals):
+        suivi = any(f in vals for f in self._CHAMPS_JOURNAL)
+        avant = self._journal_points() if suivi else {}
+        result = super().write(vals)
+        if suivi:
+            points = self._journal_points()
+            for sid, point in avant.items():
+                if sid not in points or point < points[sid]:
+                    points[sid] = point
+            self._journal_synchroniser(points)
+        return result
+
+    def unlink(self):
+        points = self._journal_points()
+        result = super().unlink()
+        self._journal_synchroniser(points)
+        return result
+
+    def _confirmer_paies(self):
+        """Confirmer automatiquement les paies associées après création du mouvement"""
+        self.ensure_one()
+        if self.type == 'sortie':
+            if self.paie_vendeur_id:
                 try:
-                    mouvement.paie_vendeur_id.action_confirmer_paie()
+                    self.paie_vendeur_id.action_confirmer_paie()
                 except Exception as e:
-                    import logging
-                    logging.warning("Erreur lors de la confirmation de la paie vendeur %s: %s", mouvement.paie_vendeur_id.id, str(e))
+                    _logger.warning("Erreur lors de la confirmation de la paie vendeur %s: %s", self.paie_vendeur_id.id, str(e))
             
-            if mouvement.paie_wizard_id:
+            if self.paie_wizard_id:
                 try:
-                    mouvement.paie_wizard_id.action_confirmer_paie()
+                    self.paie_wizard_id.action_confirmer_paie()
                 except Exception as e:
-                    import logging
-                    logging.warning("Erreur lors de la confirmation de la paie wizard %s: %s", mouvement.paie_wizard_id.id, str(e))
-        
-        return mouvement
+                    _logger.warning("Erreur lors de la confirmation de la paie wizard %s: %s", self.paie_wizard_id.id, str(e))
+        return True
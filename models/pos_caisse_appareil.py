@@ -0,0 +1,174 @@
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# Taille maximale d'un bloc de numéros réservé en un appel
+MAX_TAILLE_BLOC = 1000
+
+
+class PosAppareil(models.Model):
+    _name = 'pos.caisse.appareil'
+    _description = 'Appareil de caisse'
+    _order = 'name'
+
+    name = fields.Char('Nom', required=True)
+    identifiant = fields.Char('Identifiant', required=True, index=True, help="Identifiant unique envoyé par l'appareil")
+    user_id = fields.Many2one('res.users', string='Caissier', required=True, default=lambda self: self.env.user)
+    active = fields.Boolean('Actif', default=True)
+    bloc_ids = fields.One2many('pos.caisse.appareil.bloc', 'appareil_id', string='Blocs de numéros')
+
+    _sql_constraints = [
+        ('identifiant_unique', 'unique(identifiant)', "L'identifiant de l'appareil doit être unique !"),
+    ]
+
+    @api.model
+    def _get_ou_creer(self, identifiant, user):
+        """Appareil enregistré sous cet identifiant (créé au premier appel pour l'utilisateur)"""
+        appareil = self.with_context(active_test=False).search([('identifiant', '=', identifiant)], limit=1)
+        if not appareil:
+            appareil = self.create({'name': identifiant, 'identifiant': identifiant, 'user_id': user.id})
+        elif not appareil.active:
+            raise UserError("Appareil désactivé.")
+        elif appareil.user_id != user:
+            raise UserError("Appareil enregistré pour un autre caissier.")
+        return appareil
+
+    def reserver_bloc(self, taille):
+        """Réserver `taille` numéros de commande en une seule opération sur la séquence.
+
+        Les numéros tirés sont regroupés en plages contiguës (une séquence partagée peut
+        intercaler les numéros d'autres appelants); une plage = un bloc.
+        """
+        self.ensure_one()
+        taille = int(taille)
+        if taille <= 0 or taille > MAX_TAILLE_BLOC:
+            raise UserError(f"La taille du bloc doit être comprise entre 1 et {MAX_TAILLE_BLOC}.")
+        sequence = self.env['ir.sequence'].sudo().search([('code', '=', 'pos.caisse.commande')], limit=1)
+        if not sequence:
+            raise UserError("Séquence des commandes introuvable.")
+        if sequence.use_date_range:
+            # Les numéros dépendent alors de la plage de la date d'utilisation, inconnue ici
+            raise UserError("Réservation de blocs impossible: la séquence des commandes utilise des plages de dates.")
+
+        if sequence.implementation == 'standard':
+            self.env.cr.execute(
+                "SELECT nextval('ir_sequence_%03d') FROM generate_series(1, %%s)" % sequence.id, (taille,)
+            )
+            numeros = sorted(row[0] for row in self.env.cr.fetchall())
+        else:
+            # Séquence sans trou: une seule mise à jour verrouillante pour tout le bloc
+            self.env.cr.execute("""
+                UPDATE ir_sequence SET number_next = number_next + %s * number_increment
+                 WHERE id = %s RETURNING number_next - %s * number_increment, number_increment
+            """, (taille, sequence.id, taille))
+            premier, pas = self.env.cr.fetchone()
+            numeros = [premier + i * pas for i in range(taille)]
+            sequence.invalidate_cache(['number_next'])
+
+        plages = []
+        for numero in numeros:
+            if plages and numero == plages[-1][1] + sequence.number_increment:
+                plages[-1][1] = numero
+            else:
+                plages.append([numero, numero])
+
+        prefixe, suffixe = sequence._get_prefix_suffix()
+        return self.env['pos.caisse.appareil.bloc'].create([{
+            'appareil_id': self.id,
+            'debut': debut,
+            'fin': fin,
+            'pas': sequence.number_increment,
+            'prefixe': prefixe or '',
+            'suffixe': suffixe or '',
+            'padding': sequence.padding,
+        } for debut, fin in plages])
+
+    def _valider_noms(self, noms):
+        """Vérifier des numéros de commande pré-attribués par l'appareil.
+
+        Un numéro est accepté s'il appartient à un bloc de l'appareil et n'a pas encore été
+        utilisé par une commande, archivée comprise. Deux créations concurrentes du même numéro
+        sont départagées par l'index unique pos_caisse_commande_name_uniq.
+        Retour: {nom: message_erreur} pour les numéros refusés.
+        """
+        self.ensure_one()
+        noms = [n for n in dict.fromkeys(noms) if n]
+        if not noms:
+            return {}
+        erreurs = {}
+        for nom in noms:
+            if not any(bloc._contient(nom) for bloc in self.bloc_ids):
+                erreurs[nom] = f"Numéro {nom} non réservé pour cet appareil."
+        restants = [n for n in noms if n not in erreurs]
+        if restants:
+            self.env['pos.caisse.commande'].flush(['name'])
+            self.env.cr.execute("SELECT name FROM pos_caisse_commande_historique WHERE name = ANY(%s)", (restants,))
+            for (nom,) in self.env.cr.fetchall():
+                erreurs[nom] = f"Numéro {nom} déjà utilisé."
+        return erreurs
+
+
+class PosAppareilBloc(models.Model):
+    _name = 'pos.caisse.appareil.bloc'
+    _description = 'Bloc de numéros de commande réservé'
+    _order = 'appareil_id, debut'
+
+    appareil_id = fields.Many2one('pos.caisse.appareil', string='Appareil', required=True, index=True, ondelete='cascade')
+    debut = fields.Integer('Premier numéro', required=True)
+    fin = fields.Integer('Dernier numéro', required=True)
+    pas = fields.Integer('Pas', default=1)
+    prefixe = fields.Char('Préfixe')
+    suffixe = fields.Char('Suffixe')
+    padding = fields.Integer('Nombre de chiffres')
+    premier_nom = fields.Char('Du', compute='_compute_noms')
+    dernier_nom = fields.Char('Au', compute='_compute_noms')
+
+    @api.depends('debut', 'fin', 'prefixe', 'suffixe', 'padding')
+    def _compute_noms(self):
+        for bloc in self:
+            bloc.premier_nom = bloc._formater(bloc.debut)
+            bloc.dernier_nom = bloc._formater(bloc.fin)
+
+    def _formater(self, numero):
+        return '%s%0*d%s' % (self.prefixe or '', self.padding or 0, numero, self.suffixe or '')
+
+    def _contient(self, nom):
+        prefixe, suffixe = self.prefixe or '', self.suffixe or ''
+        if not nom.startswith(prefixe) or not nom.endswith(suffixe):
+            return False
+        chiffres = nom[len(prefixe):len(nom) - len(suffixe)]
+        if not chiffres.isdigit() or len(chiffres) < (self.padding or 0):
+            return False
+        numero = int(chiffres)
+        return self.debut <= numero <= self.fin and (numero - self.debut) % (self.pas or 1) == 0 \
+            and nom == self._formater(numero)
+
+    @api.model
+    def _cron_purger(self):
+        """Supprimer les blocs plus anciens que pos_caisse.bloc_retention_jours (30 par défaut):
+        leurs numéros non utilisés sont refusés ensuite, l'appareil réserve un nouveau bloc"""
+        jours = float(self.env['ir.config_parameter'].sudo().get_param('pos_caisse.bloc_retention_jours', 30))
+        self.env.cr.execute(
+            "DELETE FROM pos_caisse_appareil_bloc WHERE create_date < %s",
+            (fields.Datetime.now() - timedelta(days=jours),),
+        )
+        if self.env.cr.rowcount:
+            _logger.info("Purge de %s bloc(s) de numéros expiré(s)", self.env.cr.rowcount)
+        self.invalidate_cache()
+        return True
+
+    def _get_data(self):
+        return [{
+            'debut': b.debut,
+            'fin': b.fin,
+            'pas': b.pas,
+            'prefixe': b.prefixe,
+            'suffixe': b.suffixe,
+            'padding': b.padding,
+            'premier': b.premier_nom,
+            'dernier': b.dernier_nom,
+        } for b in self]
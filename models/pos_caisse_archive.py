@@ -0,0 +1,184 @@
+import logging
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Tables chaudes archivées -> (table froide partitionnée par mois sur `date`, vue historique)
+TABLES_ARCHIVE = {
+    'pos_caisse_commande': ('pos_caisse_commande_archive', 'pos_caisse_commande_historique'),
+    'pos_caisse_commande_line': ('pos_caisse_commande_line_archive', 'pos_caisse_commande_line_historique'),
+    'pos_caisse_mouvement': ('pos_caisse_mouvement_archive', 'pos_caisse_mouvement_historique'),
+}
+
+
+class PosArchive(models.AbstractModel):
+    """Stockage froid des sessions clôturées anciennes.
+
+    Les commandes, lignes et mouvements des sessions clôturées depuis plus de
+    `pos_caisse.archive_mois` mois sont déplacés dans des tables d'archive partitionnées par
+    mois (index BRIN sur la date). Les vues *_historique (tables chaudes UNION ALL archives)
+    servent aux rapports, exports et reconstructions d'agrégats; les écrans et l'API courante
+    ne lisent que les tables chaudes.
+    """
+    _name = 'pos.caisse.archive'
+    _description = 'Archivage des sessions clôturées'
+
+    def init(self):
+        cr = self.env.cr
+        for table, (archive, vue) in TABLES_ARCHIVE.items():
+            if table == 'pos_caisse_commande_line':
+                # Les lignes n'ont pas de date: celle de la commande sert de clé de partition
+                cr.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {archive} (LIKE {table}, date timestamp NOT NULL)
+                    PARTITION BY RANGE (date)
+                """)
+            else:
+                cr.execute(f"CREATE TABLE IF NOT EXISTS {archive} (LIKE {table}) PARTITION BY RANGE (date)")
+            # Colonnes ajoutées à la table chaude depuis la création de l'archive
+            cr.execute("""
+                SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+                  FROM pg_attribute a
+                 WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+                   AND a.attname NOT IN (SELECT attname FROM pg_attribute
+                                          WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped)
+            """, (table, archive))
+            for colonne, type_sql in cr.fetchall():
+                cr.execute(f'ALTER TABLE {archive} ADD COLUMN "{colonne}" {type_sql}')
+            cr.execute(f"CREATE INDEX IF NOT EXISTS {archive}_date_brin ON {archive} USING brin (date)")
+            cr.execute(f"CREATE INDEX IF NOT EXISTS {archive}_id_idx ON {archive} (id)")
+            colonnes = ', '.join(f'"{c}"' for c in self._colonnes(table))
+            cr.execute(f"DROP VIEW IF EXISTS {vue}")
+            cr.execute(f"""
+                CREATE VIEW {vue} AS
+                SELECT {colonnes} FROM {table}
+                 UNION ALL
+                SELECT {colonnes} FROM {archive}
+            """)
+        cr.execute("CREATE INDEX IF NOT EXISTS pos_caisse_commande_archive_session_idx ON pos_caisse_commande_archive (session_id)")
+        cr.execute("CREATE INDEX IF NOT EXISTS pos_caisse_commande_archive_idempotency_idx ON pos_caisse_commande_archive (idempotency_key)")
+        cr.execute("CREATE INDEX IF NOT EXISTS pos_caisse_commande_line_archive_commande_idx ON pos_caisse_commande_line_archive (commande_id)")
+        cr.execute("CREATE INDEX IF NOT EXISTS pos_caisse_mouvement_archive_session_idx ON pos_caisse_mouvement_archive (session_id)")
+        # Tables chaudes: BRIN pour les parcours par plage de dates (tables en ajout quasi séquentiel)
+        cr.execute("CREATE INDEX IF NOT EXISTS pos_caisse_commande_date_brin ON pos_caisse_commande USING brin (date)")
+        cr.execute("CREATE INDEX IF NOT EXISTS pos_caisse_mouvement_date_brin ON pos_caisse_mouvement USING brin (date)")
+
+    def _colonnes(self, table):
+        self.env.cr.execute("""
+            SELECT attname FROM pg_attribute
+             WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+             ORDER BY attnum
+        """, (table,))
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    def _creer_partitions(self, archive, debut, fin):
+        """Partitions mensuelles de `archive` couvrant [debut, fin]"""
+        mois = debut.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        while mois <= fin:
+            suivant = mois + relativedelta(months=1)
+            self.env.cr.execute(f"""
+                CREATE TABLE IF NOT EXISTS {archive}_{mois:%Y%m} PARTITION OF {archive}
+                FOR VALUES FROM (%s) TO (%s)
+            """, (mois, suivant))
+            mois = suivant
+
+    @api.model
+    def _archiver_sessions(self, session_ids):
+        """Déplacer commandes, lignes et mouvements des sessions vers les archives.
+
+        Les agrégats (statistiques vendeur, cube, totaux de session) ne sont pas modifiés: la
+        suppression se fait en SQL, sans passer par les hooks de l'ORM. Les totaux et le rapport
+        des sessions archivées sont servis par leur photographie de clôture. Les appareils
+        reçoivent une trace de suppression (pos.caisse.suppression) pour chaque commande et
+        mouvement déplacé.
+
+        Les sessions dont un mouvement paie une ligne de lot de commissions restent dans les
+        tables chaudes: la suppression du mouvement effacerait la référence du paiement.
+        Retour: ids des sessions archivées.
+        """
+        cr = self.env.cr
+        self.env['pos.caisse.paie.lot.ligne'].flush(['mouvement_id'])
+        cr.execute("""
+            SELECT DISTINCT m.session_id FROM pos_caisse_mouvement m
+              JOIN pos_caisse_paie_lot_ligne l ON l.mouvement_id = m.id
+             WHERE m.session_id = ANY(%s)
+        """, (list(session_ids),))
+        exclues = {row[0] for row in cr.fetchall()}
+        session_ids = [sid for sid in session_ids if sid not in exclues]
+        if not session_ids:
+            return []
+        sessions = self.env['pos.caisse.session'].browse(session_ids)
+        sessions.filtered(lambda s: not s.snapshot)._figer()
+        self.env['pos.caisse.session.delta']._consolider(session_ids)
+        self.flush()
+
+        cr.execute("""
+            SELECT MIN(date), MAX(date) FROM (
+                SELECT date FROM pos_caisse_commande WHERE session_id = ANY(%(ids)s)
+                 UNION ALL
+                SELECT date FROM pos_caisse_mouvement WHERE session_id = ANY(%(ids)s)
+            ) d
+        """, {'ids': session_ids})
+        debut, fin = cr.fetchone()
+        if debut:
+            for archive, _vue in TABLES_ARCHIVE.values():
+                self._creer_partitions(archive, debut, fin)
+
+            for table, (archive, _vue) in TABLES_ARCHIVE.items():
+                colonnes = ', '.join(f'"{c}"' for c in self._colonnes(table))
+                if table == 'pos_caisse_commande_line':
+                    cr.execute(f"""
+                        INSERT INTO {archive} ({colonnes}, date)
+                        SELECT {', '.join(f'l.{c}' for c in colonnes.split(', '))}, c.date
+                          FROM {table} l JOIN pos_caisse_commande c ON c.id = l.commande_id
+                         WHERE c.session_id = ANY(%s)
+                    """, (session_ids,))
+                else:
+                    cr.execute(f"""
+                        INSERT INTO {archive} ({colonnes})
+                        SELECT {colonnes} FROM {table} WHERE session_id = ANY(%s)
+                    """, (session_ids,))
+            # Les lignes suivent leurs commandes (ondelete cascade)
+            Suppression = self.env['pos.caisse.suppression'].sudo()
+            cr.execute("DELETE FROM pos_caisse_mouvement WHERE session_id = ANY(%s) RETURNING id", (session_ids,))
+            Suppression._enregistrer('pos.caisse.mouvement', [row[0] for row in cr.fetchall()])
+            cr.execute("DELETE FROM pos_caisse_commande WHERE session_id = ANY(%s) RETURNING id", (session_ids,))
+            Suppression._enregistrer('pos.caisse.commande', [row[0] for row in cr.fetchall()])
+
+        cr.execute("UPDATE pos_caisse_session SET archivee = true WHERE id = ANY(%s)", (session_ids,))
+        self.env['pos.caisse.commande'].invalidate_cache()
+        self.env['pos.caisse.commande.line'].invalidate_cache()
+        self.env['pos.caisse.mouvement'].invalidate_cache()
+        sessions.invalidate_cache()
+        sessions._marquer_modifiee()
+        return session_ids
+
+    @api.model
+    def _cron_archiver(self, limit=20, commit=True):
+        """Archiver les sessions clôturées depuis plus de pos_caisse.archive_mois mois (0: désactivé),
+        par paquets validés séparément"""
+        mois = int(self.env['ir.config_parameter'].sudo().get_param('pos_caisse.archive_mois', 12) or 0)
+        if mois <= 0:
+            return 0
+        limite = fields.Datetime.now() - relativedelta(months=mois)
+        Session = self.env['pos.caisse.session']
+        total, ignorees = 0, []
+        while True:
+            sessions = Session.search([
+                ('state', '=', 'ferme'),
+                ('archivee', '=', False),
+                ('date_cloture', '<', limite),
+                ('id', 'not in', ignorees),
+            ], order='date_cloture', limit=limit)
+            if not sessions:
+                break
+            archivees = self._archiver_sessions(sessions.ids)
+            ignorees += [sid for sid in sessions.ids if sid not in archivees]
+            total += len(archivees)
+            if commit:
+                self.env.cr.commit()
+        if total:
+            _logger.info("Archivage de %s session(s) clôturée(s)", total)
+        return total
@@ -0,0 +1,129 @@
+import json
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Réponse d'une clé déjà enregistrée pour un autre utilisateur (jamais rejouée)
+REPONSE_CONFLIT = {
+    'status': 'error',
+    'code': 409,
+    'message': "Clé d'idempotence déjà utilisée par un autre utilisateur.",
+}
+
+
+class PosIdempotence(models.Model):
+    _name = 'pos.caisse.idempotence'
+    _description = "Clé d'idempotence de l'API"
+    _order = 'id desc'
+
+    cle = fields.Char('Clé', required=True, readonly=True)
+    endpoint = fields.Char('Endpoint', required=True, readonly=True, help="Route d'écriture protégée par la clé")
+    reponse = fields.Text('Réponse', readonly=True, help="Réponse JSON renvoyée telle quelle lors d'un rejeu")
+    user_id = fields.Many2one('res.users', string='Utilisateur', readonly=True)
+    date_expiration = fields.Datetime("Date d'expiration", required=True, index=True, readonly=True)
+
+    _sql_constraints = [
+        ('endpoint_cle_unique', 'unique(endpoint, cle)', "La clé d'idempotence doit être unique par endpoint !"),
+    ]
+
+    def _get_ttl(self):
+        """Durée de conservation des clés (paramètre pos_caisse.idempotence_ttl_heures)"""
+        heures = self.env['ir.config_parameter'].sudo().get_param('pos_caisse.idempotence_ttl_heures', 72)
+        return timedelta(hours=float(heures))
+
+    @api.model
+    def _reserver(self, endpoint, cles):
+        """Réserver des clés pour un endpoint.
+
+        Une clé absente (ou expirée) est insérée et donc réservée pour la requête courante.
+        Une clé déjà connue n'est pas réservée: sa réponse enregistrée est renvoyée.
+        L'index unique garantit qu'une seule requête concurrente obtient la réservation;
+        l'autre attend la fin de la première puis rejoue sa réponse.
+
+        Une clé connue réservée par un autre utilisateur renvoie REPONSE_CONFLIT: la réponse
+        d'un caissier n'est jamais rejouée à un autre.
+
+        Retour: {cle: reponse (dict) ou None} pour les clés déjà connues uniquement.
+        """
+        cles = list(dict.fromkeys(c for c in cles if c))
+        if not cles:
+            return {}
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            INSERT INTO pos_caisse_idempotence
+                (endpoint, cle, user_id, date_expiration, create_uid, create_date, write_uid, write_date)
+            SELECT %(endpoint)s, cle, %(uid)s, %(expiration)s, %(uid)s, %(now)s, %(uid)s, %(now)s
+              FROM unnest(%(cles)s::varchar[]) AS cle
+            ON CONFLICT (endpoint, cle) DO UPDATE
+               SET reponse = NULL,
+                   user_id = EXCLUDED.user_id,
+                   date_expiration = EXCLUDED.date_expiration,
+                   write_date = EXCLUDED.write_date
+             WHERE pos_caisse_idempotence.date_expiration < %(now)s
+            RETURNING cle
+        """, {
+            'endpoint': endpoint,
+            'cles': cles,
+            'uid': self.env.uid,
+            'now': now,
+            'expiration': now + self._get_ttl(),
+        })
+        reservees = {row[0] for row in self.env.cr.fetchall()}
+        connues = [c for c in cles if c not in reservees]
+        if not connues:
+            return {}
+        self.env.cr.execute("""
+            SELECT cle, reponse, user_id FROM pos_caisse_idempotence
+             WHERE endpoint = %s AND cle = ANY(%s)
+        """, (endpoint, connues))
+        resultat = {}
+        for cle, reponse, user_id in self.env.cr.fetchall():
+            if user_id and user_id != self.env.uid:
+                resultat[cle] = dict(REPONSE_CONFLIT)
+            else:
+                resultat[cle] = json.loads(reponse) if reponse else None
+        return resultat
+
+    @api.model
+    def _enregistrer(self, endpoint, reponses):
+        """Enregistrer les réponses {cle: reponse} des clés réservées"""
+        if not reponses:
+            return
+        cles = list(reponses)
+        self.env.cr.execute("""
+            UPDATE pos_caisse_idempotence AS i
+               SET reponse = r.reponse
+              FROM unnest(%s::varchar[], %s::text[]) AS r(cle, reponse)
+             WHERE i.endpoint = %s AND i.cle = r.cle
+        """, (cles, [json.dumps(reponses[c], default=str) for c in cles], endpoint))
+
+    @api.model
+    def _liberer(self, endpoint, cles):
+        """Libérer des clés réservées dont le traitement a échoué (un nouvel essai sera rejoué)"""
+        cles = [c for c in cles if c]
+        if cles:
+            self.env.cr.execute("""
+                DELETE FROM pos_caisse_idempotence
+                 WHERE endpoint = %s AND cle = ANY(%s) AND reponse IS NULL
+            """, (endpoint, cles))
+
+    @api.model
+    def _cron_purger(self, batch_size=10000):
+        """Supprimer les clés expirées par paquets pour garder la table petite"""
+        now = fields.Datetime.now()
+        total = 0
+        while True:
+            self.env.cr.execute("""
+                DELETE FROM pos_caisse_idempotence
+                 WHERE id IN (SELECT id FROM pos_caisse_idempotence
+                               WHERE date_expiration < %s LIMIT %s)
+            """, (now, batch_size))
+            total += self.env.cr.rowcount
+            if self.env.cr.rowcount < batch_size:
+                break
+        if total:
+            _logger.info("Purge de %s clé(s) d'idempotence expirée(s)", total)
+        return total
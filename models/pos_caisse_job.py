@@ -0,0 +1,338 @@
+import json
+import logging
+from datetime import timedelta
+
+import psycopg2
+
+import odoo
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+
+from .pos_caisse_metrique import collecteur
+
+_logger = logging.getLogger(__name__)
+
+# Délai avant la première relance d'une tâche en échec (doublé à chaque tentative)
+DELAI_RELANCE_SECONDES = 30
+# Verrou consultatif de session (VERROU_JOB, id de la tâche) tenu par le worker pendant
+# l'exécution: une tâche en cours sans ce verrou n'a plus de worker (arrêté, tué)
+VERROU_JOB = 0x706f7333
+
+
+class PosJob(models.Model):
+    """Tâche de fond (rapport, reconstruction de statistiques, agrégation mensuelle).
+
+    Les tâches sont enfilées par `_enfiler` puis exécutées par la tâche planifiée
+    ir_cron_jobs (déclenchée immédiatement), une à la fois par worker: la prise se fait
+    par FOR UPDATE SKIP LOCKED, plusieurs workers peuvent donc traiter la file en parallèle.
+    Le worker tient un verrou consultatif sur la tâche jusqu'à la fin de l'exécution, quelle
+    que soit sa durée; seule une tâche en cours dont le verrou est libre est remise en file.
+    Une tâche en échec est relancée avec un délai croissant jusqu'à `max_tentatives`.
+    Une clé de dédoublonnage renvoie la tâche déjà en attente ou en cours au lieu d'en créer
+    une nouvelle.
+    """
+    _name = 'pos.caisse.job'
+    _description = 'Tâche de fond POS'
+    _order = 'id desc'
+
+    name = fields.Char('Nom', required=True, readonly=True)
+    model_name = fields.Char('Modèle', required=True, readonly=True)
+    methode = fields.Char('Méthode', required=True, readonly=True)
+    res_ids = fields.Text('Enregistrements (JSON)', readonly=True, default='[]')
+    arguments = fields.Text('Arguments (JSON)', readonly=True, default='{}')
+    cle = fields.Char('Clé de dédoublonnage', readonly=True, index=True)
+    priorite = fields.Integer('Priorité', default=10, readonly=True, help="Les plus petites valeurs passent en premier")
+    state = fields.Selection([
+        ('en_attente', 'En attente'),
+        ('en_cours', 'En cours'),
+        ('termine', 'Terminée'),
+        ('echec', 'Échec'),
+    ], default='en_attente', string='État', readonly=True, index=True)
+    user_id = fields.Many2one('res.users', string='Demandée par', readonly=True, default=lambda self: self.env.user)
+    date_prevue = fields.Datetime('Prévue le', default=fields.Datetime.now, readonly=True)
+    date_debut = fields.Datetime('Début', readonly=True)
+    date_fin = fields.Datetime('Fin', readonly=True)
+    tentatives = fields.Integer('Tentatives', readonly=True)
+    max_tentatives = fields.Integer('Tentatives max', default=3, readonly=True)
+    progression = fields.Float('Progression (%)', compute='_compute_progression')
+    etape = fields.Char('Étape', compute='_compute_progression')
+    message = fields.Text('Message', readonly=True)
+    resultat = fields.Text('Résultat (JSON)', readonly=True)
+
+    def init(self):
+        # Dédoublonnage: une seule tâche active par clé
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS pos_caisse_job_cle_active_uniq ON pos_caisse_job (cle)
+             WHERE cle IS NOT NULL AND state IN ('en_attente', 'en_cours')
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS pos_caisse_job_file_idx ON pos_caisse_job (priorite, date_prevue, id)
+             WHERE state = 'en_attente'
+        """)
+
+    def _compute_progression(self):
+        """Lire l'avancement publié par la tentative en cours (pos.caisse.job.progression)"""
+        avancements = self.env['pos.caisse.job.progression']._lire(self.ids)
+        for job in self:
+            progression, etape = avancements.get((job.id, job.tentatives), (0.0, False))
+            if job.state == 'termine':
+                progression, etape = 100.0, False
+            job.progression = progression
+            job.etape = etape
+
+    @api.model
+    def _enfiler(self, model_name, methode, res_ids=None, arguments=None, name=None, cle=None, priorite=10, max_tentatives=3):
+        """Enfiler `env[model_name].browse(res_ids).methode(**arguments)`.
+
+        Retour: la tâche créée, ou celle déjà active pour `cle`.
+        """
+        if methode.startswith('__') or not hasattr(self.env[model_name], methode):
+            raise UserError(f"Méthode inconnue: {model_name}.{methode}")
+        Job = self.sudo()
+        if cle:
+            existante = Job.search([('cle', '=', cle), ('state', 'in', ('en_attente', 'en_cours'))], limit=1)
+            if existante:
+                return existante
+        vals = {
+            'name': name or f"{model_name}.{methode}",
+            'model_name': model_name,
+            'methode': methode,
+            'res_ids': json.dumps(list(res_ids or [])),
+            'arguments': json.dumps(arguments or {}),
+            'cle': cle or False,
+            'priorite': priorite,
+            'max_tentatives': max_tentatives,
+            'user_id': self.env.uid,
+        }
+        try:
+            with self.env.cr.savepoint():
+                job = Job.create(vals)
+        except Exception:
+            # Enfilage concurrent de la même clé (index unique partiel)
+            job = Job.search([('cle', '=', cle), ('state', 'in', ('en_attente', 'en_cours'))], limit=1)
+            if not job:
+                raise
+        self._declencher()
+        return job
+
+    @api.model
+    def _declencher(self):
+        # Absente pendant le chargement initial des données du module: le passage périodique prendra le relais
+        cron = self.env.ref('pos_caisse.ir_cron_jobs', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _progression(self, pourcentage, message=None):
+        """Publier l'avancement de la tâche courante (contexte pos_caisse_job_id).
+
+        Écrit dans une transaction séparée pour être visible pendant l'exécution, et dans
+        pos_caisse_job_progression plutôt que sur la tâche: la transaction d'exécution écrit
+        l'état final de la tâche, une mise à jour concurrente de cette ligne la ferait échouer
+        (sérialisation) ou attendre. Sans tâche courante (appel direct), ne fait rien.
+        """
+        job_id = self.env.context.get('pos_caisse_job_id')
+        if not job_id:
+            return
+        self.env['pos.caisse.job.progression']._publier(
+            job_id, self.env.context.get('pos_caisse_job_tentative', 0), pourcentage, message,
+        )
+
+    @api.model
+    def _prendre(self):
+        """Réserver la prochaine tâche due (priorité, date prévue), sans attendre les autres workers.
+
+        Le verrou d'exécution est pris avant la validation de la réservation: aucune autre
+        transaction ne voit la tâche en cours sans son verrou.
+        """
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            UPDATE pos_caisse_job
+               SET state = 'en_cours', date_debut = %(now)s, tentatives = tentatives + 1,
+                   write_uid = %(uid)s, write_date = %(now)s
+             WHERE id = (SELECT id FROM pos_caisse_job
+                          WHERE state = 'en_attente' AND date_prevue <= %(now)s
+                          ORDER BY priorite, date_prevue, id
+                          LIMIT 1 FOR UPDATE SKIP LOCKED)
+            RETURNING id
+        """, {'now': now, 'uid': self.env.uid})
+        row = self.env.cr.fetchone()
+        self.invalidate_cache()
+        if not row:
+            return self.browse()
+        self.env.cr.execute("SELECT pg_advisory_lock(%s, %s)", (VERROU_JOB, row[0]))
+        return self.browse(row[0])
+
+    def _liberer(self):
+        """Relâcher le verrou d'exécution (validé ou non: verrou de session)"""
+        try:
+            self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", (VERROU_JOB, self.id))
+        except psycopg2.Error:
+            # Transaction interrompue: le verrou tombera avec la connexion
+            _logger.warning("Verrou de la tâche POS %s non relâché", self.id, exc_info=True)
+
+    def _executer(self, commit=True):
+        """Exécuter la tâche réservée et enregistrer son résultat, sa relance ou son échec"""
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                Model = self.env[self.model_name].with_user(self.user_id).sudo().with_context(
+                    pos_caisse_job_id=self.id, pos_caisse_job_tentative=self.tentatives,
+                )
+                records = Model.browse(json.loads(self.res_ids or '[]'))
+                resultat = getattr(records, self.methode)(**json.loads(self.arguments or '{}'))
+            self.write({
+                'state': 'termine',
+                'date_fin': fields.Datetime.now(),
+                'resultat': json.dumps(resultat, default=str) if resultat is not None else False,
+                'message': False,
+            })
+        except Exception as e:
+            self.invalidate_cache()
+            _logger.warning("Tâche POS %s (%s) en échec, tentative %s/%s", self.id, self.name,
+                            self.tentatives, self.max_tentatives, exc_info=True)
+            now = fields.Datetime.now()
+            if self.tentatives < self.max_tentatives:
+                delai = DELAI_RELANCE_SECONDES * 2 ** (self.tentatives - 1)
+                self.write({'state': 'en_attente', 'date_prevue': now + timedelta(seconds=delai), 'message': str(e)})
+            else:
+                self.write({'state': 'echec', 'date_fin': now, 'message': str(e)})
+        if commit:
+            self.env.cr.commit()
+
+    @api.model
+    def _relancer_interrompues(self):
+        """Remettre en file les tâches en cours dont plus aucun worker ne tient le verrou
+        d'exécution (connexion fermée: worker arrêté ou tué); une tâche longue reste en cours"""
+        self.env.cr.execute("""
+            UPDATE pos_caisse_job j
+               SET state = CASE WHEN tentatives < max_tentatives THEN 'en_attente' ELSE 'echec' END,
+                   message = 'Exécution interrompue'
+             WHERE state = 'en_cours'
+               AND NOT EXISTS (
+                    SELECT 1 FROM pg_locks l
+                     WHERE l.locktype = 'advisory' AND l.granted
+                       AND l.database = (SELECT oid FROM pg_database WHERE datname = current_database())
+                       AND l.classid = %s::oid AND l.objid = j.id::oid AND l.objsubid = 2
+                   )
+        """, (VERROU_JOB,))
+        self.invalidate_cache()
+
+    @api.model
+    def _cron_traiter(self, limit=50, commit=True):
+        """Traiter jusqu'à `limit` tâches dues, chacune validée séparément. Retour: nombre traité"""
+        self._relancer_interrompues()
+        self.env['pos.caisse.job.progression']._purger()
+        traitees = 0
+        while traitees < limit:
+            job = self._prendre()
+            if not job:
+                break
+            try:
+                if commit:
+                    self.env.cr.commit()
+                job._executer(commit=commit)
+            finally:
+                job._liberer()
+            traitees += 1
+        # Mesures des calculs exécutés par ce worker cron (aucune route instrumentée ici)
+        collecteur.envoyer(self.env.cr.dbname, force=True)
+        return traitees
+
+    def _get_data(self):
+        """Statut de la tâche pour l'API"""
+        self.ensure_one()
+        return {
+            'id': self.id,
+            'name': self.name,
+            'state': self.state,
+            'progression': self.progression,
+            'tentatives': self.tentatives,
+            'date_prevue': fields.Datetime.to_string(self.date_prevue),
+            'date_debut': fields.Datetime.to_string(self.date_debut),
+            'date_fin': fields.Datetime.to_string(self.date_fin),
+            'message': self.message or (self.state == 'en_cours' and self.etape) or None,
+            'resultat': json.loads(self.resultat) if self.resultat else None,
+        }
+
+    def action_relancer(self):
+        """Remettre en file une tâche en échec"""
+        self.filtered(lambda j: j.state == 'echec').write({
+            'state': 'en_attente',
+            'date_prevue': fields.Datetime.now(),
+            'tentatives': 0,
+            'message': False,
+        })
+        self._declencher()
+        return True
+
+
+class PosJobProgression(models.Model):
+    """Avancement des tâches en cours, une ligne par tâche.
+
+    Écrite uniquement par `_publier`, dans sa propre transaction: jamais par la transaction
+    qui exécute la tâche. Sans clé étrangère vers pos_caisse_job, la tâche pouvant ne pas
+    être encore visible (ou ne jamais l'être) pour la transaction d'avancement.
+    """
+    _name = 'pos.caisse.job.progression'
+    _description = 'Avancement des tâches de fond POS'
+
+    job_id = fields.Integer('Tâche', required=True, readonly=True)
+    tentative = fields.Integer('Tentative', readonly=True)
+    progression = fields.Float('Progression (%)', readonly=True)
+    etape = fields.Char('Étape', readonly=True)
+
+    _sql_constraints = [
+        ('job_unique', 'unique(job_id)', "Un seul avancement par tâche !"),
+    ]
+
+    @api.model
+    def _publier(self, job_id, tentative, pourcentage, etape=None):
+        """Enregistrer l'avancement (transaction séparée, validée aussitôt).
+
+        Une nouvelle tentative repart de zéro: l'étape précédente n'est gardée que pour
+        la même tentative. Un échec est journalisé sans interrompre la tâche.
+        """
+        try:
+            with odoo.registry(self.env.cr.dbname).cursor() as cr:
+                cr.execute("""
+                    INSERT INTO pos_caisse_job_progression
+                        (job_id, tentative, progression, etape, create_uid, create_date, write_uid, write_date)
+                    VALUES (%(job)s, %(tentative)s, %(progression)s, %(etape)s,
+                            %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC')
+                    ON CONFLICT (job_id) DO UPDATE
+                       SET progression = EXCLUDED.progression,
+                           etape = COALESCE(EXCLUDED.etape, CASE
+                               WHEN pos_caisse_job_progression.tentative = EXCLUDED.tentative
+                               THEN pos_caisse_job_progression.etape END),
+                           tentative = EXCLUDED.tentative,
+                           write_date = EXCLUDED.write_date
+                """, {
+                    'job': job_id,
+                    'tentative': tentative,
+                    'progression': min(max(pourcentage, 0.0), 100.0),
+                    'etape': etape,
+                    'uid': self.env.uid,
+                })
+        except psycopg2.Error:
+            _logger.warning("Avancement de la tâche POS %s non enregistré", job_id, exc_info=True)
+
+    @api.model
+    def _lire(self, job_ids):
+        """Retour: {(job_id, tentative): (progression, etape)}"""
+        if not job_ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT job_id, tentative, progression, etape FROM pos_caisse_job_progression
+             WHERE job_id = ANY(%s)
+        """, (list(job_ids),))
+        return {(job_id, tentative): (progression, etape) for job_id, tentative, progression, etape in self.env.cr.fetchall()}
+
+    @api.model
+    def _purger(self):
+        """Supprimer l'avancement des tâches terminées, en échec ou disparues"""
+        self.env.cr.execute("""
+            DELETE FROM pos_caisse_job_progression AS p
+             WHERE NOT EXISTS (SELECT 1 FROM pos_caisse_job AS j
+                                WHERE j.id = p.job_id AND j.state IN ('en_attente', 'en_cours'))
+        """)
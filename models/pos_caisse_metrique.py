@@ -0,0 +1,186 @@
+import functools
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+import odoo
+from odoo import models, fields, api
+from odoo.http import request
+
+_logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes
+BORNES_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BORNES_LOT = (1, 5, 10, 25, 50, 100, 250, 500)
+
+# Intervalle minimal entre deux envois des mesures d'un worker vers la base (secondes)
+INTERVALLE_ENVOI = 10
+
+# Métriques exposées: nom -> (type Prometheus, aide)
+METRIQUES = {
+    'pos_caisse_api_request_duration_seconds': ('histogram', "Durée des requêtes de l'API POS"),
+    'pos_caisse_api_sql_queries_total': ('counter', "Requêtes SQL émises par les routes de l'API POS"),
+    'pos_caisse_api_sql_seconds_total': ('counter', "Temps passé en SQL par les routes de l'API POS"),
+    'pos_caisse_api_errors_total': ('counter', "Réponses en erreur de l'API POS par classe d'erreur"),
+    'pos_caisse_api_batch_size': ('histogram', "Taille des lots reçus par l'API POS"),
+    'pos_caisse_compute_seconds': ('histogram', "Durée des méthodes de calcul de champs"),
+    'pos_caisse_cache_cartes_requests_total': ('counter', "Résolutions de carte vendeur demandées"),
+    'pos_caisse_cache_cartes_misses_total': ('counter', "Résolutions de carte vendeur absentes du cache"),
+}
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in sorted(labels.items()))
+
+
+class Collecteur:
+    """Mesures du processus, cumulées en mémoire puis ajoutées périodiquement à la table
+    pos_caisse_metrique (agrégation entre workers)."""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._valeurs = defaultdict(float)
+        self._dernier_envoi = time.monotonic()
+
+    def incrementer(self, db, nom, valeur=1.0, **labels):
+        with self._verrou:
+            self._valeurs[(db, nom, _labels(**labels))] += valeur
+
+    def observer(self, db, nom, valeur, bornes, **labels):
+        """Ajouter une observation à un histogramme (compteurs de buckets cumulés)"""
+        with self._verrou:
+            for borne in bornes:
+                if valeur <= borne:
+                    self._valeurs[(db, nom + '_bucket', _labels(le=borne, **labels))] += 1
+            self._valeurs[(db, nom + '_bucket', _labels(le='+Inf', **labels))] += 1
+            self._valeurs[(db, nom + '_sum', _labels(**labels))] += valeur
+            self._valeurs[(db, nom + '_count', _labels(**labels))] += 1
+
+    def extraire(self, db):
+        with self._verrou:
+            valeurs = {(nom, labels): v for (d, nom, labels), v in self._valeurs.items() if d == db}
+            for nom, labels in valeurs:
+                del self._valeurs[(db, nom, labels)]
+            self._dernier_envoi = time.monotonic()
+        return valeurs
+
+    def envoyer(self, db, force=False):
+        """Ajouter les mesures en attente à la base, dans une transaction séparée"""
+        if not db or (not force and time.monotonic() - self._dernier_envoi < INTERVALLE_ENVOI):
+            return
+        valeurs = self.extraire(db)
+        if not valeurs:
+            return
+        try:
+            with odoo.registry(db).cursor() as cr:
+                env = api.Environment(cr, odoo.SUPERUSER_ID, {})
+                env['pos.caisse.metrique']._ajouter(valeurs)
+        except Exception:
+            _logger.warning("Envoi des métriques POS impossible", exc_info=True)
+
+
+collecteur = Collecteur()
+
+
+def chronometrer(method):
+    """Mesurer la durée d'une méthode de modèle (pos_caisse_compute_seconds).
+
+    Enregistrement en mémoire seulement: l'envoi ouvre une transaction séparée, il est fait
+    en fin de requête (ir.http) ou de tâche planifiée (ir.cron), jamais pendant un calcul.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        debut = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            db = self.env.cr.dbname
+            collecteur.observer(
+                db, 'pos_caisse_compute_seconds', time.perf_counter() - debut, BORNES_DUREE,
+                model=self._name, method=method.__name__,
+            )
+    return wrapper
+
+
+def _cle_exposition(serie):
+    """Ordre d'une série: buckets d'un histogramme par borne numérique croissante (+Inf en dernier)"""
+    nom, labels, _valeur = serie
+    le = re.search(r'(?:^|,)le="([^"]*)"', labels)
+    autres = re.sub(r'(?:^|,)le="[^"]*"', '', labels).lstrip(',')
+    return nom, autres, float(le.group(1)) if le else 0.0
+
+
+class IrHttp(models.AbstractModel):
+    _inherit = 'ir.http'
+
+    @classmethod
+    def _dispatch(cls):
+        try:
+            return super()._dispatch()
+        finally:
+            # Fin de requête (backend compris): mesures des calculs chronométrés
+            collecteur.envoyer(request.db if request else None)
+
+
+class IrCron(models.Model):
+    _inherit = 'ir.cron'
+
+    @api.model
+    def _callback(self, cron_name, server_action_id, job_id):
+        try:
+            return super()._callback(cron_name, server_action_id, job_id)
+        finally:
+            collecteur.envoyer(self.env.cr.dbname)
+
+
+class PosMetrique(models.Model):
+    _name = 'pos.caisse.metrique'
+    _description = "Métrique de l'API POS"
+    _order = 'nom, labels'
+
+    nom = fields.Char('Nom', required=True, readonly=True)
+    labels = fields.Char('Étiquettes', readonly=True, default='')
+    valeur = fields.Float('Valeur', readonly=True)
+
+    _sql_constraints = [
+        ('nom_labels_unique', 'unique(nom, labels)', 'Une seule valeur par métrique et étiquettes !'),
+    ]
+
+    @api.model
+    def _ajouter(self, valeurs):
+        """Ajouter {(nom, labels): delta} aux compteurs en une requête"""
+        cles = sorted(valeurs)
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            INSERT INTO pos_caisse_metrique (nom, labels, valeur, create_uid, create_date, write_uid, write_date)
+            SELECT t.nom, t.labels, t.valeur, %(uid)s, %(now)s, %(uid)s, %(now)s
+              FROM unnest(%(noms)s::varchar[], %(labels)s::varchar[], %(valeurs)s::float8[]) AS t(nom, labels, valeur)
+            ON CONFLICT (nom, labels) DO UPDATE
+               SET valeur = pos_caisse_metrique.valeur + EXCLUDED.valeur,
+                   write_date = EXCLUDED.write_date
+        """, {
+            'uid': self.env.uid,
+            'now': now,
+            'noms': [c[0] for c in cles],
+            'labels': [c[1] for c in cles],
+            'valeurs': [valeurs[c] for c in cles],
+        })
+
+    @api.model
+    def _exposition(self):
+        """Toutes les métriques au format texte Prometheus"""
+        self.env.cr.execute("SELECT nom, labels, valeur FROM pos_caisse_metrique ORDER BY nom, labels")
+        par_metrique = defaultdict(list)
+        for nom, labels, valeur in self.env.cr.fetchall():
+            base = next((m for m in METRIQUES if nom == m or nom.startswith(m + '_')), nom)
+            par_metrique[base].append((nom, labels, valeur))
+        lignes = []
+        for base, series in par_metrique.items():
+            type_metrique, aide = METRIQUES.get(base, ('untyped', ''))
+            lignes.append(f"# HELP {base} {aide}")
+            lignes.append(f"# TYPE {base} {type_metrique}")
+            for nom, labels, valeur in sorted(series, key=_cle_exposition):
+                lignes.append(f"{nom}{{{labels}}} {valeur:g}" if labels else f"{nom} {valeur:g}")
+        return '\n'.join(lignes) + '\n'
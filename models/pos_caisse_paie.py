@@ -0,0 +1,202 @@
+import logging
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+
+class PosPaieLot(models.Model):
+    """Paiement groupé des commissions vendeurs sur une période.
+
+    Les commissions sont calculées en une requête groupée sur les statistiques journalières
+    (pos.caisse.vendeur.stat); les sorties de caisse sont ensuite créées par paquets par une
+    tâche planifiée. Chaque paquet est validé séparément: après une interruption, le
+    traitement reprend aux lignes non encore payées.
+    """
+    _name = 'pos.caisse.paie.lot'
+    _description = 'Lot de paiement des commissions'
+    _order = 'id desc'
+
+    name = fields.Char('Nom', required=True, default=lambda self: f"Commissions {fields.Date.context_today(self)}")
+    date_from = fields.Date('Du', required=True)
+    date_to = fields.Date('Au', required=True)
+    session_id = fields.Many2one(
+        'pos.caisse.session', string='Session de paiement', required=True,
+        domain=[('state', '=', 'ouvert')], help="Session ouverte dans laquelle les sorties de caisse sont enregistrées",
+    )
+    state = fields.Selection([
+        ('brouillon', 'Brouillon'),
+        ('calcule', 'Calculé'),
+        ('en_cours', 'En cours'),
+        ('erreur', 'En erreur'),
+        ('termine', 'Terminé'),
+    ], default='brouillon', string='État', readonly=True)
+    message = fields.Text('Erreur', readonly=True, copy=False)
+    taille_paquet = fields.Integer('Taille des paquets', default=500)
+    ligne_ids = fields.One2many('pos.caisse.paie.lot.ligne', 'lot_id', string='Lignes', readonly=True)
+    nb_lignes = fields.Integer('Vendeurs', readonly=True)
+    nb_payees = fields.Integer('Vendeurs payés', readonly=True)
+    montant_total = fields.Float('Montant total', readonly=True)
+    progression = fields.Float('Progression (%)', compute='_compute_progression')
+
+    # Une commission ne se paie qu'une fois: les périodes des lots calculés ou lancés (en
+    # erreur compris, des paquets ont pu être payés) ne se chevauchent pas, même entre deux
+    # calculs concurrents
+    _sql_constraints = [
+        ('periode_exclusive',
+         "EXCLUDE USING gist (daterange(date_from, date_to, '[]') WITH &&) WHERE (state <> 'brouillon')",
+         "Un autre lot de commissions couvre déjà une partie de cette période !"),
+    ]
+
+    @api.depends('nb_lignes', 'nb_payees')
+    def _compute_progression(self):
+        for lot in self:
+            lot.progression = 100.0 * lot.nb_payees / lot.nb_lignes if lot.nb_lignes else 0.0
+
+    def action_calculer(self):
+        """(Re)calculer les commissions de tous les vendeurs actifs en une requête"""
+        for lot in self:
+            if lot.state not in ('brouillon', 'calcule'):
+                raise UserError("Le lot est déjà lancé.")
+            if lot.date_from > lot.date_to:
+                raise UserError("La date de début doit précéder la date de fin.")
+            autres = self.search([
+                ('id', 'not in', self.ids),
+                ('state', '!=', 'brouillon'),
+                ('date_from', '<=', lot.date_to),
+                ('date_to', '>=', lot.date_from),
+            ])
+            if autres:
+                raise UserError(
+                    f"La période du lot {lot.name} chevauche celle des lots déjà calculés ou payés: "
+                    f"{', '.join(autres.mapped('name'))}."
+                )
+        self.env['pos.caisse.vendeur.stat'].flush()
+        self.env['pos.caisse.vendeur'].flush(['active', 'pourcentage_commission'])
+        now = fields.Datetime.now()
+        for lot in self:
+            self.env.cr.execute("DELETE FROM pos_caisse_paie_lot_ligne WHERE lot_id = %s", (lot.id,))
+            self.env.cr.execute("""
+                INSERT INTO pos_caisse_paie_lot_ligne
+                    (lot_id, vendeur_id, nb_commandes, total_ventes, pourcentage_commission, montant, state,
+                     create_uid, create_date, write_uid, write_date)
+                SELECT %(lot)s, v.id, SUM(st.nb_commandes), SUM(st.montant), v.pourcentage_commission,
+                       ROUND((SUM(st.montant) * v.pourcentage_commission / 100)::numeric, 2), 'a_payer',
+                       %(uid)s, %(now)s, %(uid)s, %(now)s
+                  FROM pos_caisse_vendeur_stat st
+                  JOIN pos_caisse_vendeur v ON v.id = st.vendeur_id AND v.active
+                 WHERE st.date BETWEEN %(date_from)s AND %(date_to)s
+                 GROUP BY v.id, v.pourcentage_commission
+                HAVING SUM(st.montant) * v.pourcentage_commission > 0
+            """, {'lot': lot.id, 'date_from': lot.date_from, 'date_to': lot.date_to, 'uid': self.env.uid, 'now': now})
+        self.invalidate_cache()
+        self._mettre_a_jour_progression()
+        self.write({'state': 'calcule'})
+        return True
+
+    def action_lancer(self):
+        """Lancer (ou relancer après une erreur) le paiement en tâche de fond (tâche planifiée
+        déclenchée immédiatement); la reprise ne paie que les lignes restantes"""
+        for lot in self:
+            if lot.state not in ('calcule', 'erreur'):
+                raise UserError("Calculer le lot avant de le lancer.")
+            if lot.session_id.state != 'ouvert':
+                raise UserError("La session de paiement doit être ouverte.")
+        self.write({'state': 'en_cours', 'message': False})
+        self.env.ref('pos_caisse.ir_cron_paie_lots')._trigger()
+        return True
+
+    def _mettre_a_jour_progression(self):
+        self.env['pos.caisse.paie.lot.ligne'].flush()
+        self.env.cr.execute("""
+            UPDATE pos_caisse_paie_lot lot
+               SET nb_lignes = agg.nb, nb_payees = agg.payees, montant_total = agg.montant
+              FROM (SELECT l.id AS lot_id, COUNT(li.id) AS nb,
+                           COUNT(li.id) FILTER (WHERE li.state = 'paye') AS payees,
+                           COALESCE(SUM(li.montant), 0) AS montant
+                      FROM pos_caisse_paie_lot l
+                      LEFT JOIN pos_caisse_paie_lot_ligne li ON li.lot_id = l.id
+                     WHERE l.id = ANY(%s)
+                     GROUP BY l.id) agg
+             WHERE lot.id = agg.lot_id
+        """, (self.ids,))
+        self.invalidate_cache(['nb_lignes', 'nb_payees', 'montant_total'])
+
+    def _traiter_paquet(self):
+        """Payer le paquet suivant du lot. Retour: nombre de lignes payées (0: lot terminé)"""
+        self.ensure_one()
+        self.env.cr.execute("""
+            SELECT id FROM pos_caisse_paie_lot_ligne
+             WHERE lot_id = %s AND state = 'a_payer'
+             ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+        """, (self.id, self.taille_paquet or 500))
+        lignes = self.env['pos.caisse.paie.lot.ligne'].browse([row[0] for row in self.env.cr.fetchall()])
+        if not lignes:
+            return 0
+        periode = f"{self.date_from} - {self.date_to}"
+        mouvements = self.env['pos.caisse.mouvement'].create([{
+            'session_id': self.session_id.id,
+            'type': 'sortie',
+            'montant': ligne.montant,
+            'motif': f"Commission {ligne.vendeur_id.name} ({periode})",
+            'user_id': self.env.uid,
+        } for ligne in lignes])
+        self.env.cr.execute("""
+            UPDATE pos_caisse_paie_lot_ligne AS l
+               SET state = 'paye', mouvement_id = m.mouvement_id, write_date = %s
+              FROM unnest(%s::int[], %s::int[]) AS m(ligne_id, mouvement_id)
+             WHERE l.id = m.ligne_id
+        """, (fields.Datetime.now(), lignes.ids, mouvements.ids))
+        lignes.invalidate_cache(['state', 'mouvement_id'])
+        self._mettre_a_jour_progression()
+        return len(lignes)
+
+    @api.model
+    def _cron_traiter(self, commit=True):
+        """Traiter les lots en cours, un paquet validé à la fois (reprise après interruption).
+
+        Un paquet refusé (session de paiement clôturée entre-temps...) met le lot en erreur
+        avec le message: le gestionnaire choisit une autre session et relance le lot.
+        """
+        for lot in self.search([('state', '=', 'en_cours')], order='id'):
+            while True:
+                try:
+                    with self.env.cr.savepoint():
+                        payees = lot._traiter_paquet()
+                except (ValueError, UserError) as e:
+                    lot.invalidate_cache()
+                    _logger.warning("Lot de commissions %s en erreur: %s", lot.name, e)
+                    lot.write({'state': 'erreur', 'message': str(e)})
+                    if commit:
+                        self.env.cr.commit()
+                    break
+                if not payees:
+                    lot.state = 'termine'
+                if commit:
+                    self.env.cr.commit()
+                if not payees:
+                    break
+                _logger.info("Lot de commissions %s: %s/%s vendeurs payés", lot.name, lot.nb_payees, lot.nb_lignes)
+
+
+class PosPaieLotLigne(models.Model):
+    _name = 'pos.caisse.paie.lot.ligne'
+    _description = 'Commission à payer'
+    _order = 'lot_id, id'
+
+    lot_id = fields.Many2one('pos.caisse.paie.lot', string='Lot', required=True, index=True, ondelete='cascade')
+    vendeur_id = fields.Many2one('pos.caisse.vendeur', string='Vendeur', required=True, ondelete='restrict')
+    nb_commandes = fields.Integer('Commandes')
+    total_ventes = fields.Float('Total des ventes')
+    pourcentage_commission = fields.Float('Commission (%)')
+    montant = fields.Float('Commission')
+    state = fields.Selection([
+        ('a_payer', 'À payer'),
+        ('paye', 'Payé'),
+    ], default='a_payer', string='État', index=True)
+    mouvement_id = fields.Many2one('pos.caisse.mouvement', string='Sortie de caisse')
+
+    _sql_constraints = [
+        ('lot_vendeur_unique', 'unique(lot_id, vendeur_id)', 'Un vendeur ne peut figurer qu\'une fois par lot !'),
+    ]
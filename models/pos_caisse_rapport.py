@@ -0,0 +1,139 @@
+from odoo import models, fields, api
+
+
+class RapportVenteSession(models.AbstractModel):
+    """Données du rapport de vente de session, calculées en SQL groupé pour toutes les
+    sessions imprimées (le template ne parcourt plus les commandes ni les mouvements)."""
+    _name = 'report.pos_caisse.rapport_vente_session_template'
+    _description = 'Rapport de vente de session'
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        if not docids and data and data.get('session_id'):
+            docids = [data['session_id']]
+        sessions = self.env['pos.caisse.session'].browse(docids)
+        rapports = {}
+        for session in sessions:
+            photo = session._get_snapshot()
+            if photo:
+                # Session clôturée: données figées à la clôture
+                for sortie in photo['sorties']:
+                    sortie['date'] = fields.Datetime.to_datetime(sortie['date'])
+                rapports[session.id] = photo
+        rapports.update(self._get_donnees([sid for sid in sessions.ids if sid not in rapports]))
+        return {
+            'doc_ids': sessions.ids,
+            'doc_model': 'pos.caisse.session',
+            'docs': sessions,
+            'rapports': rapports,
+        }
+
+    @api.model
+    def _get_donnees(self, session_ids):
+        """{session_id: {totaux, commandes, commandes_bp, pains, vendeurs, sorties, montant_en_caisse}}
+
+        Aussi utilisé pour la photographie de clôture des sessions (pos.caisse.session._figer).
+        """
+        self.env['pos.caisse.commande'].flush()
+        self.env['pos.caisse.commande.line'].flush()
+        self.env['pos.caisse.mouvement'].flush()
+        cr = self.env.cr
+        rapports = {sid: {
+            'total_cash': 0.0,
+            'total_bp': 0.0,
+            'nb_commandes': 0,
+            'nb_cash': 0,
+            'nb_bp': 0,
+            'commandes': [],
+            'commandes_bp': [],
+            'pains': [],
+            'vendeurs': [],
+            'sorties': [],
+            'total_sorties': 0.0,
+            'montant_en_caisse': 0.0,
+        } for sid in session_ids}
+        if not session_ids:
+            return rapports
+        libelles = dict(self.env['pos.caisse.commande']._fields['type_paiement']._description_selection(self.env))
+
+        # Détail des commandes (une requête pour toutes les sessions)
+        cr.execute("""
+            SELECT session_id, name, client_card, client_name, type_paiement, total, state
+              FROM pos_caisse_commande_historique
+             WHERE session_id = ANY(%s)
+             ORDER BY session_id, date, id
+        """, (session_ids,))
+        for session_id, name, card, client, type_paiement, total, state in cr.fetchall():
+            rapport = rapports[session_id]
+            ligne = {
+                'name': name,
+                'client_card': card or '',
+                'client_name': client or '',
+                'type_paiement': libelles.get(type_paiement, type_paiement),
+                'total': total or 0.0,
+            }
+            rapport['commandes'].append(ligne)
+            if state == 'annule':
+                continue
+            rapport['nb_commandes'] += 1
+            if type_paiement == 'bp':
+                rapport['nb_bp'] += 1
+                rapport['total_bp'] += ligne['total']
+                rapport['commandes_bp'].append(ligne)
+            else:
+                rapport['nb_cash'] += 1
+                rapport['total_cash'] += ligne['total']
+
+        # Quantités et poids par type de pain
+        cr.execute("""
+            SELECT c.session_id, tp.name, SUM(l.quantite), SUM(l.poids_total), SUM(l.sous_total)
+              FROM pos_caisse_commande_line_historique l
+              JOIN pos_caisse_commande_historique c ON c.id = l.commande_id
+              JOIN pos_caisse_type_pain tp ON tp.id = l.type_pain_id
+             WHERE c.session_id = ANY(%s) AND c.state != 'annule'
+             GROUP BY c.session_id, tp.name
+             ORDER BY c.session_id, tp.name
+        """, (session_ids,))
+        for session_id, pain, quantite, poids, montant in cr.fetchall():
+            rapports[session_id]['pains'].append({
+                'name': pain,
+                'quantite': int(quantite or 0),
+                'poids': poids or 0.0,
+                'montant': montant or 0.0,
+            })
+
+        # Sous-totaux par vendeur/client
+        cr.execute("""
+            SELECT c.session_id, COALESCE(v.name, c.client_name), COALESCE(v.carte_numero, c.client_card),
+                   COUNT(*), SUM(c.total), COALESCE(SUM(c.total) FILTER (WHERE c.type_paiement = 'bp'), 0)
+              FROM pos_caisse_commande_historique c
+              LEFT JOIN pos_caisse_vendeur v ON v.id = c.vendeur_id
+             WHERE c.session_id = ANY(%s) AND c.state != 'annule'
+             GROUP BY c.session_id, 2, 3
+             ORDER BY c.session_id, SUM(c.total) DESC
+        """, (session_ids,))
+        for session_id, nom, carte, nb, total, total_bp in cr.fetchall():
+            rapports[session_id]['vendeurs'].append({
+                'name': nom or '',
+                'carte': carte or '',
+                'nb_commandes': nb,
+                'total': total or 0.0,
+                'total_bp': total_bp or 0.0,
+            })
+
+        # Sorties de caisse
+        cr.execute("""
+            SELECT session_id, date, motif, montant
+              FROM pos_caisse_mouvement_historique
+             WHERE session_id = ANY(%s) AND type = 'sortie'
+             ORDER BY session_id, date, id
+        """, (session_ids,))
+        for session_id, date, motif, montant in cr.fetchall():
+            rapport = rapports[session_id]
+            rapport['sorties'].append({'date': date, 'motif': motif, 'montant': montant or 0.0})
+            rapport['total_sorties'] += montant or 0.0
+
+        soldes = self.env['pos.caisse.mouvement']._get_derniers_soldes(session_ids)
+        for session_id, solde in soldes.items():
+            rapports[session_id]['montant_en_caisse'] = solde['solde']
+        return rapports
@@ -0,0 +1,118 @@
+from odoo import models, fields, api, tools
+
+
+class PosRapprochement(models.AbstractModel):
+    """Rapprochement farine / pains vendus à partir des paramètres de sac
+    (pos_caisse.prix_sac, pos_caisse.quantite_pain_par_sac, pos_caisse.prix_pain)."""
+    _name = 'pos.caisse.rapprochement'
+    _description = 'Rapprochement farine / ventes'
+
+    @api.model
+    def _get_parametres(self):
+        Param = self.env['ir.config_parameter'].sudo()
+        return {
+            'prix_sac': float(Param.get_param('pos_caisse.prix_sac', 0) or 0),
+            'quantite_pain_par_sac': float(Param.get_param('pos_caisse.quantite_pain_par_sac', 0) or 0),
+            'prix_pain': float(Param.get_param('pos_caisse.prix_pain', 0) or 0),
+        }
+
+    @api.model
+    def _agreger(self, session_ids):
+        """{session_id: (pains_vendus, poids_total, montant_ventes, sacs_utilises)} en une requête"""
+        if not session_ids:
+            return {}
+        self.env['pos.caisse.commande.line'].flush(['commande_id', 'quantite', 'poids_total', 'sous_total'])
+        self.env['pos.caisse.commande'].flush(['session_id', 'state'])
+        self.env['pos.caisse.session'].flush(['sacs_utilises'])
+        self.env.cr.execute("""
+            SELECT s.id, COALESCE(SUM(l.quantite), 0), COALESCE(SUM(l.poids_total), 0),
+                   COALESCE(SUM(l.sous_total), 0), s.sacs_utilises
+              FROM pos_caisse_session s
+              LEFT JOIN pos_caisse_commande_historique c ON c.session_id = s.id AND c.state != 'annule'
+              LEFT JOIN pos_caisse_commande_line_historique l ON l.commande_id = c.id
+             WHERE s.id = ANY(%s)
+             GROUP BY s.id
+        """, (list(session_ids),))
+        return {row[0]: row[1:] for row in self.env.cr.fetchall()}
+
+    @api.model
+    def _calculer(self, pains_vendus, poids_total, montant_ventes, sacs_utilises, parametres):
+        """Indicateurs du rapprochement pour des totaux de vente et une consommation de farine.
+
+        Sans consommation saisie, les sacs consommés sont ceux théoriquement nécessaires aux
+        pains vendus et l'écart n'est pas calculé.
+        """
+        par_sac = parametres['quantite_pain_par_sac']
+        sacs_theoriques = pains_vendus / par_sac if par_sac else 0.0
+        sacs = sacs_utilises or sacs_theoriques
+        pains_attendus = sacs_utilises * par_sac if sacs_utilises else None
+        return {
+            'pains_vendus': int(pains_vendus),
+            'poids_total': poids_total,
+            'montant_ventes': montant_ventes,
+            'montant_attendu': pains_vendus * parametres['prix_pain'],
+            'sacs_theoriques': sacs_theoriques,
+            'sacs_utilises': sacs_utilises or 0.0,
+            'pains_attendus': pains_attendus,
+            # Négatif: pains manquants par rapport à la farine consommée; positif: excédent
+            'ecart_pains': pains_vendus - pains_attendus if pains_attendus is not None else None,
+            'cout_farine': sacs * parametres['prix_sac'],
+            'marge_brute': montant_ventes - sacs * parametres['prix_sac'],
+        }
+
+    @api.model
+    @tools.ormcache('session_id', 'cle')
+    def _rapprochement_ferme(self, session_id, cle):
+        """Rapprochement d'une session clôturée, mis en cache.
+
+        `cle`: write_date de la session, sacs saisis et version du catalogue (prix et poids des
+        pains). Les modifications tardives des commandes d'une session clôturée, sa
+        réouverture et son archivage avancent write_date (pos.caisse.session._marquer_modifiee);
+        un changement de paramètre vide les caches (set_param).
+        """
+        parametres = self._get_parametres()
+        return self._calculer(*self._agreger([session_id])[session_id], parametres)
+
+    @api.model
+    def rapprocher_sessions(self, session_ids):
+        """{session_id: indicateurs}; les sessions clôturées sont servies depuis le cache"""
+        Session = self.env['pos.caisse.session'].sudo()
+        Session.flush()
+        sessions = Session.browse(session_ids).exists()
+        fermees = sessions.filtered(lambda s: s.state == 'ferme')
+        version = self.env['pos.caisse.type.pain']._get_catalogue_version() if fermees else None
+        resultats, ouvertes = {}, []
+        for session in sessions:
+            if session in fermees:
+                cle = (fields.Datetime.to_string(session.write_date), session.sacs_utilises, version)
+                resultats[session.id] = dict(self._rapprochement_ferme(session.id, cle))
+            else:
+                ouvertes.append(session.id)
+        if ouvertes:
+            parametres = self._get_parametres()
+            for session_id, agregat in self._agreger(ouvertes).items():
+                resultats[session_id] = self._calculer(*agregat, parametres)
+        return resultats
+
+    @api.model
+    def rapprocher_periode(self, date_from, date_to, user_id=None):
+        """Rapprochement cumulé des sessions ouvertes entre deux dates (incluses).
+
+        L'écart n'est calculé que si la consommation est saisie sur toutes les sessions avec ventes.
+        """
+        domain = [('date', '>=', f'{date_from} 00:00:00'), ('date', '<=', f'{date_to} 23:59:59')]
+        if user_id:
+            domain.append(('user_id', '=', user_id))
+        session_ids = self.env['pos.caisse.session'].sudo().search(domain).ids
+        par_session = self.rapprocher_sessions(session_ids)
+        cumul = [0.0, 0.0, 0.0]
+        sacs_utilises, sacs_saisis = 0.0, True
+        for resultat in par_session.values():
+            cumul[0] += resultat['pains_vendus']
+            cumul[1] += resultat['poids_total']
+            cumul[2] += resultat['montant_ventes']
+            sacs_utilises += resultat['sacs_utilises']
+            sacs_saisis = sacs_saisis and bool(resultat['sacs_utilises'] or not resultat['pains_vendus'])
+        total = self._calculer(*cumul, sacs_utilises if sacs_saisis else 0.0, self._get_parametres())
+        total['nb_sessions'] = len(par_session)
+        return {'total': total, 'sessions': par_session}
@@ -0,0 +1,403 @@
+from collections import defaultdict
+from datetime import timedelta
+
+import pytz
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api
+
+# États de commande comptabilisés dans les statistiques de vente
+ETATS_VENTE = ('confirme', 'en_attente_livraison', 'livre')
+
+
+def fuseau_jour(env):
+    """Fuseau horaire du jour de vente: paramètre pos_caisse.fuseau_horaire, sinon celui de
+    la société (jamais celui de l'utilisateur, pour que les statistiques ne dépendent pas
+    de qui enregistre la commande)"""
+    tz = env['ir.config_parameter'].sudo().get_param('pos_caisse.fuseau_horaire') or env.company.partner_id.tz
+    return tz if tz in pytz.all_timezones_set else 'UTC'
+
+
+def jour_local(date, tz):
+    """Jour local d'un Datetime Odoo (UTC naïf)"""
+    return pytz.utc.localize(date).astimezone(pytz.timezone(tz)).date()
+
+
+class PosVendeurStat(models.Model):
+    _name = 'pos.caisse.vendeur.stat'
+    _description = 'Statistiques journalières par vendeur'
+    _order = 'date desc, vendeur_id'
+
+    vendeur_id = fields.Many2one('pos.caisse.vendeur', string='Vendeur', required=True, readonly=True, ondelete='cascade')
+    date = fields.Date('Jour', required=True, readonly=True)
+    nb_commandes = fields.Integer('Nombre de commandes', readonly=True)
+    montant = fields.Float('Montant des ventes', readonly=True)
+
+    _sql_constraints = [
+        ('vendeur_date_unique', 'unique(vendeur_id, date)', 'Une seule ligne de statistiques par vendeur et par jour !'),
+    ]
+
+    def init(self):
+        # Première installation: construire les statistiques à partir des commandes existantes
+        self.env.cr.execute("SELECT 1 FROM pos_caisse_vendeur_stat LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._reconstruire()
+
+    @api.model
+    def _appliquer_deltas(self, avant, apres):
+        """Reporter la différence entre deux photographies de commandes.
+
+        `avant` et `apres` sont des dicts {commande_id: etat} produits par
+        pos.caisse.commande._etat_statistiques(). Seules les commandes dans un état
+        de vente contribuent; les deltas sont cumulés par (vendeur, jour local) puis
+        appliqués en un seul upsert.
+        """
+        tz = fuseau_jour(self.env)
+        deltas = defaultdict(lambda: [0, 0.0])
+        for signe, photo in ((-1, avant), (1, apres)):
+            for etat in photo.values():
+                if etat['vendeur_id'] and etat['state'] in ETATS_VENTE:
+                    delta = deltas[(etat['vendeur_id'], jour_local(etat['date'], tz))]
+                    delta[0] += signe
+                    delta[1] += signe * etat['total']
+        deltas = {k: v for k, v in deltas.items() if v[0] or v[1]}
+        if not deltas:
+            return
+        keys = list(deltas)
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            INSERT INTO pos_caisse_vendeur_stat
+                (vendeur_id, date, nb_commandes, montant, create_uid, create_date, write_uid, write_date)
+            SELECT t.vendeur_id, t.date, t.nb, t.montant, %(uid)s, %(now)s, %(uid)s, %(now)s
+              FROM unnest(%(vendeurs)s::int[], %(dates)s::date[], %(nbs)s::int[], %(montants)s::float8[])
+                   AS t(vendeur_id, date, nb, montant)
+            ON CONFLICT (vendeur_id, date) DO UPDATE
+               SET nb_commandes = pos_caisse_vendeur_stat.nb_commandes + EXCLUDED.nb_commandes,
+                   montant = pos_caisse_vendeur_stat.montant + EXCLUDED.montant,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, {
+            'uid': self.env.uid,
+            'now': now,
+            'vendeurs': [k[0] for k in keys],
+            'dates': [k[1] for k in keys],
+            'nbs': [deltas[k][0] for k in keys],
+            'montants': [deltas[k][1] for k in keys],
+        })
+        self.invalidate_cache(['nb_commandes', 'montant'])
+        self.env['pos.caisse.vendeur'].invalidate_cache(
+            ['total_commandes', 'total_ventes', 'commission_totale'], list({k[0] for k in keys})
+        )
+
+    @api.model
+    def _get_totaux(self, vendeur_ids, date_from=None, date_to=None):
+        """{vendeur_id: (nb_commandes, montant)} sur la période, en un agrégat indexé"""
+        if not vendeur_ids:
+            return {}
+        query = """
+            SELECT vendeur_id, SUM(nb_commandes), SUM(montant)
+              FROM pos_caisse_vendeur_stat
+             WHERE vendeur_id = ANY(%s)
+        """
+        params = [list(vendeur_ids)]
+        if date_from:
+            query += " AND date >= %s"
+            params.append(date_from)
+        if date_to:
+            query += " AND date <= %s"
+            params.append(date_to)
+        query += " GROUP BY vendeur_id"
+        self.env.cr.execute(query, params)
+        return {vid: (int(nb or 0), montant or 0.0) for vid, nb, montant in self.env.cr.fetchall()}
+
+    @api.model
+    def _reconstruire(self):
+        """Reconstruire toutes les statistiques en une passe SQL groupée (jours locaux, voir fuseau_jour)"""
+        self.env['pos.caisse.commande'].flush(['vendeur_id', 'date', 'state', 'total'])
+        now = fields.Datetime.now()
+        self.env.cr.execute("DELETE FROM pos_caisse_vendeur_stat")
+        self.env.cr.execute("""
+            INSERT INTO pos_caisse_vendeur_stat
+                (vendeur_id, date, nb_commandes, montant, create_uid, create_date, write_uid, write_date)
+            SELECT vendeur_id, (date AT TIME ZONE 'UTC' AT TIME ZONE %(tz)s)::date, COUNT(*), COALESCE(SUM(total), 0),
+                   %(uid)s, %(now)s, %(uid)s, %(now)s
+              FROM pos_caisse_commande_historique
+             WHERE vendeur_id IS NOT NULL AND state IN %(etats)s
+             GROUP BY 1, 2
+        """, {'uid': self.env.uid, 'now': now, 'etats': ETATS_VENTE, 'tz': fuseau_jour(self.env)})
+        self.invalidate_cache()
+        return True
+
+
+class PosSessionDelta(models.Model):
+    _name = 'pos.caisse.session.delta'
+    _description = 'Delta des totaux de session'
+    _order = 'id'
+
+    session_id = fields.Many2one('pos.caisse.session', string='Session', required=True, readonly=True, index=True, ondelete='cascade')
+    nb_commandes = fields.Integer('Nombre de commandes', readonly=True)
+    montant = fields.Float('Montant', readonly=True)
+    montant_bp = fields.Float('Montant BP', readonly=True)
+
+    @api.model
+    def _appliquer_deltas(self, avant, apres):
+        """Ajouter une ligne de delta par session touchée (INSERT seul, sans verrou sur la session).
+
+        Toute commande compte dans les totaux de sa session, quel que soit son état
+        (définition d'origine des totaux du dashboard).
+        """
+        deltas = defaultdict(lambda: [0, 0.0, 0.0])
+        for signe, photo in ((-1, avant), (1, apres)):
+            for etat in photo.values():
+                if etat['session_id']:
+                    delta = deltas[etat['session_id']]
+                    delta[0] += signe
+                    delta[1] += signe * etat['total']
+                    if etat['type_paiement'] == 'bp':
+                        delta[2] += signe * etat['total']
+        deltas = {k: v for k, v in deltas.items() if any(v)}
+        if not deltas:
+            return
+        session_ids = list(deltas)
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            INSERT INTO pos_caisse_session_delta
+                (session_id, nb_commandes, montant, montant_bp, create_uid, create_date, write_uid, write_date)
+            SELECT t.session_id, t.nb, t.montant, t.montant_bp, %(uid)s, %(now)s, %(uid)s, %(now)s
+              FROM unnest(%(sessions)s::int[], %(nbs)s::int[], %(montants)s::float8[], %(bps)s::float8[])
+                   AS t(session_id, nb, montant, montant_bp)
+        """, {
+            'uid': self.env.uid,
+            'now': now,
+            'sessions': session_ids,
+            'nbs': [deltas[k][0] for k in session_ids],
+            'montants': [deltas[k][1] for k in session_ids],
+            'bps': [deltas[k][2] for k in session_ids],
+        })
+        self.env['pos.caisse.session'].invalidate_cache(
+            ['total_commandes', 'total_montant', 'total_bp'], session_ids
+        )
+
+    @api.model
+    def _get_totaux(self, session_ids):
+        """{session_id: (nb_commandes, montant, montant_bp)}: totaux consolidés + deltas en attente"""
+        if not session_ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT s.id,
+                   COALESCE(s.total_commandes_consolide, 0) + COALESCE(d.nb, 0),
+                   COALESCE(s.total_montant_consolide, 0) + COALESCE(d.montant, 0),
+                   COALESCE(s.total_bp_consolide, 0) + COALESCE(d.montant_bp, 0)
+              FROM pos_caisse_session s
+              LEFT JOIN (
+                    SELECT session_id, SUM(nb_commandes) AS nb, SUM(montant) AS montant, SUM(montant_bp) AS montant_bp
+                      FROM pos_caisse_session_delta
+                     WHERE session_id = ANY(%(ids)s)
+                     GROUP BY session_id
+                   ) d ON d.session_id = s.id
+             WHERE s.id = ANY(%(ids)s)
+        """, {'ids': list(session_ids)})
+        return {sid: (int(nb), montant, bp) for sid, nb, montant, bp in self.env.cr.fetchall()}
+
+    @api.model
+    def _consolider(self, session_ids=None, limit=50000):
+        """Replier les deltas dans les totaux consolidés des sessions.
+
+        Seul ce repli met à jour la ligne de session; les lignes de delta verrouillées par un
+        autre repli concurrent sont ignorées (SKIP LOCKED) et traitées au passage suivant.
+        """
+        self.flush()
+        where = "WHERE session_id = ANY(%(ids)s)" if session_ids else ""
+        self.env.cr.execute("""
+            WITH d AS (
+                DELETE FROM pos_caisse_session_delta
+                 WHERE id IN (SELECT id FROM pos_caisse_session_delta
+                               """ + where + """
+                               ORDER BY id LIMIT %(limit)s FOR UPDATE SKIP LOCKED)
+             RETURNING session_id, nb_commandes, montant, montant_bp
+            ), agg AS (
+                SELECT session_id, SUM(nb_commandes) AS nb, SUM(montant) AS montant, SUM(montant_bp) AS montant_bp
+                  FROM d GROUP BY session_id
+            )
+            UPDATE pos_caisse_session s
+               SET total_commandes_consolide = COALESCE(s.total_commandes_consolide, 0) + agg.nb,
+                   total_montant_consolide = COALESCE(s.total_montant_consolide, 0) + agg.montant,
+                   total_bp_consolide = COALESCE(s.total_bp_consolide, 0) + agg.montant_bp
+              FROM agg
+             WHERE s.id = agg.session_id
+        """, {'ids': list(session_ids or []), 'limit': limit})
+        self.env['pos.caisse.session'].invalidate_cache(
+            ['total_commandes_consolide', 'total_montant_consolide', 'total_bp_consolide']
+        )
+        return True
+
+    @api.model
+    def _cron_consolider(self):
+        self._consolider()
+
+    @api.model
+    def _reconstruire(self, session_ids=None):
+        """Recalculer les totaux consolidés depuis les commandes (une passe groupée)"""
+        self.env['pos.caisse.commande'].flush(['session_id', 'state', 'type_paiement', 'total'])
+        where = "WHERE s.id = ANY(%(ids)s)" if session_ids else ""
+        self.env.cr.execute(
+            "DELETE FROM pos_caisse_session_delta" + (" WHERE session_id = ANY(%(ids)s)" if session_ids else ""),
+            {'ids': list(session_ids or [])},
+        )
+        self.env.cr.execute("""
+            UPDATE pos_caisse_session s
+               SET total_commandes_consolide = agg.nb,
+                   total_montant_consolide = agg.montant,
+                   total_bp_consolide = agg.montant_bp
+              FROM (
+                    SELECT s.id AS session_id,
+                           COUNT(c.id) AS nb,
+                           COALESCE(SUM(c.total), 0) AS montant,
+                           COALESCE(SUM(c.total) FILTER (WHERE c.type_paiement = 'bp'), 0) AS montant_bp
+                      FROM pos_caisse_session s
+                      LEFT JOIN pos_caisse_commande_historique c ON c.session_id = s.id
+                     """ + where + """
+                     GROUP BY s.id
+                   ) agg
+             WHERE s.id = agg.session_id
+        """, {'ids': list(session_ids or [])})
+        self.env['pos.caisse.session'].invalidate_cache()
+        return True
+
+
+class PosVenteJour(models.Model):
+    """Cube des ventes: jour × type de pain × vendeur × type de paiement × VC.
+
+    Rafraîchi par une tâche planifiée qui ne recalcule que les jours marqués depuis son
+    dernier passage (pos.caisse.vente.jour.marque); lu par les vues pivot/graphe et l'API.
+    Une commande à plusieurs types de pain a une ligne par type: le cube ne porte que des
+    mesures additives (quantité, poids, montant), pas de nombre de commandes.
+    """
+    _name = 'pos.caisse.vente.jour'
+    _description = 'Ventes journalières'
+    _order = 'date desc, type_pain_id, vendeur_id'
+
+    date = fields.Date('Jour', required=True, readonly=True, index=True)
+    type_pain_id = fields.Many2one('pos.caisse.type.pain', string='Type de pain', readonly=True, ondelete='cascade')
+    vendeur_id = fields.Many2one('pos.caisse.vendeur', string='Vendeur', readonly=True, ondelete='cascade')
+    type_paiement = fields.Selection([
+        ('cash', 'Cash'),
+        ('bp', 'BP (Fin de mois)')
+    ], string='Type de paiement', readonly=True)
+    is_vc = fields.Boolean('Vente cash (VC)', readonly=True)
+    quantite = fields.Integer('Quantité', readonly=True)
+    poids = fields.Float('Poids (g)', readonly=True)
+    montant = fields.Float('Montant', readonly=True)
+
+    def init(self):
+        self.env.cr.execute("SELECT 1 FROM pos_caisse_vente_jour LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._reconstruire()
+
+    @api.model
+    def _marquer(self, avant, apres):
+        """Marquer les jours (locaux) des commandes vendues dans l'une des deux photographies"""
+        tz = fuseau_jour(self.env)
+        jours = {
+            jour_local(etat['date'], tz)
+            for photo in (avant, apres) for etat in photo.values()
+            if etat['state'] in ETATS_VENTE
+        }
+        if jours:
+            self.env['pos.caisse.vente.jour.marque']._marquer(jours)
+
+    @api.model
+    def _recalculer_jours(self, jours):
+        """Remplacer les lignes du cube des `jours` (locaux, voir fuseau_jour) par une agrégation des commandes"""
+        jours = sorted(jours)
+        if not jours:
+            return
+        now = fields.Datetime.now()
+        self.env.cr.execute("DELETE FROM pos_caisse_vente_jour WHERE date = ANY(%s)", (jours,))
+        self.env.cr.execute("""
+            INSERT INTO pos_caisse_vente_jour
+                (date, type_pain_id, vendeur_id, type_paiement, is_vc, quantite, poids, montant,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT j.jour, l.type_pain_id, c.vendeur_id, c.type_paiement, COALESCE(c.is_vc, false),
+                   SUM(l.quantite), SUM(l.poids_total), SUM(l.sous_total),
+                   %(uid)s, %(now)s, %(uid)s, %(now)s
+              FROM unnest(%(jours)s::date[]) AS j(jour)
+              JOIN pos_caisse_commande_historique c
+                ON c.date >= (j.jour::timestamp AT TIME ZONE %(tz)s) AT TIME ZONE 'UTC'
+               AND c.date < ((j.jour + 1)::timestamp AT TIME ZONE %(tz)s) AT TIME ZONE 'UTC'
+              JOIN pos_caisse_commande_line_historique l ON l.commande_id = c.id
+             WHERE c.state IN %(etats)s
+             GROUP BY j.jour, l.type_pain_id, c.vendeur_id, c.type_paiement, COALESCE(c.is_vc, false)
+        """, {'jours': jours, 'etats': ETATS_VENTE, 'uid': self.env.uid, 'now': now, 'tz': fuseau_jour(self.env)})
+        self.invalidate_cache()
+
+    @api.model
+    def _rafraichir(self, limit=366):
+        """Recalculer les jours marqués (au plus `limit` par passage). Retour: nombre de jours"""
+        self.env['pos.caisse.commande'].flush(['date', 'state', 'vendeur_id', 'type_paiement', 'is_vc'])
+        self.env['pos.caisse.commande.line'].flush(['type_pain_id', 'quantite', 'poids_total', 'sous_total'])
+        jours = self.env['pos.caisse.vente.jour.marque']._prendre(limit)
+        self._recalculer_jours(jours)
+        return len(jours)
+
+    @api.model
+    def _cron_rafraichir(self):
+        self._rafraichir()
+
+    @api.model
+    def _recalculer_mois(self, mois):
+        """Recalculer le cube d'un mois 'AAAA-MM' (clôture mensuelle), semaine par semaine"""
+        debut = fields.Date.to_date(f'{mois}-01')
+        jours = [debut + timedelta(days=i) for i in range((debut + relativedelta(months=1) - debut).days)]
+        self.env['pos.caisse.commande'].flush(['date', 'state', 'vendeur_id', 'type_paiement', 'is_vc'])
+        self.env['pos.caisse.commande.line'].flush(['type_pain_id', 'quantite', 'poids_total', 'sous_total'])
+        Job = self.env['pos.caisse.job']
+        for i in range(0, len(jours), 7):
+            self._recalculer_jours(jours[i:i + 7])
+            Job._progression(100.0 * min(i + 7, len(jours)) / len(jours))
+        return {'mois': mois, 'jours': len(jours)}
+
+    @api.model
+    def _reconstruire(self):
+        """Recalculer tout le cube (installation, changement de prix)"""
+        self.env['pos.caisse.commande'].flush(['date'])
+        self.env.cr.execute("DELETE FROM pos_caisse_vente_jour")
+        self.env.cr.execute("""
+            SELECT DISTINCT (date AT TIME ZONE 'UTC' AT TIME ZONE %s)::date
+              FROM pos_caisse_commande_historique WHERE state IN %s
+        """, (fuseau_jour(self.env), ETATS_VENTE))
+        self._recalculer_jours([row[0] for row in self.env.cr.fetchall()])
+        return True
+
+
+class PosVenteJourMarque(models.Model):
+    _name = 'pos.caisse.vente.jour.marque'
+    _description = 'Jour de vente à recalculer'
+    _order = 'date'
+
+    date = fields.Date('Jour', required=True, readonly=True)
+
+    _sql_constraints = [
+        ('date_unique', 'unique(date)', 'Un jour ne peut être marqué qu\'une fois !'),
+    ]
+
+    @api.model
+    def _marquer(self, jours):
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            INSERT INTO pos_caisse_vente_jour_marque (date, create_uid, create_date, write_uid, write_date)
+            SELECT jour, %(uid)s, %(now)s, %(uid)s, %(now)s FROM unnest(%(jours)s::date[]) AS jour
+            ON CONFLICT (date) DO NOTHING
+        """, {'jours': sorted(jours), 'uid': self.env.uid, 'now': now})
+
+    @api.model
+    def _prendre(self, limit):
+        """Retirer et renvoyer jusqu'à `limit` jours marqués (ceux verrouillés par un autre
+        rafraîchissement en cours sont laissés au passage suivant)"""
+        self.env.cr.execute("""
+            DELETE FROM pos_caisse_vente_jour_marque
+             WHERE id IN (SELECT id FROM pos_caisse_vente_jour_marque
+                           ORDER BY date LIMIT %s FOR UPDATE SKIP LOCKED)
+         RETURNING date
+        """, (limit,))
+        return [row[0] for row in self.env.cr.fetchall()]
@@ -0,0 +1,277 @@
+import base64
+import json
+from collections import defaultdict
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.tools.sql import create_index
+
+
+def _colonne_sync_txid(cr, table):
+    """Colonne sync_txid (transaction de la dernière écriture) et son index (sync_txid, id)"""
+    cr.execute("ALTER TABLE %s ADD COLUMN IF NOT EXISTS sync_txid bigint NOT NULL DEFAULT 0" % table)
+    create_index(cr, '%s_sync_txid_idx' % table, table, ['sync_txid', 'id'])
+
+
+class PosSyncMixin(models.AbstractModel):
+    """Modèles exposés au flux de synchronisation mobile (/api/pos_caisse/sync/changes).
+
+    Chaque écriture (ORM ou SQL) porte l'identifiant de sa transaction dans la colonne
+    sync_txid, posée par un déclencheur. Le flux lit par (sync_txid, id) jusqu'à la plus petite
+    transaction encore ouverte (txid_snapshot_xmin): tout ce qui est en dessous est terminé,
+    aucune écriture ne peut donc plus apparaître derrière le repère, quelle que soit la durée
+    des transactions. Les suppressions laissent une trace dans pos.caisse.suppression.
+    """
+    _name = 'pos.caisse.sync.mixin'
+    _description = 'Synchronisation mobile'
+
+    def init(self):
+        super().init()
+        if self._auto and not self._abstract:
+            cr = self.env.cr
+            cr.execute("DROP INDEX IF EXISTS %s_sync_idx" % self._table)
+            _colonne_sync_txid(cr, self._table)
+            cr.execute("""
+                CREATE OR REPLACE FUNCTION pos_caisse_sync_txid() RETURNS trigger AS $$
+                BEGIN
+                    NEW.sync_txid := txid_current();
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            cr.execute("DROP TRIGGER IF EXISTS %s_sync_txid_ins ON %s" % (self._table, self._table))
+            cr.execute("DROP TRIGGER IF EXISTS %s_sync_txid_upd ON %s" % (self._table, self._table))
+            cr.execute("""
+                CREATE TRIGGER %s_sync_txid_ins BEFORE INSERT ON %s
+                   FOR EACH ROW EXECUTE PROCEDURE pos_caisse_sync_txid()
+            """ % (self._table, self._table))
+            # Une réécriture à l'identique (verrouillage du journal de caisse) n'est pas un changement
+            cr.execute("""
+                CREATE TRIGGER %s_sync_txid_upd BEFORE UPDATE ON %s
+                   FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE PROCEDURE pos_caisse_sync_txid()
+            """ % (self._table, self._table))
+
+    def unlink(self):
+        self.env['pos.caisse.suppression'].sudo()._enregistrer(self._name, self.ids)
+        return super().unlink()
+
+
+class PosSuppression(models.Model):
+    _name = 'pos.caisse.suppression'
+    _description = 'Suppression à propager aux appareils'
+    _order = 'id'
+
+    model = fields.Char('Modèle', required=True, readonly=True)
+    res_id = fields.Integer('ID supprimé', required=True, readonly=True)
+
+    def init(self):
+        _colonne_sync_txid(self.env.cr, self._table)
+
+    @api.model
+    def _enregistrer(self, model, ids):
+        if not ids:
+            return
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            INSERT INTO pos_caisse_suppression (model, res_id, sync_txid, create_uid, create_date, write_uid, write_date)
+            SELECT %(model)s, res_id, txid_current(), %(uid)s, %(now)s, %(uid)s, %(now)s
+              FROM unnest(%(ids)s::int[]) AS res_id
+        """, {'model': model, 'ids': list(ids), 'uid': self.env.uid, 'now': now})
+
+    @api.model
+    def _get_retention(self):
+        """Durée de conservation des suppressions (paramètre pos_caisse.sync_retention_jours)"""
+        jours = self.env['ir.config_parameter'].sudo().get_param('pos_caisse.sync_retention_jours', 30)
+        return timedelta(days=float(jours))
+
+    @api.model
+    def _cron_purger(self):
+        """Supprimer les traces plus anciennes que la rétention: un appareil dont le repère est
+        plus ancien doit refaire une synchronisation complète"""
+        self.env.cr.execute(
+            "DELETE FROM pos_caisse_suppression WHERE create_date < %s",
+            (fields.Datetime.now() - self._get_retention(),),
+        )
+
+
+# Version du repère: 2 = positions (sync_txid, id); un repère plus ancien impose une resynchronisation
+VERSION_REPERE = 2
+
+
+class PosSync(models.AbstractModel):
+    _name = 'pos.caisse.sync'
+    _description = 'Flux de changements pour les appareils'
+
+    # Entités du flux: clé -> (modèle, champs)
+    ENTITES = {
+        'vendeurs': ('pos.caisse.vendeur', ['name', 'carte_numero', 'telephone', 'pourcentage_commission', 'active']),
+        'types_pain': ('pos.caisse.type.pain', ['name', 'prix', 'poids', 'description', 'active']),
+        'sessions': ('pos.caisse.session', ['name', 'date', 'date_cloture', 'user_id', 'state']),
+        'commandes': ('pos.caisse.commande', [
+            'name', 'session_id', 'date', 'vendeur_id', 'client_card', 'client_name', 'type_paiement',
+            'is_vc', 'total', 'state', 'paiement_state', 'mouvement_id', 'idempotency_key',
+        ]),
+        'mouvements': ('pos.caisse.mouvement', ['session_id', 'date', 'type', 'montant', 'motif', 'commande_id', 'user_id', 'solde']),
+    }
+    CHAMPS_LIGNES = ['commande_id', 'type_pain_id', 'quantite', 'prix_unitaire', 'poids_total', 'sous_total']
+
+    @api.model
+    def _encoder_repere(self, etat):
+        return base64.urlsafe_b64encode(json.dumps(etat, separators=(',', ':')).encode()).decode()
+
+    @api.model
+    def _decoder_repere(self, repere):
+        etat = json.loads(base64.urlsafe_b64decode(repere.encode()).decode())
+        if etat.get('v') not in (1, VERSION_REPERE):
+            raise ValueError("Repère de synchronisation invalide")
+        return etat
+
+    @api.model
+    def _lire_depuis(self, Model, domain, depuis, borne, limit):
+        """[(id, sync_txid)] des enregistrements de `domain` écrits après `depuis` (sync_txid, id)
+        par une transaction terminée (sync_txid < borne), dans l'ordre (sync_txid, id)"""
+        Model.flush()
+        table = Model._table
+        query = Model._where_calc(domain)
+        query.add_where('"%s".sync_txid < %%s' % table, [borne])
+        if depuis:
+            query.add_where('("%s".sync_txid, "%s".id) > (%%s, %%s)' % (table, table), list(depuis))
+        query.order = '"%s".sync_txid, "%s".id' % (table, table)
+        query.limit = limit
+        self.env.cr.execute(*query.select('"%s".id' % table, '"%s".sync_txid' % table))
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _changements(self, repere=None, limit=500, domaines=None):
+        """Changements depuis `repere` (None: synchronisation complète).
+
+        Chaque entité est lue par (sync_txid, id) > repère de l'entité, jusqu'à `limit`
+        enregistrements, et seulement pour les transactions terminées: une écriture d'une
+        transaction encore ouverte (même longue) est renvoyée après sa validation, jamais sautée.
+        Le flux prend donc le retard de la plus ancienne transaction ouverte de la base.
+        `domaines` restreint certaines entités (droits de l'appareil).
+
+        Retour: {changes: {entite: [valeurs]}, suppressions: {entite: [ids]},
+                 repere, has_more, reset}
+        """
+        domaines = domaines or {}
+        Suppression = self.env['pos.caisse.suppression'].sudo()
+        now = fields.Datetime.now()
+        reset = {'changes': {}, 'suppressions': {}, 'repere': None, 'has_more': False, 'reset': True}
+
+        etat = self._decoder_repere(repere) if repere else None
+        if etat and etat['v'] != VERSION_REPERE:
+            return reset
+        if etat and fields.Datetime.to_datetime(etat['d']) < now - Suppression._get_retention():
+            # Des suppressions ont pu être purgées depuis ce repère
+            return reset
+
+        # Plus petite transaction encore ouverte: tout ce qui est en dessous est validé ou annulé
+        self.env.cr.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        borne = self.env.cr.fetchone()[0]
+
+        reperes = dict(etat['m']) if etat else {}
+        changes = {}
+        has_more = False
+        for cle, (model, champs) in self.ENTITES.items():
+            Model = self.env[model].sudo().with_context(active_test=False)
+            rows = self._lire_depuis(Model, list(domaines.get(cle, [])), reperes.get(cle), borne, limit)
+            has_more = has_more or len(rows) == limit
+            changes[cle] = Model.browse([row[0] for row in rows]).read(champs + ['write_date'], load=None)
+            if rows:
+                reperes[cle] = list(rows[-1][::-1])
+
+        # Lignes des commandes modifiées, lues en une requête
+        if changes['commandes']:
+            lignes = defaultdict(list)
+            Line = self.env['pos.caisse.commande.line'].sudo()
+            for ligne in Line.search_read([('commande_id', 'in', [c['id'] for c in changes['commandes']])], self.CHAMPS_LIGNES, load=None):
+                lignes[ligne.pop('commande_id')].append(ligne)
+            for commande in changes['commandes']:
+                commande['lignes'] = lignes.get(commande['id'], [])
+
+        # Suppressions depuis le dernier repère, bornées comme les entités (synchronisation
+        # complète: aucune à rejouer, seules celles des transactions encore ouvertes suivront)
+        suppressions = defaultdict(list)
+        cles = {model: cle for cle, (model, _champs) in self.ENTITES.items()}
+        if etat:
+            position = etat['t']
+            self.env.cr.execute("""
+                SELECT id, sync_txid, model, res_id FROM pos_caisse_suppression
+                 WHERE sync_txid < %s AND (sync_txid, id) > (%s, %s)
+                 ORDER BY sync_txid, id LIMIT %s
+            """, (borne, position[0], position[1], limit))
+            rows = self.env.cr.fetchall()
+            has_more = has_more or len(rows) == limit
+            for row_id, txid, model, res_id in rows:
+                if model in cles:
+                    suppressions[cles[model]].append(res_id)
+                position = [txid, row_id]
+        else:
+            position = [borne, 0]
+
+        return {
+            'changes': changes,
+            'suppressions': dict(suppressions),
+            'repere': self._encoder_repere({
+                'v': VERSION_REPERE,
+                'd': fields.Datetime.to_string(now),
+                'm': reperes,
+                't': position,
+            }),
+            'has_more': has_more,
+            'reset': False,
+        }
+
+    @api.model
+    def _comparer(self, items, user_id=None):
+        """Comparer les commandes locales d'un appareil à celles du serveur, en une requête.
+
+        `items`: [{idempotency_key, local_id?, total?, quantite?}] où total et quantite
+        (somme des quantités des lignes) servent de somme de contrôle. Les commandes
+        archivées sont comprises (vues *_historique). Avec `user_id`, seules les commandes des
+        sessions de cet utilisateur sont prises en compte.
+
+        Retour: {trouvees, manquantes, divergentes}; une commande trouvée porte id, name,
+        state, session_id, total et quantite du serveur, une divergente y ajoute
+        total_local / quantite_local.
+        """
+        items = [it for it in items if isinstance(it, dict) and it.get('idempotency_key')]
+        if not items:
+            return {'trouvees': [], 'manquantes': [], 'divergentes': []}
+        self.env['pos.caisse.commande'].flush(['idempotency_key', 'name', 'state', 'session_id', 'total'])
+        self.env['pos.caisse.commande.line'].flush(['commande_id', 'quantite'])
+        self.env.cr.execute("""
+            WITH cles AS (
+                SELECT DISTINCT unnest(%(cles)s::varchar[]) AS cle
+            )
+            SELECT DISTINCT ON (cles.cle) cles.cle, c.id, c.name, c.state, c.session_id, c.total,
+                   (SELECT COALESCE(SUM(l.quantite), 0) FROM pos_caisse_commande_line_historique l
+                     WHERE l.commande_id = c.id)
+              FROM cles
+              JOIN pos_caisse_commande_historique c ON c.idempotency_key = cles.cle
+              JOIN pos_caisse_session s ON s.id = c.session_id
+             WHERE %(user_id)s::int IS NULL OR s.user_id = %(user_id)s
+             ORDER BY cles.cle, c.id
+        """, {'cles': [it['idempotency_key'] for it in items], 'user_id': user_id})
+        serveur = {
+            row[0]: {'id': row[1], 'name': row[2], 'state': row[3], 'session_id': row[4], 'total': row[5] or 0.0, 'quantite': row[6]}
+            for row in self.env.cr.fetchall()
+        }
+        resultat = {'trouvees': [], 'manquantes': [], 'divergentes': []}
+        for it in items:
+            cle = it['idempotency_key']
+            base = {'idempotency_key': cle, 'local_id': it.get('local_id')}
+            commande = serveur.get(cle)
+            if not commande:
+                resultat['manquantes'].append(base)
+                continue
+            base.update(commande)
+            total, quantite = it.get('total'), it.get('quantite')
+            if (total is not None and abs(float(total) - commande['total']) > 0.005) \
+                    or (quantite is not None and int(quantite) != commande['quantite']):
+                base.update(total_local=total, quantite_local=quantite)
+                resultat['divergentes'].append(base)
+            else:
+                resultat['trouvees'].append(base)
+        return resultat
@@ -0,0 +1,13 @@
+from . import test_benchmark
+from . import test_catalogue
+from . import test_confirmation
+from . import test_idempotence
+from . import test_session_delta
+from . import test_stats
+from . import test_journal
+from . import test_job
+from . import test_metrique
+from . import test_paie
+from . import test_pagination
+from . import test_rapprochement
+from . import test_sync
@@ -0,0 +1,110 @@
+import random
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+# Volumes par défaut du jeu de données de mesure
+VOLUMES_DEFAUT = {
+    'vendeurs': 50,
+    'types_pain': 8,
+    'sessions': 5,
+    'commandes_par_session': 100,
+    'lignes_par_commande': 3,
+    'mouvements_par_session': 20,
+}
+
+
+def generer_donnees(env, graine=42, **volumes):
+    """Remplir la base avec un jeu de données synthétique reproductible.
+
+    Utilisable depuis les tests ou un shell Odoo:
+        from odoo.addons.pos_caisse.tests.common import generer_donnees
+        generer_donnees(env, sessions=30, commandes_par_session=1000)
+
+    Retour: dict {vendeurs, types_pain, sessions, commandes, mouvements} de recordsets.
+    """
+    volumes = dict(VOLUMES_DEFAUT, **volumes)
+    aleatoire = random.Random(graine)
+    env = env(context=dict(env.context, tracking_disable=True))
+
+    vendeurs = env['pos.caisse.vendeur'].create([{
+        'name': f'Vendeur bench {i}',
+        'carte_numero': f'BENCH-{graine}-{i:06d}',
+        'pourcentage_commission': aleatoire.choice([20.0, 25.0, 30.0]),
+    } for i in range(volumes['vendeurs'])])
+    types_pain = env['pos.caisse.type.pain'].create([{
+        'name': f'Pain bench {graine}-{i}',
+        'prix': aleatoire.choice([250.0, 500.0, 1000.0]),
+        'poids': aleatoire.choice([100.0, 250.0, 500.0]),
+    } for i in range(volumes['types_pain'])])
+
+    debut = fields.Datetime.now() - timedelta(days=volumes['sessions'])
+    sessions = env['pos.caisse.session'].create([{
+        'name': f'Session bench {graine}-{i}',
+        'date': debut + timedelta(days=i),
+    } for i in range(volumes['sessions'])])
+
+    Commande = env['pos.caisse.commande']
+    commandes = Commande.browse()
+    mouvements = env['pos.caisse.mouvement'].browse()
+    for session in sessions:
+        vals_list = []
+        for i in range(volumes['commandes_par_session']):
+            vendeur = aleatoire.choice(vendeurs)
+            vals_list.append({
+                'session_id': session.id,
+                'date': session.date + timedelta(minutes=i),
+                'vendeur_id': vendeur.id,
+                'client_card': vendeur.carte_numero,
+                'client_name': vendeur.name,
+                'type_paiement': aleatoire.choice(['cash', 'cash', 'bp']),
+                'is_vc': aleatoire.random() < 0.1,
+                'line_ids': [(0, 0, {
+                    'type_pain_id': aleatoire.choice(types_pain).id,
+                    'quantite': aleatoire.randint(1, 20),
+                }) for _j in range(volumes['lignes_par_commande'])],
+            })
+        commandes |= Commande.create(vals_list)
+        mouvements |= env['pos.caisse.mouvement'].create([{
+            'session_id': session.id,
+            'date': session.date + timedelta(minutes=i, seconds=30),
+            'type': aleatoire.choice(['entree', 'sortie']),
+            'montant': aleatoire.randint(1, 50) * 100.0,
+            'motif': f'Mouvement bench {i}',
+        } for i in range(volumes['mouvements_par_session'])])
+    env['base'].flush()
+    return {
+        'vendeurs': vendeurs,
+        'types_pain': types_pain,
+        'sessions': sessions,
+        'commandes': commandes,
+        'mouvements': mouvements,
+    }
+
+
+class PosCaisseCase(TransactionCase):
+    """Jeu minimal des tests unitaires: un vendeur, deux types de pain, une session ouverte"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True))
+        cls.vendeur = cls.env['pos.caisse.vendeur'].create({
+            'name': 'Vendeur test',
+            'carte_numero': 'TEST-0001',
+            'pourcentage_commission': 25.0,
+        })
+        cls.pain, cls.pain_2 = cls.env['pos.caisse.type.pain'].create([
+            {'name': 'Pain test 250', 'prix': 250.0, 'poids': 100.0},
+            {'name': 'Pain test 500', 'prix': 500.0, 'poids': 250.0},
+        ])
+        cls.session = cls.env['pos.caisse.session'].create({'name': 'Session test'})
+
+    def creer_commande(self, quantite=2, type_paiement='cash', session=None, pain=None, **vals):
+        return self.env['pos.caisse.commande'].create(dict({
+            'session_id': (session or self.session).id,
+            'client_card': self.vendeur.carte_numero,
+            'type_paiement': type_paiement,
+            'line_ids': [(0, 0, {'type_pain_id': (pain or self.pain).id, 'quantite': quantite})],
+        }, **vals))
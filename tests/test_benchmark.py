@@ -0,0 +1,173 @@
+"""Mesures de performance des chemins principaux (hors suite standard).
+
+Lancement:
+    odoo-bin -d <base> -i pos_caisse --test-tags pos_caisse_benchmark --stop-after-init
+
+Chaque chemin est mesuré sur deux volumes: l'écart du nombre de requêtes SQL entre les
+deux doit rester dans BUDGET_PAR_ELEMENT (0 pour un chemin qui ne doit pas croître avec le
+volume). Ce contrôle ne dépend ni de la machine ni d'une référence enregistrée.
+
+Les mesures sont aussi comparées à tests/benchmark_baseline.json: le nombre de requêtes,
+identique d'une machine à l'autre, ne doit pas dépasser la référence de plus de
+`marge_requetes`; une mesure sans référence échoue (l'enregistrer et la valider avec le
+code). La durée dépend de la machine: contrôlée seulement sur demande. Variables d'environnement:
+    POS_CAISSE_BENCHMARK_VOLUMES='{"sessions": 20, "commandes_par_session": 500}'
+    POS_CAISSE_BENCHMARK_ENREGISTRER=1   # réécrit la référence avec les mesures courantes
+    POS_CAISSE_BENCHMARK_TEMPS=1         # contrôle aussi la durée (machine de référence)
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from odoo.tests.common import TransactionCase, tagged
+
+from .common import generer_donnees
+
+_logger = logging.getLogger(__name__)
+
+FICHIER_REFERENCE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+
+# Requêtes SQL supplémentaires tolérées par élément ajouté (commande, session, vendeur...)
+BUDGET_PAR_ELEMENT = {
+    'creation_commandes': 8,       # insertions unitaires de l'ORM (commande, 3 lignes) et numéro
+    'confirmation_commandes': 3,   # mouvement créé par commande cash
+    'liste_commandes': 0,
+    'totaux_sessions': 0,
+    'rapport_vente': 0,
+    'statistiques_vendeurs': 0,
+}
+# Écart fixe toléré (caches ORM réchauffés entre les deux mesures)
+MARGE_REQUETES = 5
+
+
+@tagged('-standard', 'pos_caisse_benchmark')
+class TestBenchmark(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        volumes = json.loads(os.environ.get('POS_CAISSE_BENCHMARK_VOLUMES') or '{}')
+        cls.donnees = generer_donnees(cls.env, **volumes)
+        with open(FICHIER_REFERENCE) as fichier:
+            cls.reference = json.load(fichier)
+        cls.mesures = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.environ.get('POS_CAISSE_BENCHMARK_ENREGISTRER'):
+            reference = dict(cls.reference, mesures=dict(cls.reference.get('mesures', {}), **cls.mesures))
+            with open(FICHIER_REFERENCE, 'w') as fichier:
+                json.dump(reference, fichier, indent=2, sort_keys=True)
+                fichier.write('\n')
+        _logger.info("Mesures pos_caisse: %s", json.dumps(cls.mesures, sort_keys=True))
+        super().tearDownClass()
+
+    @contextmanager
+    def mesurer(self, nom):
+        """Mesurer le bloc (requêtes SQL, durée) et le comparer à la référence"""
+        self.env['base'].flush()
+        self.env['base'].invalidate_cache()
+        requetes = self.cr.sql_log_count
+        debut = time.perf_counter()
+        yield
+        self.env['base'].flush()
+        mesure = {
+            'requetes': self.cr.sql_log_count - requetes,
+            'secondes': round(time.perf_counter() - debut, 4),
+        }
+        self.mesures[nom] = mesure
+        reference = self.reference.get('mesures', {}).get(nom)
+        if os.environ.get('POS_CAISSE_BENCHMARK_ENREGISTRER'):
+            return
+        self.assertTrue(reference, (
+            f"{nom}: pas de référence dans {FICHIER_REFERENCE}; l'enregistrer avec "
+            "POS_CAISSE_BENCHMARK_ENREGISTRER=1 (volumes par défaut) et la valider avec le code"
+        ))
+        self.assertLessEqual(
+            mesure['requetes'], reference['requetes'] + self.reference.get('marge_requetes', 0),
+            f"{nom}: {mesure['requetes']} requêtes (référence {reference['requetes']})",
+        )
+        if os.environ.get('POS_CAISSE_BENCHMARK_TEMPS'):
+            self.assertLessEqual(
+                mesure['secondes'], reference['secondes'] * self.reference.get('seuil_temps', 2.0),
+                f"{nom}: {mesure['secondes']} s (référence {reference['secondes']} s)",
+            )
+
+    def mesurer_echelle(self, nom, preparer, executer, tailles):
+        """Mesurer executer(preparer(taille)) pour deux tailles et borner la croissance.
+
+        Une première exécution non mesurée réchauffe les caches de l'ORM, pour que l'écart
+        ne reflète que le volume traité.
+        """
+        petit, grand = tailles
+        executer(preparer(petit))
+        requetes = {}
+        for taille in tailles:
+            donnees = preparer(taille)
+            with self.mesurer(f'{nom}_{taille}'):
+                executer(donnees)
+            requetes[taille] = self.mesures[f'{nom}_{taille}']['requetes']
+        autorise = BUDGET_PAR_ELEMENT[nom] * (grand - petit) + MARGE_REQUETES
+        self.assertLessEqual(
+            requetes[grand] - requetes[petit], autorise,
+            f"{nom}: {requetes[petit]} requêtes pour {petit} élément(s), {requetes[grand]} pour {grand}",
+        )
+
+    def _vals_commandes(self, nombre):
+        session = self.donnees['sessions'][-1]
+        vendeurs = self.donnees['vendeurs']
+        types_pain = self.donnees['types_pain']
+        return [{
+            'session_id': session.id,
+            'client_card': vendeurs[i % len(vendeurs)].carte_numero,
+            'type_paiement': 'cash' if i % 3 else 'bp',
+            'line_ids': [(0, 0, {'type_pain_id': types_pain[j % len(types_pain)].id, 'quantite': 2}) for j in range(3)],
+        } for i in range(nombre)]
+
+    def test_creation_commandes(self):
+        self.mesurer_echelle(
+            'creation_commandes', self._vals_commandes,
+            self.env['pos.caisse.commande'].create, (25, 50),
+        )
+
+    def test_confirmation_commandes(self):
+        self.mesurer_echelle(
+            'confirmation_commandes',
+            lambda taille: self.env['pos.caisse.commande'].create(self._vals_commandes(taille)),
+            lambda commandes: commandes.action_confirmer(), (25, 50),
+        )
+
+    def test_liste_commandes(self):
+        from odoo.addons.pos_caisse.controllers.main import CHAMPS_LISTE_DEFAUT
+        Commande = self.env['pos.caisse.commande']
+        self.mesurer_echelle(
+            'liste_commandes',
+            lambda taille: Commande.search([], limit=taille, order='date desc, id desc').ids,
+            lambda ids: Commande._lire_liste(ids, CHAMPS_LISTE_DEFAUT), (50, 100),
+        )
+
+    def test_totaux_sessions(self):
+        sessions = self.donnees['sessions']
+        self.mesurer_echelle(
+            'totaux_sessions', lambda taille: sessions[:taille],
+            lambda s: s.read(['total_commandes', 'total_montant', 'total_bp', 'montant_en_caisse', 'montant_sortie']),
+            (max(len(sessions) // 2, 1), len(sessions)),
+        )
+
+    def test_rapport_vente(self):
+        sessions = self.donnees['sessions']
+        rapport = self.env.ref('pos_caisse.action_rapport_vente_session')
+        self.mesurer_echelle(
+            'rapport_vente', lambda taille: sessions[:taille].ids,
+            rapport._render_qweb_html, (max(len(sessions) // 2, 1), len(sessions)),
+        )
+
+    def test_statistiques_vendeurs(self):
+        vendeurs = self.donnees['vendeurs']
+        self.mesurer_echelle(
+            'statistiques_vendeurs', lambda taille: vendeurs[:taille],
+            lambda v: v.read(['total_commandes', 'total_ventes', 'commission_totale']),
+            (max(len(vendeurs) // 5, 1), len(vendeurs)),
+        )
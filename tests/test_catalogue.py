@@ -0,0 +1,30 @@
+from odoo.tests.common import TransactionCase, tagged
+
+from odoo.addons.pos_caisse.controllers.main import _etag_correspond
+
+
+@tagged('post_install', '-at_install')
+class TestCatalogue(TransactionCase):
+
+    def test_etag_if_none_match(self):
+        etag = '"catalogue-3-abcdef012345"'
+        self.assertTrue(_etag_correspond(etag, etag))
+        self.assertTrue(_etag_correspond('W/' + etag, etag))
+        self.assertTrue(_etag_correspond('"autre", W/' + etag, etag))
+        self.assertTrue(_etag_correspond('catalogue-3-abcdef012345', etag))
+        self.assertTrue(_etag_correspond('*', etag))
+        self.assertFalse(_etag_correspond('"catalogue-2-abcdef012345"', etag))
+        self.assertFalse(_etag_correspond(None, etag))
+
+    def test_version_sans_vider_les_caches(self):
+        Pain = self.env['pos.caisse.type.pain']
+        version = Pain._get_catalogue_version()
+        pain = Pain.create({'name': 'Pain catalogue', 'prix': 300.0, 'poids': 200.0})
+        self.assertEqual(Pain._get_catalogue_version(), version + 1)
+
+        catalogue = Pain._lire_catalogue(version + 1)
+        pain.description = 'Nouvelle recette'
+        self.assertEqual(Pain._get_catalogue_version(), version + 2)
+        # Le cache de la version précédente n'a pas été vidé (aucun clear_caches)
+        self.assertIs(Pain._lire_catalogue(version + 1), catalogue)
+        self.assertIn('Nouvelle recette', [d['description'] for d in Pain._lire_catalogue(version + 2)])
@@ -0,0 +1,54 @@
+from odoo.tests.common import tagged
+
+from .common import PosCaisseCase
+
+
+@tagged('post_install', '-at_install')
+class TestConfirmation(PosCaisseCase):
+
+    def _en_caisse(self, session):
+        self.env['base'].flush()
+        session.invalidate_cache(['montant_en_caisse'])
+        return session.montant_en_caisse
+
+    def test_confirmation_groupee(self):
+        session_2 = self.env['pos.caisse.session'].create({'name': 'Session test 2'})
+        cash = self.creer_commande(2) | self.creer_commande(1, pain=self.pain_2, session=session_2)
+        bp = self.creer_commande(3, type_paiement='bp')
+        avant = self._en_caisse(self.session), self._en_caisse(session_2)
+
+        (cash | bp).action_confirmer()
+
+        self.assertEqual(set((cash | bp).mapped('state')), {'en_attente_livraison'})
+        self.assertFalse(bp.mouvement_id)
+        for commande in cash:
+            self.assertEqual(commande.mouvement_id.commande_id, commande)
+            self.assertEqual(commande.mouvement_id.session_id, commande.session_id)
+            self.assertEqual(commande.mouvement_id.type, 'entree')
+            self.assertEqual(commande.mouvement_id.montant, commande.total)
+        self.assertEqual(self._en_caisse(self.session), avant[0] + 500.0)
+        self.assertEqual(self._en_caisse(session_2), avant[1] + 500.0)
+
+    def test_confirmation_repetee_sans_doublon(self):
+        commande = self.creer_commande(2)
+        commande.action_confirmer()
+        mouvement = commande.mouvement_id
+        commande.action_confirmer()
+        self.assertEqual(commande.mouvement_id, mouvement)
+        self.assertEqual(self.env['pos.caisse.mouvement'].search_count([('commande_id', '=', commande.id)]), 1)
+
+    def test_confirmer_ids(self):
+        Commande = self.env['pos.caisse.commande']
+        deja = self.creer_commande(1)
+        deja.action_confirmer()
+        a_confirmer = self.creer_commande(2) | self.creer_commande(2, type_paiement='bp')
+        introuvable = max(Commande.search([]).ids) + 1000
+
+        resultat = Commande.confirmer_ids(a_confirmer.ids + a_confirmer.ids[:1] + [deja.id, introuvable])
+
+        self.assertEqual(sorted(resultat['confirmees']), sorted(a_confirmer.ids))
+        self.assertEqual(resultat['ignorees'], [
+            {'id': introuvable, 'raison': 'introuvable'},
+            {'id': deja.id, 'raison': 'etat en_attente_livraison'},
+        ])
+        self.assertEqual(set(a_confirmer.mapped('state')), {'en_attente_livraison'})
@@ -0,0 +1,32 @@
+from odoo.tests.common import TransactionCase, tagged
+
+from odoo.addons.pos_caisse.models.pos_caisse_idempotence import REPONSE_CONFLIT
+
+
+@tagged('post_install', '-at_install')
+class TestIdempotence(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.Store = self.env['pos.caisse.idempotence'].sudo()
+
+    def test_reservation_puis_rejeu(self):
+        self.assertEqual(self.Store._reserver('commande', ['k1']), {})
+        # Réservée mais pas encore enregistrée: requête en cours
+        self.assertEqual(self.Store._reserver('commande', ['k1']), {'k1': None})
+        self.Store._enregistrer('commande', {'k1': {'status': 'success', 'id': 7}})
+        self.assertEqual(self.Store._reserver('commande', ['k1']), {'k1': {'status': 'success', 'id': 7}})
+        # La clé est propre à l'endpoint
+        self.assertEqual(self.Store._reserver('mouvement', ['k1']), {})
+
+    def test_liberer(self):
+        self.Store._reserver('commande', ['k2'])
+        self.Store._liberer('commande', ['k2'])
+        self.assertEqual(self.Store._reserver('commande', ['k2']), {})
+
+    def test_autre_utilisateur(self):
+        autre = self.env['res.users'].create({'name': 'Caissier 2', 'login': 'pos_caisse_caissier_2'})
+        self.Store._reserver('commande', ['k3'])
+        self.Store._enregistrer('commande', {'k3': {'status': 'success', 'id': 8}})
+        rejeu = self.Store.with_user(autre).sudo()._reserver('commande', ['k3'])
+        self.assertEqual(rejeu, {'k3': REPONSE_CONFLIT})
@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests.common import tagged
+
+from odoo.addons.pos_caisse.models.pos_caisse_job import VERROU_JOB
+
+from .common import PosCaisseCase
+
+
+@tagged('post_install', '-at_install')
+class TestJob(PosCaisseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.Job = self.env['pos.caisse.job']
+        # Tâches laissées par les données de démonstration ou d'autres tests: hors file
+        self.Job.search([('state', 'in', ('en_attente', 'en_cours'))]).write({'state': 'termine'})
+
+    def _enfiler_mois(self, mois):
+        return self.Job._enfiler('pos.caisse.vente.jour', '_recalculer_mois', arguments={'mois': mois},
+                                 cle=f'ventes_mois:{mois}')
+
+    def test_tache_avec_progression(self):
+        self.creer_commande(2).action_confirmer()
+        mois = fields.Date.today().strftime('%Y-%m')
+        job = self._enfiler_mois(mois)
+
+        # _recalculer_mois publie son avancement à chaque semaine pendant l'exécution
+        self.assertEqual(self.Job._cron_traiter(commit=False), 1)
+
+        job.invalidate_cache()
+        self.assertEqual(job.state, 'termine')
+        self.assertEqual(job.progression, 100.0)
+        donnees = job._get_data()
+        self.assertEqual(donnees['resultat']['mois'], mois)
+        self.assertIsNone(donnees['message'])
+
+    def test_dedoublonnage(self):
+        job = self._enfiler_mois('2025-01')
+        self.assertEqual(self._enfiler_mois('2025-01'), job)
+        self.assertNotEqual(self._enfiler_mois('2025-02'), job)
+
+    def test_relance_puis_echec(self):
+        job = self.Job._enfiler('pos.caisse.vente.jour', '_recalculer_mois', arguments={'mois': 'invalide'},
+                                max_tentatives=2)
+        self.Job._cron_traiter(commit=False)
+        job.invalidate_cache()
+        self.assertEqual((job.state, job.tentatives), ('en_attente', 1))
+        self.assertGreater(job.date_prevue, fields.Datetime.now())
+        self.assertTrue(job.message)
+
+        job.date_prevue = fields.Datetime.now()
+        self.Job._cron_traiter(commit=False)
+        job.invalidate_cache()
+        self.assertEqual((job.state, job.tentatives), ('echec', 2))
+
+    def _autre_worker(self, job):
+        """Second worker (connexion distincte) tenant le verrou d'exécution de `job`"""
+        cr = self.registry.cursor()
+        cr.execute("SELECT pg_advisory_lock(%s, %s)", (VERROU_JOB, job.id))
+        return cr
+
+    def test_tache_longue_non_relancee(self):
+        job = self._enfiler_mois('2025-03')
+        job.write({'state': 'en_cours', 'tentatives': 1,
+                   'date_debut': fields.Datetime.now() - timedelta(hours=3)})
+        cr = self._autre_worker(job)
+        try:
+            # Tâche longue toujours exécutée par l'autre worker: ni relancée ni reprise
+            self.assertEqual(self.Job._cron_traiter(commit=False), 0)
+            job.invalidate_cache()
+            self.assertEqual(job.state, 'en_cours')
+        finally:
+            cr.close()
+
+        # Worker arrêté: connexion fermée, verrou relâché, la tâche repart
+        self.Job._relancer_interrompues()
+        job.invalidate_cache()
+        self.assertEqual((job.state, job.message), ('en_attente', 'Exécution interrompue'))
+        self.assertEqual(self.Job._cron_traiter(commit=False), 1)
+        job.invalidate_cache()
+        self.assertEqual((job.state, job.tentatives), ('termine', 2))
+
+    def test_deux_workers(self):
+        longue = self._enfiler_mois('2025-04')
+        longue.write({'state': 'en_cours', 'tentatives': 1,
+                      'date_debut': fields.Datetime.now() - timedelta(hours=3)})
+        suivante = self._enfiler_mois('2025-05')
+        cr = self._autre_worker(longue)
+        try:
+            self.assertEqual(self.Job._cron_traiter(commit=False), 1)
+            (longue | suivante).invalidate_cache()
+            self.assertEqual(longue.state, 'en_cours')
+            self.assertEqual(suivante.state, 'termine')
+            # Le verrou de la tâche traitée est relâché en fin d'exécution
+            cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (VERROU_JOB, suivante.id))
+            self.assertTrue(cr.fetchone()[0])
+        finally:
+            cr.close()
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests.common import tagged
+
+from .common import PosCaisseCase
+
+
+@tagged('post_install', '-at_install')
+class TestJournal(PosCaisseCase):
+
+    def _mouvement(self, type_mouvement, montant, date):
+        return self.env['pos.caisse.mouvement'].create({
+            'session_id': self.session.id,
+            'type': type_mouvement,
+            'montant': montant,
+            'motif': f'Test {type_mouvement} {montant}',
+            'date': date,
+        })
+
+    def _journal(self):
+        mouvements = self.env['pos.caisse.mouvement'].search([('session_id', '=', self.session.id)], order='date, id')
+        return [(m.sequence, m.cumul_entrees, m.cumul_sorties, m.solde) for m in mouvements]
+
+    def test_ajout_et_antidate(self):
+        t0 = fields.Datetime.now() - timedelta(hours=1)
+        self._mouvement('entree', 1000.0, t0)
+        self._mouvement('sortie', 300.0, t0 + timedelta(minutes=10))
+        self.assertEqual(self._journal(), [(1, 1000.0, 0.0, 1000.0), (2, 1000.0, 300.0, 700.0)])
+
+        # Mouvement antidaté: la suite du journal est renumérotée
+        self._mouvement('entree', 500.0, t0 + timedelta(minutes=5))
+        self.assertEqual(self._journal(), [
+            (1, 1000.0, 0.0, 1000.0),
+            (2, 1500.0, 0.0, 1500.0),
+            (3, 1500.0, 300.0, 1200.0),
+        ])
+        self.session.invalidate_cache()
+        self.assertEqual(self.session.montant_en_caisse, 1200.0)
+        self.assertEqual(self.session.montant_sortie, 300.0)
+        self.assertEqual(self.session.total_mouvements, 3)
+
+    def test_modification_et_suppression(self):
+        t0 = fields.Datetime.now() - timedelta(hours=1)
+        premier = self._mouvement('entree', 1000.0, t0)
+        self._mouvement('entree', 200.0, t0 + timedelta(minutes=1))
+        self._mouvement('sortie', 100.0, t0 + timedelta(minutes=2))
+        premier.montant = 800.0
+        self.assertEqual(self._journal()[-1], (3, 1000.0, 100.0, 900.0))
+        premier.unlink()
+        self.assertEqual(self._journal(), [(1, 200.0, 0.0, 200.0), (2, 200.0, 100.0, 100.0)])
+
+    def test_solde_entre(self):
+        t0 = fields.Datetime.now() - timedelta(hours=1)
+        self._mouvement('entree', 1000.0, t0)
+        self._mouvement('sortie', 300.0, t0 + timedelta(minutes=10))
+        self._mouvement('entree', 50.0, t0 + timedelta(minutes=20))
+        periode = self.session.get_solde_entre(t0 + timedelta(minutes=5), t0 + timedelta(minutes=15))
+        self.assertEqual(periode['solde_debut'], 1000.0)
+        self.assertEqual(periode['solde_fin'], 700.0)
+        self.assertEqual(periode['sorties'], 300.0)
+        self.assertEqual(periode['nb_mouvements'], 1)
@@ -0,0 +1,18 @@
+from odoo.tests.common import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestMetrique(TransactionCase):
+
+    def test_buckets_par_borne_numerique(self):
+        Metrique = self.env['pos.caisse.metrique']
+        nom = 'pos_caisse_compute_seconds_bucket'
+        Metrique._ajouter({
+            (nom, f'le="{borne}",method="_test",model="test.tri"'): 1.0
+            for borne in ('10.0', '2.5', '+Inf', '0.5')
+        })
+        lignes = [l for l in Metrique._exposition().splitlines() if 'model="test.tri"' in l]
+        self.assertEqual(
+            [l.split('le="')[1].split('"')[0] for l in lignes],
+            ['0.5', '2.5', '10.0', '+Inf'],
+        )
@@ -0,0 +1,72 @@
+import json
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests.common import HttpCase, tagged
+
+from odoo.addons.pos_caisse.controllers.main import _decode_cursor, _encode_cursor
+
+
+@tagged('post_install', '-at_install')
+class TestPagination(HttpCase):
+
+    def setUp(self):
+        super().setUp()
+        pain = self.env['pos.caisse.type.pain'].create({'name': 'Pain pagination', 'prix': 100.0, 'poids': 100.0})
+        self.session = self.env['pos.caisse.session'].create({'name': 'Session pagination'})
+        # Dates en double: l'id départage les commandes d'une même date
+        t0 = fields.Datetime.now().replace(microsecond=0) - timedelta(hours=1)
+        self.commandes = self.env['pos.caisse.commande'].create([{
+            'session_id': self.session.id,
+            'date': t0 + timedelta(minutes=i // 3),
+            'client_card': f'PAGE-{i}',
+            'client_name': f'Client pagination {i}',
+            'type_paiement': 'cash',
+            'line_ids': [(0, 0, {'type_pain_id': pain.id, 'quantite': 1})],
+        } for i in range(10)])
+        self.authenticate('admin', 'admin')
+
+    def _lister(self, **params):
+        reponse = self.url_open(
+            '/api/pos_caisse/commandes/list',
+            data=json.dumps({'jsonrpc': '2.0', 'method': 'call', 'params': dict(params, session_id=self.session.id)}),
+            headers={'Content-Type': 'application/json'},
+        )
+        return reponse.json()['result']
+
+    def test_curseur(self):
+        date = fields.Datetime.now().replace(microsecond=0)
+        self.assertEqual(_decode_cursor(_encode_cursor(date, 42)), (fields.Datetime.to_string(date), 42))
+
+    def test_pages_par_curseur(self):
+        vus, cursor = [], None
+        while True:
+            page = self._lister(limit=4, cursor=cursor, fields=['id', 'date'])
+            self.assertEqual(page['status'], 'success')
+            vus += [ligne['id'] for ligne in page['data']]
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        attendu = self.commandes.sorted(lambda c: (c.date, c.id), reverse=True).ids
+        self.assertEqual(vus, attendu)
+
+    def test_projection_et_compte(self):
+        page = self._lister(limit=3, fields=['name', 'client_name'], with_count=True)
+        self.assertEqual(page['total'], 10)
+        self.assertEqual(page['returned'], 3)
+        self.assertEqual(set(page['data'][0]), {'name', 'client_name'})
+        self.assertEqual(self._lister(fields=['inconnu'])['status'], 'error')
+
+    def test_compte_par_defaut(self):
+        # Pagination par offset: total renvoyé comme avant l'ajout du curseur
+        page = self._lister(limit=4, offset=4, fields=['id'])
+        self.assertEqual(page['total'], 10)
+        self.assertNotIn('total', self._lister(limit=4, fields=['id'], with_count=False))
+        # Mode curseur: pas de comptage sauf demande explicite
+        cursor = page['next_cursor']
+        self.assertNotIn('total', self._lister(limit=4, cursor=cursor, fields=['id']))
+        self.assertEqual(self._lister(limit=4, cursor=cursor, fields=['id'], with_count=True)['total'], 10)
+
+    def test_recherche_client_name(self):
+        page = self._lister(search='pagination 7', fields=['client_name'])
+        self.assertEqual([ligne['client_name'] for ligne in page['data']], ['Client pagination 7'])
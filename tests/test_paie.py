@@ -0,0 +1,42 @@
+from odoo.exceptions import UserError
+from odoo.tests.common import tagged
+
+from .common import PosCaisseCase
+
+
+@tagged('post_install', '-at_install')
+class TestPaieLot(PosCaisseCase):
+
+    def _lot(self, date_from, date_to, **vals):
+        return self.env['pos.caisse.paie.lot'].create(dict({
+            'name': f'Lot {date_from}',
+            'date_from': date_from,
+            'date_to': date_to,
+            'session_id': self.session.id,
+        }, **vals))
+
+    def test_periodes_chevauchantes_refusees(self):
+        self.creer_commande(4, date='2025-01-10 10:00:00').action_confirmer()
+        janvier = self._lot('2025-01-01', '2025-01-31')
+        janvier.action_calculer()
+        self.assertEqual(janvier.state, 'calcule')
+        self.assertEqual(janvier.montant_total, 250.0)
+        # Recalcul du même lot autorisé
+        janvier.action_calculer()
+
+        with self.assertRaises(UserError):
+            self._lot('2025-01-15', '2025-02-15').action_calculer()
+        with self.assertRaises(UserError):
+            janvier.copy().action_calculer()
+
+        fevrier = self._lot('2025-02-01', '2025-02-28')
+        fevrier.action_calculer()
+        self.assertEqual(fevrier.state, 'calcule')
+        self.assertEqual(fevrier.nb_lignes, 0)
+
+    def test_lot_en_erreur_reserve_la_periode(self):
+        lot = self._lot('2025-03-01', '2025-03-31')
+        lot.action_calculer()
+        lot.write({'state': 'erreur'})
+        with self.assertRaises(UserError):
+            self._lot('2025-03-31', '2025-04-30').action_calculer()
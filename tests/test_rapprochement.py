@@ -0,0 +1,41 @@
+from odoo.tests.common import tagged
+
+from .common import PosCaisseCase
+
+
+@tagged('post_install', '-at_install')
+class TestRapprochement(PosCaisseCase):
+
+    def _pains_vendus(self):
+        return self.env['pos.caisse.rapprochement'].rapprocher_sessions(self.session.ids)[self.session.id]['pains_vendus']
+
+    def test_session_fermee_modifiee_apres_coup(self):
+        commande = self.creer_commande(2)
+        commande.action_confirmer()
+        self.session.action_close_session()
+        self.assertEqual(self._pains_vendus(), 2)
+        write_date = self.session.write_date
+
+        # Deux modifications tardives dans la même transaction: deux clés différentes
+        commande.line_ids.quantite = 5
+        self.assertGreater(self.session.write_date, write_date)
+        self.assertEqual(self._pains_vendus(), 5)
+        commande.line_ids.quantite = 7
+        self.assertEqual(self._pains_vendus(), 7)
+
+        # Changement de type de pain à total égal: la clé change aussi
+        write_date = self.session.write_date
+        self.pain_2.prix = 250.0
+        commande.line_ids.type_pain_id = self.pain_2
+        self.assertGreater(self.session.write_date, write_date)
+        rapprochement = self.env['pos.caisse.rapprochement'].rapprocher_sessions(self.session.ids)[self.session.id]
+        self.assertEqual(rapprochement['poids_total'], 7 * 250.0)
+
+    def test_reouverture(self):
+        self.creer_commande(2).action_confirmer()
+        self.session.action_close_session()
+        self.assertEqual(self._pains_vendus(), 2)
+        self.session.action_open_session()
+        self.creer_commande(3).action_confirmer()
+        self.session.action_close_session()
+        self.assertEqual(self._pains_vendus(), 5)
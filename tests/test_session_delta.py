@@ -0,0 +1,51 @@
+from odoo.tests.common import tagged
+
+from .common import PosCaisseCase
+
+
+@tagged('post_install', '-at_install')
+class TestSessionDelta(PosCaisseCase):
+
+    def _totaux(self):
+        self.session.invalidate_cache(['total_commandes', 'total_montant', 'total_bp'])
+        return self.session.total_commandes, self.session.total_montant, self.session.total_bp
+
+    def test_totaux_avant_et_apres_consolidation(self):
+        self.creer_commande(2)
+        self.creer_commande(4, type_paiement='bp')
+        self.assertEqual(self._totaux(), (2, 1500.0, 1000.0))
+
+        Delta = self.env['pos.caisse.session.delta']
+        Delta._consolider([self.session.id])
+        self.assertFalse(Delta.search([('session_id', '=', self.session.id)]))
+        self.assertEqual(self.session.total_commandes_consolide, 2)
+        self.assertEqual(self._totaux(), (2, 1500.0, 1000.0))
+
+        # Les deltas suivants s'ajoutent aux totaux consolidés
+        self.creer_commande(1, pain=self.pain_2)
+        self.assertEqual(self._totaux(), (3, 2000.0, 1000.0))
+
+    def test_commandes_annulees_comptees(self):
+        self.creer_commande(2)
+        bp = self.creer_commande(4, type_paiement='bp')
+        bp.action_annuler()
+        self.assertEqual(self._totaux(), (2, 1500.0, 1000.0))
+        self.env['pos.caisse.session.delta']._reconstruire([self.session.id])
+        self.assertEqual(self._totaux(), (2, 1500.0, 1000.0))
+        # Même définition une fois la session clôturée (photographie)
+        self.session.action_close_session()
+        self.assertEqual(self._totaux(), (2, 1500.0, 1000.0))
+
+    def test_reconstruction(self):
+        self.creer_commande(2)
+        self.creer_commande(3, type_paiement='bp')
+        attendu = self._totaux()
+        self.env['pos.caisse.session.delta']._reconstruire([self.session.id])
+        self.assertEqual(self._totaux(), attendu)
+        self.assertEqual(self.session.total_montant_consolide, attendu[1])
+
+    def test_nouvelle_session_consolidee_a_zero(self):
+        session = self.env['pos.caisse.session'].create({'name': 'Session vide'})
+        session.flush()
+        self.env.cr.execute("SELECT total_commandes_consolide FROM pos_caisse_session WHERE id = %s", (session.id,))
+        self.assertEqual(self.env.cr.fetchone()[0], 0)
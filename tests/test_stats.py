@@ -0,0 +1,35 @@
+from odoo.tests.common import tagged
+
+from .common import PosCaisseCase
+
+
+@tagged('post_install', '-at_install')
+class TestStatistiques(PosCaisseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.env['ir.config_parameter'].sudo().set_param('pos_caisse.fuseau_horaire', 'Europe/Paris')
+
+    def test_statistiques_vendeur_par_jour_local(self):
+        # 31 mai 22:30 UTC = 1er juin 00:30 à Paris: vente de juin
+        self.creer_commande(2, date='2025-05-31 22:30:00').action_confirmer()
+        Stat = self.env['pos.caisse.vendeur.stat']
+        stats = Stat.search([('vendeur_id', '=', self.vendeur.id)])
+        self.assertEqual([str(d) for d in stats.mapped('date')], ['2025-06-01'])
+        self.assertEqual(Stat._get_totaux(self.vendeur.ids, '2025-06-01', '2025-06-30'), {self.vendeur.id: (1, 500.0)})
+
+        Stat._reconstruire()
+        stats = Stat.search([('vendeur_id', '=', self.vendeur.id)])
+        self.assertEqual([(str(s.date), s.nb_commandes) for s in stats], [('2025-06-01', 1)])
+
+    def test_cube_par_jour_local(self):
+        self.creer_commande(2, date='2025-05-31 22:30:00').action_confirmer()
+        self.creer_commande(1, date='2025-05-31 21:30:00').action_confirmer()
+        Vente = self.env['pos.caisse.vente.jour']
+        Vente._rafraichir()
+        ventes = Vente.search([('vendeur_id', '=', self.vendeur.id)])
+        # 21:30 UTC = 23:30 à Paris (31 mai); 22:30 UTC = 00:30 (1er juin): même jour que les statistiques vendeur
+        self.assertEqual(sorted((str(v.date), v.quantite) for v in ventes), [('2025-05-31', 1), ('2025-06-01', 2)])
+        Vente._recalculer_mois('2025-06')
+        ventes = Vente.search([('vendeur_id', '=', self.vendeur.id), ('date', '>=', '2025-06-01')])
+        self.assertEqual([(str(v.date), v.quantite) for v in ventes], [('2025-06-01', 2)])
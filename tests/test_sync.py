@@ -0,0 +1,71 @@
+from odoo import fields
+from odoo.tests.common import tagged
+
+from .common import PosCaisseCase
+
+
+@tagged('post_install', '-at_install')
+class TestSync(PosCaisseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.Sync = self.env['pos.caisse.sync']
+        self.vendeurs = self.env['pos.caisse.vendeur'].create([
+            {'name': f'Vendeur sync {i}', 'carte_numero': f'SYNC-{i}'} for i in range(2)
+        ])
+        # Seuls ces vendeurs sont suivis: les autres entités sont vides
+        self.domaines = {cle: [('id', '=', 0)] for cle in self.Sync.ENTITES}
+        self.domaines['vendeurs'] = [('id', 'in', self.vendeurs.ids)]
+
+    def _valider(self, vendeur, txid):
+        """Simuler une écriture validée par une transaction plus ancienne que les ouvertes"""
+        vendeur.flush()
+        self.env.cr.execute("ALTER TABLE pos_caisse_vendeur DISABLE TRIGGER pos_caisse_vendeur_sync_txid_upd")
+        self.env.cr.execute("UPDATE pos_caisse_vendeur SET sync_txid = %s WHERE id = %s", (txid, vendeur.id))
+        self.env.cr.execute("ALTER TABLE pos_caisse_vendeur ENABLE TRIGGER pos_caisse_vendeur_sync_txid_upd")
+
+    def _ids(self, resultat, cle='vendeurs'):
+        return [valeurs['id'] for valeurs in resultat['changes'][cle]]
+
+    def test_transaction_ouverte_differee(self):
+        # Écritures de la transaction courante (encore ouverte): pas encore dans le flux
+        resultat = self.Sync._changements(domaines=self.domaines)
+        self.assertEqual(self._ids(resultat), [])
+        self._valider(self.vendeurs[0], 1)
+        resultat = self.Sync._changements(domaines=self.domaines)
+        self.assertEqual(self._ids(resultat), self.vendeurs[:1].ids)
+
+    def test_pages_et_modifications(self):
+        premier, second = self.vendeurs
+        self._valider(premier, 1)
+        self._valider(second, 2)
+        page = self.Sync._changements(limit=1, domaines=self.domaines)
+        self.assertEqual(self._ids(page), premier.ids)
+        self.assertTrue(page['has_more'])
+        page = self.Sync._changements(page['repere'], limit=1, domaines=self.domaines)
+        self.assertEqual(self._ids(page), second.ids)
+        page = self.Sync._changements(page['repere'], limit=1, domaines=self.domaines)
+        self.assertEqual(self._ids(page), [])
+
+        # Une écriture validée ensuite est renvoyée même si sa transaction a commencé avant
+        premier.telephone = '0102030405'
+        self.assertEqual(self._ids(self.Sync._changements(page['repere'], domaines=self.domaines)), [])
+        self._valider(premier, 3)
+        self.assertEqual(self._ids(self.Sync._changements(page['repere'], domaines=self.domaines)), premier.ids)
+
+    def test_suppressions(self):
+        commande = self.creer_commande()
+        commande_id = commande.id
+        commande.unlink()
+        repere = self.Sync._encoder_repere({'v': 2, 'd': fields.Datetime.to_string(fields.Datetime.now()), 'm': {}, 't': [0, 0]})
+        self.assertEqual(self.Sync._changements(repere, domaines=self.domaines)['suppressions'], {})
+        self.env.cr.execute("""
+            UPDATE pos_caisse_suppression SET sync_txid = 1
+             WHERE model = 'pos.caisse.commande' AND res_id = %s
+        """, (commande_id,))
+        suppressions = self.Sync._changements(repere, domaines=self.domaines)['suppressions']
+        self.assertEqual(suppressions.get('commandes'), [commande_id])
+
+    def test_ancien_repere(self):
+        ancien = self.Sync._encoder_repere({'v': 1, 'd': '2026-01-01 00:00:00', 'm': {}, 't': 0})
+        self.assertTrue(self.Sync._changements(ancien, domaines=self.domaines)['reset'])